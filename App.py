@@ -1,32 +1,45 @@
 from optimize_query_module.hugging_face_module import HuggingFaceModule
 from search_module.brave_search_engine import BraveSearchEngine
-from extraction_module.firecrawl_extractor_v3 import FirecrawlExtractor
+from extraction_module.extractors import EXTRACTOR_BACKENDS, create_extractor
+from extraction_module.hedged_extractor import HedgedExtractor
+from extraction_module.adaptive_timeout import AdaptiveTimeout
+from extraction_module.stored_extractor import StoredExtractor
 from database_module.mongoDB import MongoDB
+from database_module.results_query import ResultsQuery
+from database_module.semantic_index import SemanticIndex, INDEX_DIR
+from database_module.recrawl import IncrementalRecrawl, validators
 from classification_module.LLM_classification import OpenAI
+from classification_module.local_classifier import LocalClassifier, CascadeClassifier, LOCAL_MODEL_PATH
+from classification_module.token_budget import TokenBudget
 from utils.excel_writer import ExcelWriter
 from utils.json_writer import JsonWriter
+from utils.parquet_writer import ParquetWriter
+from utils.crawl_state import CrawlState
+from utils.cpu_stage import CpuStage
+from utils.logging_setup import setup_logging
+from utils.crawl_scheduler import CrawlScheduler
+from utils.link_graph import LinkGraph
+from utils.frontier_store import FrontierStore
+from utils.dashboard import CrawlMetrics, Dashboard
+from utils import profiler
 
 import os
 import json
+import argparse
 import time
 import logging
+import functools
+import threading
 
 from rich.console import Console
 from rich.markdown import Markdown
-from rich.prompt import Prompt, Confirm, IntPrompt
+from rich.prompt import Prompt, Confirm, IntPrompt, FloatPrompt
 from rich.text import Text
 from rich.spinner import Spinner
 from rich.panel import Panel
 from rich.rule import Rule
 
-logging.getLogger().handlers.clear()
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("search_log.log", mode='a', encoding='utf-8'), 
-    ]
-)
+logger = logging.getLogger(__name__)
 
 
 # BEGIN INTERACTION WITH USER -----------------------------------------------------------------------------------------------
@@ -45,6 +58,42 @@ max_depth_text = Text("What is the maximum depth level you want to search?")
 max_depth_text.stylize("blue")
 max_scraped_docs_text = Text("What is the maximum number of documents you want to process?")
 max_scraped_docs_text.stylize("blue")
+concurrency_text = Text("How many URLs should be processed at the same time?")
+concurrency_text.stylize("blue")
+extractor_backend_text = Text("Which extraction backend would you like to use?")
+extractor_backend_text.stylize("blue")
+hedging_text = Text("Would you like to hedge slow extractions with a second request?")
+hedging_text.stylize("blue")
+hedge_backend_text = Text("Which backend should the hedge request use?")
+hedge_backend_text.stylize("blue")
+streaming_text = Text("Would you like to stream classification and expand links as soon as the verdict arrives?")
+streaming_text.stylize("blue")
+cascade_text = Text("Would you like to classify confident documents with the local classifier before calling the LLM?")
+cascade_text.stylize("blue")
+cascade_threshold_text = Text("Minimum confidence of the local classifier (0.5 - 1.0)")
+cascade_threshold_text.stylize("blue")
+cpu_stage_text = Text("Would you like to run document post-processing in a process pool?")
+cpu_stage_text.stylize("blue")
+run_token_budget_text = Text("Maximum number of LLM tokens for the whole run (0 for no limit)")
+run_token_budget_text.stylize("blue")
+document_token_budget_text = Text("Maximum number of LLM tokens per document (0 for no limit)")
+document_token_budget_text.stylize("blue")
+normalize_text = Text("Would you like to normalize markdown (links, images, navigation, repeated lines) before classification?")
+normalize_text.stylize("blue")
+stored_documents_text = Text("Would you like to classify matching documents stored by earlier runs before searching the web?")
+stored_documents_text.stylize("blue")
+stored_count_text = Text("How many stored documents should be classified?")
+stored_count_text.stylize("blue")
+web_search_text = Text("Would you like to search the web as well?")
+web_search_text.stylize("blue")
+frontier_store_text = Text("Would you like to keep the crawl frontier on disk (for crawls with millions of links)?")
+frontier_store_text.stylize("blue")
+link_ordering_text = Text("Would you like to order the frontier by link score (PageRank personalized by Relevant pages)?")
+link_ordering_text.stylize("blue")
+incremental_text = Text("Would you like to re-crawl incrementally (reuse the stored verdicts of unchanged pages in this collection)?")
+incremental_text.stylize("blue")
+compressed_storage_text = Text("Would you like to store page contents compressed and deduplicated?")
+compressed_storage_text.stylize("blue")
 
 console = Console()
 title = Markdown(title)
@@ -52,139 +101,231 @@ title = Markdown(title)
 
 # BEGIN COMPUTING STATISTICS -----------------------------------------------------------------------------------------------
 def count_relevance(total_links):
-    relevant_count = sum(1 for data in total_links.values() if data.get("classification", None) == "Relevant")
-    irrelevant_count = sum(1 for data in total_links.values() if data.get("classification", None) == "Irrelevant")
-    error_count = sum(1 for data in total_links.values() if "ERROR" in data.get("classification", ""))
+    counts = total_links.classification_counts()
+    relevant_count = counts.get("Relevant", 0)
+    irrelevant_count = counts.get("Irrelevant", 0)
+    error_count = sum(count for classification, count in counts.items() if classification and "ERROR" in classification)
 
     # Výpis výsledků
     console.print(f"\n[bold green]Total Relevant URLs:[/] {relevant_count}")
     console.print(f"[bold magenta]Total Irrelevant URLs:[/] {irrelevant_count}")
     console.print(f"[bold red]Total ERROR URLs:[/] {error_count}")
     return relevant_count,irrelevant_count, error_count, 
+
+def show_latency_report(extractor):
+    report = extractor.latency_report()
+    if not report["requests"]:
+        return report
+    console.print(f"[bold blue]Extraction latency ({report['backend']}, {report['requests']} requests):[/] "
+                  f"mean {report['mean']:.2f}s, p50 {report['p50']:.2f}s, p95 {report['p95']:.2f}s, p99 {report['p99']:.2f}s, max {report['max']:.2f}s")
+    return report
+
+def cache_stats(classifier, database_handler):
+    """
+    :return: Dictionary name -> (hits, lookups) of the caches shown on the dashboard
+    """
+    stats = {}
+    if isinstance(classifier, CascadeClassifier):
+        report = classifier.cascade_report()
+        stats["local classifier"] = (report["local"], report["local"] + report["llm"])
+    if database_handler.compressed:
+        dedup = dict(database_handler.dedup_stats)
+        stats["page dedup"] = (dedup["deduplicated"], dedup["stored"] + dedup["deduplicated"])
+    return stats
+
+def show_hedge_report(extractor):
+    if not isinstance(extractor, HedgedExtractor):
+        return None
+    report = extractor.hedge_report()
+    console.print(f"[bold blue]Hedged requests:[/] {report['hedges']}/{report['requests']} "
+                  f"(extra request cost {report['extra_request_ratio']:.1%}, hedge wins {report['hedge_wins']})")
+    if report["p99_reduction"] is not None:
+        console.print(f"[bold blue]p99 latency:[/] {report['primary_p99']:.2f}s without hedging (lower bound), {report['hedged_p99']:.2f}s with hedging")
+    return report
 # END COMPUTING STATISTICS -----------------------------------------------------------------------------------------------
 
-def process_urls(current_urls, extractor, classifier, database_handler, remaining_scraped_urls, level, search_query, excel_writer, json_writer, file_path, total_links, filename_search_query):
+def expand_links(document, scheduler, level, token_budget=None, parent=None):
     """
-    Processes URLs iteratively, performs extraction and relevance classification, and saves the results to a database, Excel and json.
+    Adds the links of a Relevant document to the frontier one level deeper.
+
+    :param document: Extracted document
+    :param scheduler: CrawlScheduler of the run; it drops known links and links beyond max_depth
+    :param level: Depth level of the document
+    :param token_budget: TokenBudget of the classifier; once it runs low, no deeper levels are added
+    :param parent: URL of the document if the verdict is not final yet (streamed); the links can then be withdrawn
+    :return: True if the links were passed to the scheduler
+    """
+    if token_budget is not None and not token_budget.allows_expansion():
+        logger.info("Token budget low, not expanding links of %s", document.get("url"), extra={"url": document.get("url"), "level": level})
+        return False
+    scheduler.enqueue(document.get("links", []), level + 1, parent=parent)
+    return True
+
+def process_url(url, level, scheduler, extractor, classifier, database_handler, search_query, excel_writer, json_writer, file_path, total_links, filename_search_query, output_lock, metrics, streaming=False, link_graph=None, recrawl=None):
+    """
+    Extracts and classifies one URL and saves the result to the database, Excel and json. Runs in a worker thread of the CrawlScheduler.
 
-    :param current_urls: List of URLs to process
+    :param url: URL to process
+    :param level: Depth level of the URL
+    :param scheduler: CrawlScheduler receiving the links of Relevant documents
     :param extractor: Instance of the extraction module
     :param classifier: Instance of the relevance classification module
     :param database_handler: Instance of the database handler
-    :param remaining_scraped_urls: Number of remaining URLs to process
-    :param level: Depth level
     :param search_query: Query used to classify relevance
     :param excel_writer: Instance of the module for writing to Excel
     :param file_path: Path to the output Excel file
-    :param total_links: Dictionary to store all links
-    :return: Links for further in-depth analysis, total extraction and classification time
+    :param total_links: CrawlState to store all links
+    :param output_lock: Lock serializing writes to the Excel and json outputs
+    :param metrics: CrawlMetrics shown on the dashboard
+    :param streaming: If True, the classification is streamed and the time until the verdict arrives is recorded as verdict_time
+    :param link_graph: Optional LinkGraph recording the links of every extracted page and the Relevant pages
+    :param recrawl: Optional IncrementalRecrawl; unchanged pages keep the verdict stored by the previous run
+    :return: Dictionary with url, level, status_code, classification, explanation, summary, extraction_time,
+             classification_time, verdict_time and content_hash (the ParquetWriter record of the URL)
     """
-    processed_count = 0
-    extraction_time = 0
-    classification_time = 0
-    next_level_links = []
-
-    for idx, url in enumerate(current_urls, start=1):
-
-        if processed_count >= remaining_scraped_urls:
-            break
+    result = {"url": url, "level": level, "status_code": None, "classification": None, "explanation": None, "summary": None,
+              "extraction_time": 0, "classification_time": 0, "verdict_time": 0, "content_hash": None}
 
 # EXTRACTION PROCCESS CALLING
-        start_time_extraction = time.time()
-        with console.status(f"[bold blue] Extracting data from URL {idx}/{len(current_urls)}.[/]", spinner="aesthetic"):
-            logging.info(f"Extracting URL: {url} at level {level} - {idx}/{len(current_urls)}")
-            document, status_code = extractor.extract_text_from_url(url, level)
-            processed_count += 1
-        end_time_extraction = time.time()
-        extraction_time += (end_time_extraction - start_time_extraction)
-
-        # Check for None
-        if document is None and status_code is None:
-            logging.warning("INVALID MARKDOWN")
-            logging.warning(f"Both document and status_code are None for URL: {url}. Skipping.")
-            continue
-
-        if status_code == 200:
-            if not document or not document.get("markdown") or document.get("markdown") == "":
-                logging.warning("INVALID MARKDOWN")
-                logging.warning(f"Document with {url} has empty markdown content. Skipping classification.")
-                continue
-
+    start_time_extraction = time.time()
+    logger.info("Extracting URL: %s at level %s", url, level, extra={"url": url, "level": level, "stage": "extraction"})
+    previous = recrawl.previous(url) if recrawl is not None else None
+    metrics.begin("extraction")
+    try:
+        with profiler.stage("extract"):
+            if recrawl is not None:
+                document, status_code = recrawl.extract(extractor, url, level, previous)
+            else:
+                document, status_code = extractor.extract_text_from_url(url, level)
+    finally:
+        metrics.end("extraction")
+    result["extraction_time"] = time.time() - start_time_extraction
+    result["status_code"] = status_code
+
+    # Check for None
+    if document is None and status_code is None:
+        logger.warning("INVALID MARKDOWN")
+        logger.warning("Both document and status_code are None for URL: %s. Skipping.", url)
+        return result
+
+    if status_code == 200:
+        if not document or not document.get("markdown") or document.get("markdown") == "":
+            logger.warning("INVALID MARKDOWN")
+            logger.warning("Document with %s has empty markdown content. Skipping classification.", url)
+            return result
+
+        # Chunks produced by the CpuStage are passed to the classifier, not stored
+        chunks = document.pop("chunks", None)
+        if link_graph is not None:
+            link_graph.add_links(url, document.get("links", []))
+        result["content_hash"] = database_handler.content_hash(document.get("markdown"))
+        relevance_result = recrawl.reuse(previous, result["content_hash"]) if recrawl is not None else None
+        # True once the links were enqueued on a streamed "Relevant" verdict, before the full response was parsed
+        expanded_early = False
+        if relevance_result is not None:
+            logger.info("Content unchanged since the last run, reusing the stored verdict of %s", url, extra={"url": url, "level": level, "stage": "classification"})
+        else:
             start_time_classification = time.time()
-            with console.status(f"[bold blue]Classifying document relevance. {idx}/{len(current_urls)}[/]", spinner="aesthetic"):
-                logging.info(f"Classifying document: {url} at level {level} - {idx}/{len(current_urls)}")
-                relevance_result = classifier.classify_document(document["markdown"], search_query)
+            logger.info("Classifying document: %s at level %s", url, level, extra={"url": url, "level": level, "stage": "classification"})
+            metrics.begin("classification")
+            try:
+                with profiler.stage("classify"):
+                    if streaming:
+                        def on_verdict(classification, seconds):
+                            nonlocal expanded_early
+                            result["verdict_time"] = seconds
+                            # The links are enqueued tentatively: a streamed "Relevant" can still end as an ERROR result
+                            if classification == "Relevant":
+                                expanded_early = expand_links(document, scheduler, level, classifier.token_budget, parent=url)
+                        relevance_result = classifier.classify_document_stream(document["markdown"], search_query, on_verdict=on_verdict, chunks=chunks)
+                    else:
+                        relevance_result = classifier.classify_document(document["markdown"], search_query, chunks=chunks)
+            except BaseException:
+                if expanded_early:
+                    scheduler.withdraw(url)
+                raise
+            finally:
+                metrics.end("classification")
             end_time_classification = time.time()
-            classification_time += (end_time_classification - start_time_classification)
+            result["classification_time"] = end_time_classification - start_time_classification
+            logger.info("Classified %s in %.2fs", url, result["classification_time"],
+                        extra={"url": url, "level": level, "stage": "classification", "latency": result["classification_time"]})
+            if not streaming:
+                result["verdict_time"] = result["classification_time"]
+            # Links enqueued on the streamed verdict are kept or taken back as soon as the final result is known
+            if expanded_early and relevance_result.classification == "Relevant":
+                scheduler.confirm(url)
+            elif expanded_early:
+                removed, refunded = scheduler.withdraw(url)
+                logger.warning("Streamed verdict of %s was Relevant but the result is %s: withdrew %s links, %s already dispatched",
+                               url, relevance_result.classification, removed, refunded, extra={"url": url, "level": level, "stage": "classification"})
 
 # CLASSIFICATION PROCCESS CALLING
-            try:
-                relevance_result = json.loads(relevance_result)
-            except json.JSONDecodeError as e:
-                logging.warning("INVALID MARKDOWN")
-                print(f"Error decoding JSON: {e}")
-                #continue
-                break
- 
-            # Adds classification to the document
-            document.update({
-                "classification": relevance_result.get("classification")
-            })
-
-            # Save the results to Excel
-            if relevance_result.get("classification") == "Relevant":
-                excel_writer.add_urls_to_output_file(
-                    file_path, 
-                    url
-                )
+        # The classifier always returns a ClassificationResult; failures arrive as ERROR results and are recorded like any other
+        # Adds classification to the document
+        document.update({
+            "classification": relevance_result.classification,
+            "explanation": relevance_result.explanation,
+            "summary": relevance_result.summary,
+            "verdict_source": relevance_result.verdict_source,
+            "search_query": search_query,
+            "content_hash": result["content_hash"],
+            **validators(document.get("metadata")),
+        })
+        result["classification"] = relevance_result.classification
+        result["explanation"] = relevance_result.explanation
+        result["summary"] = relevance_result.summary
+        if link_graph is not None and relevance_result.classification == "Relevant":
+            link_graph.mark_relevant(url)
 
 # SAVE THE DOCUMENT TO DATABASE
-            database_handler.save_document(document)
-
-            # Store in the total_links dictionary
-            total_links[url] = {
-                "level": level,
-                "classification": relevance_result.get("classification"),
-                "explanation": relevance_result.get("explanation"),
-                "summary": relevance_result.get("summary")
-            }
+        # An incremental re-crawl replaces the previous record of the URL instead of adding another one
+        with profiler.stage("db_write"):
+            database_handler.save_document(document, upsert=recrawl is not None)
+
+        # Store in the total_links crawl state
+        record = {
+            "level": level,
+            "classification": relevance_result.classification,
+            "explanation": relevance_result.explanation,
+            "summary": relevance_result.summary
+        }
+        total_links[url] = record
+
+        with output_lock:
+            # Save the results to Excel
+            if relevance_result.classification == "Relevant":
+                with profiler.stage("excel_write"):
+                    excel_writer.add_urls_to_output_file(
+                        file_path, 
+                        url
+                    )
             # Save the results to JSON
-            json_writer.save_overview_to_file(total_links, filename_search_query)
-
-            # Tracking relevant links and checking the maximum number of documents
-            if relevance_result.get("classification") == "Relevant": 
-                for link in document.get("links", []):
-                    if len(next_level_links) >= (remaining_scraped_urls - len(current_urls)):
-                        break
-                    if link not in total_links:
-                        next_level_links.append(link)
-
-        # Error checking
-        elif status_code in [400, 404]:
-            logging.warning("INVALID URL")
-            logging.warning(f"Skipping URL {url} due to status code {status_code}")
-        elif status_code == 429:
-            logging.warning("INVALID URL")
-            with console.status(f"[bold yellow]Rate limit exceeded for URL {url}. Pausing for 61 seconds...[/]", spinner="aesthetic"):
-                logging.warning(f"Rate limit exceeded for URL {url}. Pausing for 61 seconds...")
-                time.sleep(61)
-            continue
-        elif 500 <= status_code < 600:  
-            logging.warning("INVALID URL")
-            logging.warning(f"Server error {status_code} for URL: {url}. Skipping...")
-        elif status_code == 403:
-            logging.warning("INVALID URL")
-            logging.warning(f"Access denied (403) for URL: {url}. Skipping...")
-        else:
-            logging.warning("INVALID URL")
-            logging.warning(f"Unexpected status code {status_code} for URL: {url}. Handling as non-critical.")
-
-        # Limit check - if the number of processed URLs is divisible by 100 without a remainder
-        if processed_count % 100 == 0 and status_code != 429:
-            with console.status("[bold blue]Rate limit reached. Pausing for 61 seconds...[/]", spinner="aesthetic"):
-                time.sleep(61)
+            with profiler.stage("json_write"):
+                json_writer.append_to_overview(filename_search_query, url, record)
+
+        # Tracking relevant links; the scheduler checks depth and the maximum number of documents
+        if relevance_result.classification == "Relevant" and not expanded_early:
+            expand_links(document, scheduler, level, classifier.token_budget)
+
+    # Error checking
+    elif status_code in [400, 404]:
+        logger.warning("INVALID URL")
+        logger.warning("Skipping URL %s due to status code %s", url, status_code)
+    elif status_code == 429:
+        # The scheduler puts the URL back and pauses dispatching
+        logger.warning("INVALID URL")
+    elif 500 <= status_code < 600:  
+        logger.warning("INVALID URL")
+        logger.warning("Server error %s for URL: %s. Skipping...", status_code, url)
+    elif status_code == 403:
+        logger.warning("INVALID URL")
+        logger.warning("Access denied (403) for URL: %s. Skipping...", url)
+    else:
+        logger.warning("INVALID URL")
+        logger.warning("Unexpected status code %s for URL: %s. Handling as non-critical.", status_code, url)
 
-    return next_level_links, extraction_time, classification_time
+    return result
 
 
 def main():
@@ -210,11 +351,7 @@ def main():
         else:
             console.print("[bold red]Invalid input. Please enter a number between 1 and 20.[/]")
     search_engine = BraveSearchEngine(result_count=result_count)  
-    urls = search_engine.search(search_query)
-
-    urls_text = "\n".join([f"{url}" for url in urls])
-    panel = Panel(urls_text, title=f"[blue]URLs found for serach query on depth level 0", title_align="center", border_style="bold blue")
-    console.print(panel)
+    # The web search runs after the stored documents were looked up, see STORED DOCUMENTS below
 # END SERACH MODULE--------------------------------------------------------------------------------------------------- 
 # BLOCK OF BASIC DATA COLLECTION END
 
@@ -228,93 +365,129 @@ def main():
     file_path = os.path.join("OUTPUT", f"{filename_search_query}.xlsx")
 
 # EXTRACTION MODULE
-    extractor = FirecrawlExtractor()    
+    extractor_backend = Prompt.ask(f"[bold blue]{extractor_backend_text}[/]", choices=list(EXTRACTOR_BACKENDS), default="firecrawl")
+    concurrency = IntPrompt.ask(f"[bold blue]{concurrency_text}[/]", default=4)
+    timeout_policy = AdaptiveTimeout()
+    cpu_stage = CpuStage() if Confirm.ask(f"[bold blue]{cpu_stage_text}[/]", default=False) else None
+    extractor = create_extractor(extractor_backend, timeout_policy=timeout_policy, cpu_stage=cpu_stage)
+    if Confirm.ask(f"[bold blue]{hedging_text}[/]", default=False):
+        hedge_backend = Prompt.ask(f"[bold blue]{hedge_backend_text}[/]", choices=list(EXTRACTOR_BACKENDS), default=extractor_backend)
+        hedge_extractor = extractor if hedge_backend == extractor_backend else create_extractor(hedge_backend, timeout_policy=timeout_policy, cpu_stage=cpu_stage)
+        extractor = HedgedExtractor(extractor, hedge_extractor, concurrency=concurrency)
     
 # DATABASE MODULE 
-    database_handler = MongoDB(database_name="default_db", collection_name=filename_search_query)   # MODUL 4: Database
+    compressed_storage = Confirm.ask(f"[bold blue]{compressed_storage_text}[/]", default=False)
+    database_handler = MongoDB(database_name="default_db", collection_name=filename_search_query, compressed=compressed_storage)   # MODUL 4: Database
     console.print(Rule("[bold blue]Available Databases and Collections[/]", style="magenta"))
     database_handler.show_database()
     database_name_new = Prompt.ask("[bold blue]Enter the name of the database you want to use (existing or new). For default press Enter[/]", default="default_db")
     collection_name_new = Prompt.ask("[bold blue]If the collection already exist in selected database, enter a new name. For default press Enter[/]", default=filename_search_query)
     database_handler.set_database(database_name_new)
     database_handler.set_collection(collection_name_new)
+    ResultsQuery(database_handler).ensure_indexes()
+    # Pages already stored in the collection by an earlier run keep their verdict if their content did not change
+    recrawl = IncrementalRecrawl(database_handler) if Confirm.ask(f"[bold blue]{incremental_text}[/]", default=False) else None
+
+# STORED DOCUMENTS
+    # Pages stored by earlier runs that match the query are classified first, from storage, without a network fetch
+    stored_urls = {}
+    if Confirm.ask(f"[bold blue]{stored_documents_text}[/]", default=False):
+        stored_count = IntPrompt.ask(f"[bold blue]{stored_count_text}[/]", default=20)
+        semantic_index = SemanticIndex(os.path.join(INDEX_DIR, database_name_new))
+        with console.status("[bold blue]Updating the index of stored documents...[/]", spinner="aesthetic"):
+            semantic_index.update_from_database(database_handler)
+        candidates = semantic_index.search(search_query, k=stored_count)
+        stored_urls = {candidate["url"]: candidate["collection"] for candidate in candidates}
+        if candidates:
+            candidates_text = "\n".join(f"{candidate['score']:.2f} {candidate['url']} ({candidate['collection']})" for candidate in candidates)
+            console.print(Panel(candidates_text, title="[blue]Stored documents matching the search query", title_align="center", border_style="bold blue"))
+        else:
+            console.print("[bold blue]No stored documents match the search query.[/]")
+    urls = []
+    if not stored_urls or Confirm.ask(f"[bold blue]{web_search_text}[/]", default=True):
+        with profiler.stage("search"):
+            urls = search_engine.search(search_query)
+        urls_text = "\n".join([f"{url}" for url in urls])
+        panel = Panel(urls_text, title=f"[blue]URLs found for serach query on depth level 0", title_align="center", border_style="bold blue")
+        console.print(panel)
+    crawl_extractor = StoredExtractor(extractor, database_handler, stored_urls) if stored_urls else extractor
 
 # CLASSIFICATION MODULE
-    classifier = OpenAI()                                                            
+    run_token_budget = IntPrompt.ask(f"[bold blue]{run_token_budget_text}[/]", default=0)
+    document_token_budget = IntPrompt.ask(f"[bold blue]{document_token_budget_text}[/]", default=200000)
+    normalize = Confirm.ask(f"[bold blue]{normalize_text}[/]", default=False)
+    classifier = OpenAI(token_budget=TokenBudget(per_document=document_token_budget or None, per_run=run_token_budget or None), normalize=normalize)
+    if os.path.exists(LOCAL_MODEL_PATH) and Confirm.ask(f"[bold blue]{cascade_text}[/]", default=False):
+        cascade_threshold = FloatPrompt.ask(f"[bold blue]{cascade_threshold_text}[/]", default=0.9)
+        classifier = CascadeClassifier(classifier, LocalClassifier.load(LOCAL_MODEL_PATH), cascade_threshold)
+    if cpu_stage is not None:
+        cpu_stage.set_chunking(classifier.model, classifier.max_tokens, classifier.overlap_tokens, classifier.normalize)
+    streaming = Confirm.ask(f"[bold blue]{streaming_text}[/]", default=False)
     console.print(Rule("[bold blue]Extraxtion Setting[/]", style="magenta"))
     max_depth  = IntPrompt.ask(f"[bold blue]{max_depth_text}[/]")
     max_scraped_docs = IntPrompt.ask(f"[bold blue]{max_scraped_docs_text}[/]")
+    link_ordering = Confirm.ask(f"[bold blue]{link_ordering_text}[/]", default=False)
+    frontier_store = FrontierStore() if Confirm.ask(f"[bold blue]{frontier_store_text}[/]", default=False) else None
 
     # Set parameters for urls processing
-    level = 0
-    next_level_links = []
-    total_links = {}
-    total_extraction_time = 0  
-    total_classification_time = 0  
-    total_scraped_count = 0
-    remaining_scraped_urls = 0
+    total_links = CrawlState()
+    output_lock = threading.Lock()
 
     # Create a file to save the results
     filename_search_query = excel_writer.modify_serach_query_for_filename(search_query)
     excel_writer.create_output_file_with_search_query(search_query, filename_search_query)
     file_path = os.path.join("OUTPUT", f"{filename_search_query}.xlsx")
-    total_links["search"] = {"search_query": search_query}
+    total_links.set_meta("search", {"search_query": search_query})
     json_writer.save_overview_to_file(total_links, filename_search_query)
 
-
-    # Stop condition: The set maximum search depth is reached.
-    for level in range(max_depth + 1):
-        # Stop condition: The specified maximum number of documents is processed.
-        if total_scraped_count >= max_scraped_docs:
-            console.print(f"[bold yellow]Maximum number of processed documents ({max_scraped_docs}) reached. Stopping iteration.[/]")
-            break
-
-        console.print(Rule(f"[bold blue]Start processing Depth Level {level} ...[/]", style="magenta"))
-        
-        # Select the URLs for the current level
-        current_urls = urls if level == 0 else next_level_links
-        next_level_links = []  # Cleanup for extra depth
-
-        # Stop condition: There are no more links available to process at the next (current) level.
-        if not current_urls:
-            console.print(f"[bold yellow]No URLs found at Level {level}. Terminating search.[/]")
-            break
-
-        # Remaining number of URLs to process
-        remaining_scraped_urls = max_scraped_docs - total_scraped_count
-
-        # Number of URLs that will actually be processed
-        urls_to_process = min(len(current_urls), remaining_scraped_urls)
-        console.print(f"[bold blue]URLs to be processed at Depth Level {level}:[/] {urls_to_process}")
-
-
-# ITERATIVE PROCESS OF PROCESSING URLs FOR SINGLE DEPTHS
-        level_next_links, level_extraction_time, level_classification_time = process_urls(
-            current_urls,
-            extractor,
-            classifier,
-            database_handler,
-            remaining_scraped_urls,
-            level,
-            search_query,
-            excel_writer,
-            json_writer,
-            file_path,
-            total_links,
-            filename_search_query
-        )
-
-        # Update statistics
-        total_extraction_time += level_extraction_time
-        total_classification_time += level_classification_time
-        total_scraped_count += len(current_urls)
-        next_level_links.extend(level_next_links)
-
-        # Pause between levels if next_level_links is not empty  
-        if next_level_links and level < max_depth:
-            console.print(f"[bold blue]Processing documents on Depth Level {level} DONE.[/]")
-            with console.status("[bold blue]Waiting for 61 seconds before proceeding to the next depth level. Please wait... [/]", spinner="aesthetic"):
-                time.sleep(61)
+# PIPELINED PROCESSING OF URLs
+    # Depth is an attribute of each frontier entry: children of a Relevant page are eligible as soon as it is classified.
+    # The scheduler enforces max_depth when links are enqueued and max_scraped_docs when URLs are dispatched.
+    # Every final per-URL result is streamed to OUTPUT/results_<query>.parquet in row groups
+    parquet_writer = ParquetWriter(filename_search_query)
+    scheduler = CrawlScheduler(None, max_depth, max_scraped_docs, concurrency=concurrency, on_result=parquet_writer.add_record, frontier_store=frontier_store)
+    metrics = CrawlMetrics()
+    # The link graph of the run is always recorded and saved; ordering the frontier by it is optional
+    link_graph = LinkGraph()
+    scheduler.process_url = functools.partial(
+        process_url,
+        scheduler=scheduler,
+        extractor=crawl_extractor,
+        classifier=classifier,
+        database_handler=database_handler,
+        search_query=search_query,
+        excel_writer=excel_writer,
+        json_writer=json_writer,
+        file_path=file_path,
+        total_links=total_links,
+        filename_search_query=filename_search_query,
+        output_lock=output_lock,
+        metrics=metrics,
+        streaming=streaming,
+        link_graph=link_graph,
+        recrawl=recrawl,
+    )
+    console.print(Rule("[bold blue]Start processing ...[/]", style="magenta"))
+    with Dashboard(metrics, scheduler, max_scraped_docs,
+                   classification_counts=total_links.classification_counts,
+                   token_usage=classifier.usage_report,
+                   token_budget=classifier.budget_report,
+                   cache_stats=functools.partial(cache_stats, classifier, database_handler),
+                   console=console):
+        # Stored candidates come first, so they are classified before the first network fetch
+        totals = scheduler.run(list(dict.fromkeys([*stored_urls, *urls])), on_progress=link_graph.prioritize if link_ordering else None)
+
+    parquet_writer.close()
+    link_graph.close()
+    link_graph.save(os.path.join("OUTPUT", f"links_{filename_search_query}"))
+    frontier_report = frontier_store.report() if frontier_store is not None else None
+    if frontier_store is not None:
+        frontier_store.close()
+    total_extraction_time = totals.get("extraction_time", 0)
+    total_classification_time = totals.get("classification_time", 0)
+    total_verdict_time = totals.get("verdict_time", 0)
+    for level, count in sorted(scheduler.processed_by_level.items()):
+        console.print(f"[bold blue]URLs processed at Depth Level {level}:[/] {count}")
 
 # END DATABASE,EXTRACTION,CLASSIFICATION MODULE -----------------------------------------------------------------
 # BLOCK OF DEEP-DIVE DATA PROCCESING END
@@ -325,22 +498,80 @@ def main():
     relevant_count,irrelevant_count, error_count = count_relevance(total_links)
     invalid_count = max_scraped_docs - (len(total_links)-1)
     console.print(f"[bold red]Total invalid URLs:[/] {invalid_count}")
-
-    total_links["overview"] = {
+    latency_report = show_latency_report(extractor)
+    hedge_report = show_hedge_report(extractor)
+    stored_report = crawl_extractor.stored_report() if stored_urls else None
+    if stored_report:
+        console.print(f"[bold blue]Stored documents:[/] {stored_report['served']} of {stored_report['candidates']} classified without a network fetch")
+    recrawl_report = recrawl.report() if recrawl is not None else None
+    if recrawl_report:
+        console.print(f"[bold blue]Incremental re-crawl:[/] {recrawl_report['fetched']} fetched, {recrawl_report['not_modified']} not modified, "
+                      f"{recrawl_report['changed']} changed, {recrawl_report['new']} new, {recrawl_report['reused']} verdicts reused")
+        recrawl.close()
+    extractor.close()
+    if cpu_stage is not None:
+        cpu_stage.close()
+    timeout_policy.save()
+    cascade_report = classifier.cascade_report() if isinstance(classifier, CascadeClassifier) else None
+    if cascade_report:
+        console.print(f"[bold blue]Local classifier:[/] {cascade_report['local']} documents, LLM: {cascade_report['llm']} documents "
+                      f"({cascade_report['llm_call_reduction']:.1%} fewer LLM calls)")
+    token_usage = classifier.usage_report()
+    console.print(f"[bold blue]LLM tokens:[/] {token_usage['input_tokens']:,} input, {token_usage['output_tokens']:,} output "
+                  f"in {token_usage['calls']} calls")
+    budget_report = classifier.budget_report()
+    if budget_report["per_run"] is not None:
+        console.print(f"[bold blue]Token budget:[/] {budget_report['remaining']:,} of {budget_report['per_run']:,} tokens left ({budget_report['state']})")
+    if budget_report["truncated_documents"] or budget_report["refused_calls"]:
+        console.print(f"[bold blue]Token budget degradation:[/] {budget_report['truncated_documents']} documents truncated, "
+                      f"{budget_report['skipped_chunks']} chunks skipped, {budget_report['refused_calls']} calls refused")
+    timeout_report = timeout_policy.report()
+    console.print(f"[bold blue]Extraction timeouts:[/] {timeout_report['timeouts']}/{timeout_report['requests']}, "
+                  f"{timeout_report['wasted_wait_seconds']:.0f}s spent waiting on timed-out requests")
+
+    total_links.set_meta("overview", {
     "relevant_count": relevant_count,
     "irrelevant_count": irrelevant_count,
     "error_count": error_count,
     "invalid_count": invalid_count,
+    "extraction_latency": latency_report,
+    "hedging": hedge_report,
+    "stored_documents": stored_report,
+    "incremental_recrawl": recrawl_report,
+    "timeouts": timeout_report,
+    "cascade": cascade_report,
+    "token_usage": token_usage,
+    "token_budget": budget_report,
+    "frontier_store": frontier_report,
+    "link_graph": {"urls": len(link_graph), "links": link_graph.num_edges, "dropped_links": link_graph.dropped_links, "frontier_ordering": link_ordering},
     #"total_extraction_time_seconds": total_extraction_time,
     #"total_classification_time_seconds": total_classification_time
-    }
+    "time_to_verdict_seconds": total_verdict_time,
+    "time_to_full_classification_seconds": total_classification_time,
+    })
     json_writer.save_overview_to_file(total_links, filename_search_query)
+    total_links.close()
     
+    console.print(f"[bold green]Time to verdict: {total_verdict_time:.2f} seconds, time to full classification: {total_classification_time:.2f} seconds[/]")
     #console.print(Rule("[bold magenta]Extraction and Classification Time[/]", style="blue"))
     #console.print(f"[bold green]Total extraction time: {total_extraction_time:.2f} seconds[/]")
     #console.print(f"[bold green]Total classification time: {total_classification_time:.2f} seconds[/]")
     
     
 if __name__ == "__main__":
-    main()
+    setup_logging()
+    parser = argparse.ArgumentParser(description="LLM Insight Search")
+    parser.add_argument("--profile", action="store_true", help="Profile every pipeline stage with cProfile and stack sampling")
+    parser.add_argument("--profile-memory", action="store_true", help="Also record per-stage allocations with tracemalloc (slower)")
+    parser.add_argument("--profile-dir", default=profiler.PROFILE_DIR, help="Folder of the profile reports")
+    args = parser.parse_args()
+    if args.profile:
+        profiler.enable(profiler.StageProfiler(args.profile_dir, memory=args.profile_memory))
+    try:
+        main()
+    finally:
+        if args.profile:
+            for stage_name, stage_report in profiler.disable().items():
+                console.print(f"[bold blue]Profile {stage_name}:[/] {stage_report['calls']} calls, {stage_report['seconds']:.2f}s")
+            console.print(f"[bold blue]Profile reports written to:[/] {args.profile_dir}")
 
@@ -0,0 +1,172 @@
+from search_module.brave_search_engine import BraveSearchEngine
+from extraction_module.extractors import EXTRACTOR_BACKENDS, create_extractor
+from database_module.mongoDB import MongoDB
+from database_module.results_query import ResultsQuery
+from classification_module.LLM_classification import OpenAI
+from classification_module.token_budget import TokenBudget
+from utils.excel_writer import ExcelWriter
+from utils.json_writer import JsonWriter
+from utils.parquet_writer import ParquetWriter
+from utils.crawl_state import CrawlState
+from utils.logging_setup import setup_logging
+from utils.crawl_scheduler import CrawlScheduler
+
+import os
+import time
+import logging
+import argparse
+import functools
+import threading
+
+from rich.console import Console
+
+logger = logging.getLogger(__name__)
+
+console = Console()
+
+
+class QueryOutputs:
+    """
+    Collection, crawl state and output files of one query of a multi-query run.
+    """
+
+    def __init__(self, search_query, database_name, compressed):
+        self.search_query = search_query
+        self.excel_writer = ExcelWriter()
+        self.filename_search_query = self.excel_writer.modify_serach_query_for_filename(search_query)
+        self.excel_writer.create_output_file_with_search_query(search_query, self.filename_search_query)
+        self.file_path = os.path.join("OUTPUT", f"{self.filename_search_query}.xlsx")
+        self.json_writer = JsonWriter()
+        self.database_handler = MongoDB(database_name=database_name, collection_name=self.filename_search_query, compressed=compressed)
+        ResultsQuery(self.database_handler).ensure_indexes()
+        self.parquet_writer = ParquetWriter(self.filename_search_query)
+        self.total_links = CrawlState()
+        self.total_links.set_meta("search", {"search_query": search_query})
+        self.json_writer.save_overview_to_file(self.total_links, self.filename_search_query)
+        self.lock = threading.Lock()
+
+    def save(self, document, level, relevance_result, record):
+        """
+        Stores the verdict of one document for this query in its collection, overview, Excel and Parquet files.
+
+        :param document: Extracted document, shared by all queries; it is copied before the verdict is added
+        :param level: Depth level of the document
+        :param relevance_result: ClassificationResult for this query
+        :param record: Timings and status of the URL for the Parquet record
+        """
+        self.database_handler.save_document({**document, "classification": relevance_result.classification, "explanation": relevance_result.explanation,
+                                             "summary": relevance_result.summary, "verdict_source": relevance_result.verdict_source,
+                                             "search_query": self.search_query})
+        overview_record = {
+            "level": level,
+            "classification": relevance_result.classification,
+            "explanation": relevance_result.explanation,
+            "summary": relevance_result.summary,
+        }
+        self.total_links[document["url"]] = overview_record
+        self.parquet_writer.add_record({**record, "classification": relevance_result.classification,
+                                        "explanation": relevance_result.explanation, "summary": relevance_result.summary})
+        with self.lock:
+            if relevance_result.classification == "Relevant":
+                self.excel_writer.add_urls_to_output_file(self.file_path, document["url"])
+            self.json_writer.append_to_overview(self.filename_search_query, document["url"], overview_record)
+
+    def close(self, overview):
+        self.parquet_writer.close()
+        self.total_links.set_meta("overview", overview)
+        self.json_writer.save_overview_to_file(self.total_links, self.filename_search_query)
+        self.total_links.close()
+
+
+def process_url(url, level, scheduler, extractor, classifier, outputs):
+    """
+    Extracts one URL once and classifies it against all queries in a single LLM call per chunk.
+
+    :param outputs: List of QueryOutputs, in the order of the queries
+    :return: Dictionary with url, level, status_code, extraction_time and classification_time
+    """
+    result = {"url": url, "level": level, "status_code": None, "extraction_time": 0, "classification_time": 0}
+
+    start_time_extraction = time.time()
+    logger.info("Extracting URL: %s at level %s", url, level, extra={"url": url, "level": level, "stage": "extraction"})
+    document, status_code = extractor.extract_text_from_url(url, level)
+    result["extraction_time"] = time.time() - start_time_extraction
+    result["status_code"] = status_code
+
+    if status_code != 200 or not document or not document.get("markdown"):
+        logger.warning("Skipping URL %s (status code %s, empty markdown: %s)", url, status_code, not (document and document.get("markdown")))
+        return result
+
+    chunks = document.pop("chunks", None)
+    start_time_classification = time.time()
+    logger.info("Classifying document: %s at level %s for %s queries", url, level, len(outputs), extra={"url": url, "level": level, "stage": "classification"})
+    relevance_results = classifier.classify_document_multi(document["markdown"], [output.search_query for output in outputs], chunks=chunks)
+    result["classification_time"] = time.time() - start_time_classification
+
+    document["url"] = url
+    document["level"] = level
+    record = {**result, "verdict_time": result["classification_time"], "content_hash": outputs[0].database_handler.content_hash(document["markdown"])}
+    for output, relevance_result in zip(outputs, relevance_results):
+        output.save(document, level, relevance_result, record)
+
+    # The frontier is shared, so the links of a page are followed if it is Relevant for any of the queries
+    if any(relevance_result.classification == "Relevant" for relevance_result in relevance_results):
+        if classifier.token_budget is None or classifier.token_budget.allows_expansion():
+            scheduler.enqueue(document.get("links", []), level + 1)
+    return result
+
+
+def main():
+    """
+    Crawls for several queries at once. Every URL is extracted once and classified against all queries in one LLM call;
+    each query keeps its own collection, overview, Excel and Parquet files.
+
+        python MultiQuery.py --query "benefits of solar energy" --query "cost of heat pumps" --max-depth 1 --max-docs 50
+    """
+    parser = argparse.ArgumentParser(description="Crawl and classify documents for several queries with one LLM call per document.")
+    parser.add_argument("--query", action="append", required=True, help="Repeat for every query")
+    parser.add_argument("--result-count", type=int, default=10)
+    parser.add_argument("--max-depth", type=int, default=1)
+    parser.add_argument("--max-docs", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--backend", choices=list(EXTRACTOR_BACKENDS), default="firecrawl")
+    parser.add_argument("--database", default="default_db")
+    parser.add_argument("--compressed", action="store_true", help="Use compressed, deduplicated page storage")
+    parser.add_argument("--run-token-budget", type=int, default=0, help="Maximum number of LLM tokens for the whole run (0 for no limit)")
+    args = parser.parse_args()
+
+    queries = list(dict.fromkeys(args.query))
+    search_engine = BraveSearchEngine(result_count=args.result_count)
+    seed_urls = list(dict.fromkeys(url for query in queries for url in search_engine.search(query)))
+    console.print(f"[bold blue]{len(seed_urls)} URLs found for {len(queries)} queries on depth level 0[/]")
+
+    outputs = [QueryOutputs(query, args.database, args.compressed) for query in queries]
+    extractor = create_extractor(args.backend)
+    classifier = OpenAI(token_budget=TokenBudget(per_run=args.run_token_budget or None))
+    scheduler = CrawlScheduler(None, args.max_depth, args.max_docs, concurrency=args.concurrency)
+    scheduler.process_url = functools.partial(process_url, scheduler=scheduler, extractor=extractor, classifier=classifier, outputs=outputs)
+
+    with console.status("[bold blue]Processing URLs...[/]", spinner="aesthetic"):
+        totals = scheduler.run(seed_urls)
+    extractor.close()
+
+    token_usage = classifier.usage_report()
+    classified = scheduler.timed.get("classification_time", 0)
+    console.print(f"[bold blue]LLM tokens:[/] {token_usage['input_tokens']:,} input, {token_usage['output_tokens']:,} output "
+                  f"in {token_usage['calls']} calls for {classified} documents x {len(queries)} queries")
+    for output in outputs:
+        counts = output.total_links.classification_counts()
+        console.print(f"[bold green]{output.search_query}:[/] {counts.get('Relevant', 0)} relevant, {counts.get('Irrelevant', 0)} irrelevant")
+        output.close({
+            "relevant_count": counts.get("Relevant", 0),
+            "irrelevant_count": counts.get("Irrelevant", 0),
+            "error_count": sum(count for classification, count in counts.items() if classification and "ERROR" in classification),
+            "queries": queries,
+            "token_usage": token_usage,
+            "time_to_full_classification_seconds": totals.get("classification_time", 0),
+        })
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
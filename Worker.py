@@ -0,0 +1,197 @@
+from search_module.brave_search_engine import BraveSearchEngine
+from extraction_module.extractors import EXTRACTOR_BACKENDS, create_extractor
+from database_module.mongoDB import MongoDB
+from database_module.results_query import ResultsQuery
+from database_module.work_queue import MongoWorkQueue, LeaseHeartbeat
+from classification_module.LLM_classification import OpenAI
+from utils.excel_writer import ExcelWriter
+from utils.json_writer import JsonWriter
+from utils.parquet_writer import ParquetWriter
+from utils.logging_setup import setup_logging
+
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import argparse
+from multiprocessing import Process
+
+from rich.console import Console
+
+logger = logging.getLogger(__name__)
+
+console = Console()
+
+
+def process_claimed_url(entry, work_queue, worker_id, extractor, classifier, database_handler, search_query, rate_limit_pause=61):
+    """
+    Extracts and classifies one claimed URL and writes the result back idempotently.
+
+    :param entry: Frontier entry returned by MongoWorkQueue.claim
+    :param rate_limit_pause: Seconds the worker pauses after a 429, once the URL is released
+    :return: Status code of the extraction
+    """
+    url, level = entry["_id"], entry["level"]
+    with LeaseHeartbeat(work_queue, url, worker_id) as heartbeat:
+        document, status_code = extractor.extract_text_from_url(url, level)
+        if status_code != 429:
+            return finish_claimed_url(url, level, document, status_code, heartbeat, work_queue, worker_id, classifier, database_handler, search_query)
+
+    # The heartbeat is stopped before the release, so it cannot extend the lease again, and the pause
+    # happens without a lease: other workers can claim the URL right away
+    logger.warning("Rate limit exceeded for URL %s. Releasing it and pausing for %s seconds...", url, rate_limit_pause)
+    work_queue.release(url, worker_id)
+    time.sleep(rate_limit_pause)
+    return status_code
+
+
+def finish_claimed_url(url, level, document, status_code, heartbeat, work_queue, worker_id, classifier, database_handler, search_query):
+    """
+    Classifies an extracted URL and completes it in the work queue; called while the lease is held.
+
+    :return: Status code of the extraction
+    """
+    if status_code != 200 or not document or not document.get("markdown"):
+        work_queue.complete(url, worker_id, level, status_code)
+        return status_code
+
+    relevance_result = classifier.classify_document(document["markdown"], search_query)
+
+    if heartbeat.lost:
+        # Another worker owns the URL now and will write the result
+        return status_code
+
+    document.update({
+        "url": url,
+        "classification": relevance_result.classification,
+        "explanation": relevance_result.explanation,
+        "summary": relevance_result.summary,
+        "verdict_source": relevance_result.verdict_source,
+        "search_query": search_query,
+    })
+    database_handler.save_document(document, upsert=True)
+    work_queue.complete(url, worker_id, level, status_code, relevance_result.classification, document.get("links", []))
+    return status_code
+
+
+def run_worker(database_name, collection_name, backend, compressed, idle_seconds=5):
+    """
+    Claims and processes URLs until the shared frontier is exhausted.
+
+    :param database_name: Database holding the results collection and the work queue
+    :param collection_name: Results collection
+    :param backend: Extraction backend name
+    :param compressed: Whether the results collection uses compressed storage
+    :param idle_seconds: Pause between claims when nothing is claimable yet
+    """
+    setup_logging()
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    database_handler = MongoDB(database_name=database_name, collection_name=collection_name, compressed=compressed)
+    work_queue = MongoWorkQueue(database_handler, collection_name)
+    search_query = work_queue.settings["search_query"]
+    extractor = create_extractor(backend)
+    classifier = OpenAI()
+
+    processed = 0
+    try:
+        while True:
+            entry = work_queue.claim(worker_id)
+            if entry is None:
+                if work_queue.is_finished():
+                    break
+                time.sleep(idle_seconds)
+                continue
+            logger.info("Worker %s processing %s at level %s", worker_id, entry['_id'], entry['level'],
+                        extra={"url": entry['_id'], "level": entry['level'], "stage": "claim", "worker_id": worker_id})
+            process_claimed_url(entry, work_queue, worker_id, extractor, classifier, database_handler, search_query)
+            processed += 1
+    finally:
+        extractor.close()
+    logger.info("Worker %s finished after %s URLs", worker_id, processed)
+
+
+def coordinate(args):
+    """
+    Seeds the shared frontier with search results, waits for the workers and writes the overview, Excel and Parquet outputs.
+    """
+    database_handler = MongoDB(database_name=args.database, collection_name=args.collection, compressed=args.compressed)
+    results = ResultsQuery(database_handler)
+    results.ensure_indexes()
+
+    work_queue = MongoWorkQueue(database_handler, args.collection)
+    work_queue.setup(args.query, args.max_depth, args.max_docs, lease_seconds=args.lease_seconds)
+    urls = BraveSearchEngine(result_count=args.result_count).search(args.query)
+    added = work_queue.enqueue(urls, 0)
+    console.print(f"[bold blue]Frontier seeded with {added} URLs. Start workers with:[/] python Worker.py worker --database {args.database} --collection {args.collection}")
+
+    with console.status("[bold blue]Waiting for workers...[/]", spinner="aesthetic") as status:
+        while not work_queue.is_finished():
+            stats = work_queue.stats()
+            status.update(f"[bold blue]Waiting for workers... claimed {stats['claimed']}/{args.max_docs}, "
+                          f"pending {stats.get('pending', 0)}, leased {stats.get('leased', 0)}, done {stats.get('done', 0)}[/]")
+            time.sleep(2)
+
+    # Outputs are built from the collection, which holds exactly one document per URL
+    excel_writer = ExcelWriter()
+    filename_search_query = excel_writer.modify_serach_query_for_filename(args.query)
+    excel_writer.create_output_file_with_search_query(args.query, filename_search_query)
+    file_path = os.path.join("OUTPUT", f"{filename_search_query}.xlsx")
+    total_links = {"search": {"search_query": args.query}}
+    with ParquetWriter(filename_search_query) as parquet_writer:
+        for document in results.stream(projection={"url": 1, "level": 1, "classification": 1, "explanation": 1, "summary": 1, "content_hash": 1}):
+            total_links[document["url"]] = {key: document.get(key) for key in ("level", "classification", "explanation", "summary")}
+            parquet_writer.add_record(document)
+            if document.get("classification") == "Relevant":
+                excel_writer.add_urls_to_output_file(file_path, document["url"])
+    total_links["overview"] = work_queue.stats()
+    JsonWriter().save_overview_to_file(total_links, filename_search_query)
+    console.print(f"[bold green]Distributed crawl finished:[/] {work_queue.stats()}")
+
+
+def main():
+    """
+    Distributed mode. The frontier lives in MongoDB, so coordinator and workers can run on different machines.
+
+        python Worker.py coordinator --query "What are the benefits of solar energy" --max-depth 2 --max-docs 100
+        python Worker.py worker --collection "What are the benefits of solar energy" --processes 4
+    """
+    parser = argparse.ArgumentParser(description="Distributed crawl workers coordinating through a MongoDB work queue.")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    coordinator = subparsers.add_parser("coordinator", help="Seed the frontier and collect the results")
+    coordinator.add_argument("--query", required=True)
+    coordinator.add_argument("--collection", default=None, help="Defaults to the sanitized query")
+    coordinator.add_argument("--result-count", type=int, default=10)
+    coordinator.add_argument("--max-depth", type=int, default=1)
+    coordinator.add_argument("--max-docs", type=int, default=20)
+    coordinator.add_argument("--lease-seconds", type=int, default=120)
+
+    worker = subparsers.add_parser("worker", help="Process URLs from the shared frontier")
+    worker.add_argument("--collection", required=True)
+    worker.add_argument("--processes", type=int, default=1)
+    worker.add_argument("--backend", choices=list(EXTRACTOR_BACKENDS), default="firecrawl")
+
+    for subparser in (coordinator, worker):
+        subparser.add_argument("--database", default="default_db")
+        subparser.add_argument("--compressed", action="store_true", help="Use compressed, deduplicated page storage")
+
+    args = parser.parse_args()
+    if args.mode == "coordinator":
+        args.collection = args.collection or ExcelWriter().modify_serach_query_for_filename(args.query)
+        coordinate(args)
+    else:
+        processes = [
+            Process(target=run_worker, args=(args.database, args.collection, args.backend, args.compressed))
+            for _ in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
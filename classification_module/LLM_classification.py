@@ -1,38 +1,186 @@
 import os
+import re
+import time
 import logging
 import json
+import threading
+from typing import Literal
 from dotenv import load_dotenv
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
 from langchain_openai import ChatOpenAI
 import tiktoken
+from utils.output_filter import normalize_markdown
+from utils.cpu_stage import Chunk
+from utils import profiler
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("search_log.log", mode='a', encoding='utf-8'),  # Nastavení UTF-8
-    ]
-)
+logger = logging.getLogger(__name__)
+
+# Order used to combine chunk verdicts - the highest index wins
+RELEVANCE_PRIORITY = ["Irrelevant", "Relevant", "ERROR"]
+
+# First JSON object in a response wrapped in prose or code fences
+JSON_OBJECT_PATTERN = re.compile(r"\{.*\}", re.DOTALL)
+
+REPAIR_PROMPT = "Rewrite the text as a JSON object with classification (Relevant, Irrelevant or ERROR), explanation and summary. Keep the wording."
+
+
+class ClassificationResult(BaseModel):
+    """
+    Typed classifier output. Fields are generated in this order, so the verdict comes first.
+    verdict_source is not part of the response schema: it records whether the verdict came from the LLM, the local
+    classifier or an earlier run, so only LLM verdicts are used as training labels.
+    """
+
+    model_config = ConfigDict(extra="forbid")
+
+    classification: Literal["Relevant", "Irrelevant", "ERROR"]
+    explanation: str
+    summary: str
+    verdict_source: Literal["llm", "local", "reused"] = Field(default="llm", exclude=True)
+
+    @field_validator("classification", mode="before")
+    @classmethod
+    def normalize_classification(cls, value):
+        # "relevant", " Relevant " and the like are accepted without a repair call
+        if isinstance(value, str):
+            for label in RELEVANCE_PRIORITY:
+                if value.strip().lower() == label.lower():
+                    return label
+        return value
+
+
+# Strict structured output: the API only returns JSON matching the schema.
+# Written out without titles and descriptions, because the schema is sent with every call.
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "classification_result",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "classification": {"type": "string", "enum": RELEVANCE_PRIORITY},
+                "explanation": {"type": "string"},
+                "summary": {"type": "string"},
+            },
+            "required": ["classification", "explanation", "summary"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+# Multi-query output: one summary of the document and one verdict per numbered query
+MULTI_QUERY_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "multi_query_classification",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "summary": {"type": "string"},
+                "results": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "query": {"type": "integer"},
+                            "classification": {"type": "string", "enum": RELEVANCE_PRIORITY},
+                            "explanation": {"type": "string"},
+                        },
+                        "required": ["query", "classification", "explanation"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["summary", "results"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+MULTI_QUERY_PROMPT = """
+            # Several queries
+            The human message lists several numbered user queries. Classify the document for each query independently.
+            Return the summary of the document once, and for every query its number, classification and explanation.
+"""
+
+# Output tokens allowed per query (and once more for the shared summary) in a multi-query call
+MULTI_QUERY_OUTPUT_TOKENS = 80
+
+
+def error_result(explanation):
+    """
+    :return: ClassificationResult with the ERROR classification
+    """
+    return ClassificationResult(classification="ERROR", explanation=explanation, summary="")
 
-class OpenAI:
+
+class VerdictParser:
+    """
+    Incrementally scans streamed JSON output for the value of the "classification" field.
+    """
+
+    pattern = re.compile(r'"classification"\s*:\s*"([^"]*)"')
 
     def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.verdict = None
+
+    def feed(self, text):
+        """
+        Adds a streamed fragment.
+
+        :param text: Next fragment of the response
+        :return: The classification as soon as its value is complete, otherwise None
+        """
+        self.buffer += text
+        if self.verdict is None:
+            match = self.pattern.search(self.buffer, self.position)
+            if match:
+                self.verdict = match.group(1)
+            else:
+                # Keep enough overlap for a field split across fragments
+                self.position = max(0, len(self.buffer) - 64)
+        return self.verdict
+
+
+class OpenAI:
+
+    def __init__(self, token_budget=None, normalize=False):
+        """
+        :param token_budget: Optional TokenBudget enforcing per-document and per-run token ceilings
+        :param normalize: If True, documents are passed through normalize_markdown before they are split into chunks
+        """
         load_dotenv()
         self.OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
         if not self.OPENAI_API_KEY:
-            logging.error("API key not found")
+            logger.error("API key not found")
             raise ValueError("API key not set!")
         
         self.max_tokens = 90000
         self.overlap_tokens = 9000
         self.model = "gpt-4o-mini"
+        self.output_tokens = 300
     
         # Initialization of OpenAI LLM via LangChain
         self.llm = ChatOpenAI(model=self.model, 
                             api_key=self.OPENAI_API_KEY,
                             temperature=0,
-                            max_tokens=300,
+                            max_tokens=self.output_tokens,
                             timeout=None,
-                            max_retries=2,)
+                            max_retries=2,
+                            stream_usage=True,)
+        self._usage_lock = threading.Lock()
+        self.usage = {"calls": 0, "input_tokens": 0, "output_tokens": 0, "repaired": 0, "repair_calls": 0, "failed": 0}
+        self.max_repair_calls = 1
+        self.token_budget = token_budget
+        self.normalize = normalize
+        self._encoding = None
+        # Token counts of the system prompts, which are the same in every call
+        self._fixed_tokens = {}
 
         self.prompt = """
             Classify the provided document text based on its relevance to the user query, relying solely on the content of the document.
@@ -57,12 +205,7 @@ class OpenAI:
             5. Classify the document into the appropriate category based on the comparison.
 
             # Output Format
-            The output should be in JSON format with the following structure:
-            {
-            "classification": "Relevant/Irrelevant",
-            "explanation": "Brief explanation (max 30 tokens)",
-            "summary": "Summary of document content (max 30 tokens)"
-            }
+            A JSON object with "classification" (Relevant/Irrelevant), "explanation" and "summary", in this order.
 
 
             # Examples
@@ -120,99 +263,474 @@ class OpenAI:
         :param max_tokens: The maximum number of tokens per chunk
         :param overlap_tokens: The number of overlapping tokens between chunks
         :param model: The name of the LLM used to determine the appropriate tokenization method for tiktoken
-        :return: A list of text chunks
+        :return: A list of Chunk, each with its token count
         """
-        try:
-            encoding = tiktoken.encoding_for_model(self.model)
-            tokens = encoding.encode(document_text)
-            chunk_size = self.max_tokens
-            overlap = self.overlap_tokens
-
-            chunks = []
-            start = 0
-            while start < len(tokens):
-                end = start + chunk_size
-                chunk = tokens[start:end]
-                chunks.append(encoding.decode(chunk))
-                start += chunk_size - overlap  # overlap
+        with profiler.stage("chunk"):
+            try:
+                encoding = tiktoken.encoding_for_model(self.model)
+                tokens = encoding.encode(document_text)
+                chunk_size = self.max_tokens
+                overlap = self.overlap_tokens
+
+                chunks = []
+                start = 0
+                while start < len(tokens):
+                    end = start + chunk_size
+                    chunk = tokens[start:end]
+                    chunks.append(Chunk(encoding.decode(chunk), len(chunk)))
+                    start += chunk_size - overlap  # overlap
             
-            return chunks
-        except Exception as e:
-            logging.error(f"Error in split_into_chunks: {e}")
-            return []
+                return chunks
+            except Exception as e:
+                logger.error("Error in split_into_chunks: %s", e)
+                return []
    
-    def classify_document(self, document_text, user_query):
+    def count_tokens(self, text):
+        """
+        Counts tokens with tiktoken before a call; falls back to 4 characters per token if the encoding is not available.
+
+        :param text: Text sent to the LLM
+        :return: Number of tokens
+        """
+        if self._encoding is None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model)
+            except Exception as e:
+                logger.error("Error loading tiktoken encoding, estimating tokens from characters: %s", e)
+                self._encoding = False
+        if self._encoding is False:
+            return len(text) // 4 + 1
+        return len(self._encoding.encode(text))
+
+    def fixed_tokens(self, text):
+        """
+        :param text: System prompt
+        :return: Number of tokens, counted once per prompt
+        """
+        tokens = self._fixed_tokens.get(text)
+        if tokens is None:
+            tokens = self._fixed_tokens[text] = self.count_tokens(text)
+        return tokens
+
+    def chunk_tokens(self, chunk):
+        """
+        :param chunk: Chunk returned by split_into_chunks or the CpuStage, or plain text
+        :return: Number of tokens; counted only if the chunk does not carry its count
+        """
+        tokens = getattr(chunk, "tokens", None)
+        return self.count_tokens(chunk) if tokens is None else tokens
+
+    def budget_chunks(self, chunks, user_query, output_tokens=None, system_prompt=None):
+        """
+        Applies the token budget to the chunks of a document.
+
+        :param chunks: Chunks of the document
+        :param user_query: User query (or queries) sent with every chunk
+        :param output_tokens: Output limit of one call, defaults to self.output_tokens
+        :param system_prompt: System prompt sent with every chunk, defaults to self.prompt
+        :return: The chunks to classify, the first one possibly cut to the per-document ceiling. None if the budget is exhausted
+                 or the ceiling does not even cover the prompt and the output.
+        :note: Token counting and truncation are profiled as part of the chunk stage, not of classify.
+        """
+        if self.token_budget is None or not chunks:
+            return chunks
+        with profiler.stage("chunk"):
+            overhead = self.fixed_tokens(system_prompt or self.prompt) + self.count_tokens(user_query)
+            output_tokens = output_tokens or self.output_tokens
+            count, limit = self.token_budget.plan([self.chunk_tokens(chunk) for chunk in chunks], overhead, output_tokens)
+            if not count:
+                logger.warning("Token budget exhausted, skipping document")
+                return None
+            if limit is not None and limit <= 0:
+                logger.warning("Per-document token budget of %s does not cover the prompt (%s) and output (%s) tokens, skipping document",
+                               self.token_budget.per_document, overhead, output_tokens)
+                return None
+            chunks = chunks[:count]
+            if limit is not None:
+                chunks[0] = Chunk(self.truncate(chunks[0], limit), min(limit, self.chunk_tokens(chunks[0])))
+            return chunks
+
+    def truncate(self, text, max_tokens):
+        """
+        :return: The first max_tokens tokens of text
+        """
+        if self.chunk_tokens(text) <= max_tokens:
+            return text
+        if self._encoding is False:
+            return text[:max_tokens * 4]
+        return self._encoding.decode(self._encoding.encode(text)[:max_tokens])
+
+    def reserve_call(self, messages, output_tokens=None, chunk=None):
+        """
+        Reserves the estimated tokens of one call in the token budget.
+
+        :param messages: Messages of the call
+        :param output_tokens: Output limit of the call, defaults to self.output_tokens
+        :param chunk: Chunk at the end of the human message; its count is reused and only the text before it is encoded
+        :return: Tuple (reservation, estimated input tokens) for record_usage, or None if the budget refuses the call
+        """
+        if self.token_budget is None:
+            return 0, 0
+        estimate = 0
+        for role, text in messages:
+            if role == "system":
+                estimate += self.fixed_tokens(text)
+            elif chunk is not None and text.endswith(chunk):
+                estimate += self.count_tokens(text[:len(text) - len(chunk)]) + self.chunk_tokens(chunk)
+            else:
+                estimate += self.count_tokens(text)
+        reservation = self.token_budget.reserve(estimate + (output_tokens or self.output_tokens))
+        if reservation is None:
+            logger.warning("Token budget exhausted, skipping LLM call")
+            return None
+        return reservation, estimate
+
+    def budget_exhausted_result(self):
+        """
+        :return: The result returned for documents the token budget does not allow to classify
+        """
+        return error_result("Token budget exhausted")
+
+    def record_usage(self, message, reservation=(0, 0)):
+        """
+        Adds the token usage reported with an LLM response (or the last fragment of a stream) and settles the budget reservation.
+
+        :param message: LangChain AIMessage or AIMessageChunk, None if the call failed
+        :param reservation: Tuple returned by reserve_call
+        """
+        usage = getattr(message, "usage_metadata", None) or {}
+        input_tokens = usage.get("input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        with self._usage_lock:
+            self.usage["calls"] += 1
+            self.usage["input_tokens"] += input_tokens
+            self.usage["output_tokens"] += output_tokens
+        if self.token_budget is not None:
+            reserved, estimate = reservation
+            if not usage:
+                # No usage reported (or the call failed), the tiktoken estimate is counted instead
+                input_tokens = estimate
+            self.token_budget.settle(reserved, input_tokens, output_tokens)
+
+    def _count(self, key):
+        with self._usage_lock:
+            self.usage[key] += 1
+
+    def budget_report(self):
+        """
+        :return: TokenBudget.report(), or None without a budget
+        """
+        return self.token_budget.report() if self.token_budget is not None else None
+
+    def usage_report(self):
+        """
+        :return: Dictionary with the number of LLM calls, the input and output tokens used so far,
+                 the number of repaired responses, repair calls and documents that could not be classified
+        """
+        with self._usage_lock:
+            return dict(self.usage)
+
+    def messages(self, chunk, user_query):
+        """
+        :return: Messages classifying one chunk
+        """
+        return [
+            ("system", self.prompt,),
+            ("human", f"User query: {user_query}\n\nDocument text:\n{chunk}",),
+        ]
+
+    def invoke(self, messages, response_format=RESPONSE_FORMAT, output_tokens=None, chunk=None):
+        """
+        Calls the LLM with a strict schema as response format.
+
+        :param messages: Messages of the call
+        :param response_format: RESPONSE_FORMAT or MULTI_QUERY_RESPONSE_FORMAT
+        :param output_tokens: Output limit of the call, defaults to self.output_tokens
+        :param chunk: Chunk sent in the call, see reserve_call
+        :return: Response content, or None if the token budget refuses the call
+        """
+        reservation = self.reserve_call(messages, output_tokens, chunk)
+        if reservation is None:
+            return None
+        response = None
+        try:
+            if output_tokens:
+                response = self.llm.invoke(messages, response_format=response_format, max_tokens=output_tokens)
+            else:
+                response = self.llm.invoke(messages, response_format=response_format)
+        finally:
+            self.record_usage(response, reservation)
+        return response.content
+
+    def parse_result(self, content):
+        """
+        Validates a response against ClassificationResult, repairing it if needed.
+
+        :param content: Response content
+        :return: ClassificationResult, or None if the response cannot be repaired
+        :note:
+        - Responses wrapped in prose or code fences are repaired locally, without an LLM call.
+        - Otherwise one repair call is made. It sends only the broken response (not the document), with a small output limit.
+        """
+        try:
+            return ClassificationResult.model_validate_json(content)
+        except (ValidationError, TypeError):
+            pass
+        match = JSON_OBJECT_PATTERN.search(content or "")
+        if match:
+            try:
+                result = ClassificationResult.model_validate_json(match.group(0))
+                self._count("repaired")
+                return result
+            except ValidationError:
+                pass
+        if not (content or "").strip() or self.max_repair_calls <= 0:
+            return None
+
+        for _ in range(self.max_repair_calls):
+            self._count("repair_calls")
+            messages = [("system", REPAIR_PROMPT), ("human", content[-2000:])]
+            try:
+                repaired = self.invoke(messages)
+                if repaired is None:
+                    return None
+                result = ClassificationResult.model_validate_json(repaired)
+                self._count("repaired")
+                return result
+            except Exception as e:
+                logger.warning("Repair of classifier output failed: %s", e)
+        return None
+
+    def classify_document(self, document_text, user_query, chunks=None):
         """
         Classifies the relevance of a document to a user query by processing the document in chunks and combining the results.
 
         :param document_text: Document text to classify relevance
         :param user_query: User query for document relevance classification
-        :return: A JSON string containing the relevance classification, explanation, and summary of the document
+        :param chunks: Chunks already produced by the CpuStage; the document is split here if None
+        :return: ClassificationResult of the document; never None, failures are returned as ERROR results
         :note:
         - The document is split into chunks using the `split_into_chunks` method.
         - Single-chunk documents are directly processed for relevance using the LLM.
         - Multi-chunk documents are processed chunk by chunk, with results combined to determine overall relevance.
+        - Chunks whose response cannot be parsed or repaired are skipped.
+        """
+        try:
+            if chunks is None:
+                chunks = self.split_into_chunks(normalize_markdown(document_text) if self.normalize else document_text)
+            logger.info("Number of chunks: %s", len(chunks))
+            chunks = self.budget_chunks(chunks, user_query)
+            if chunks is None:
+                return self.budget_exhausted_result()
+
+            chunk_results = []
+            refused = False
+            for i, chunk in enumerate(chunks, start=1):
+                logger.info("Proccessing chunk: %s", i)
+                content = self.invoke(self.messages(chunk, user_query), chunk=chunk)
+                if content is None:
+                    refused = True
+                    break
+                result = self.parse_result(content)
+                if result is None:
+                    logger.error("Classifier output of chunk %s could not be parsed or repaired.", i)
+                    continue
+                chunk_results.append(result)
+
+            if not chunk_results:
+                if refused:
+                    return self.budget_exhausted_result()
+                self._count("failed")
+                return error_result("Classifier output could not be parsed")
+            return self.combine_chunk_results(chunk_results)
+
+        except Exception as e:
+            logger.error("Error in evaluate_document: %s", e)
+            self._count("failed")
+            return error_result(f"Classification failed: {e.__class__.__name__}")
+
+    def combine_chunk_results(self, chunk_results):
+        """
+        Combines per-chunk classifications into the result for the whole document.
+
+        :param chunk_results: List of ClassificationResult
+        :return: The combined ClassificationResult
         """
+        if len(chunk_results) == 1:
+            return chunk_results[0]
+        # Determine the highest level of relevance
+        max_relevance_level = max(chunk_results, key=lambda x: RELEVANCE_PRIORITY.index(x.classification)).classification
+        # Processing by relevance category
+        if max_relevance_level == "Irrelevant" or max_relevance_level == "ERROR":
+            first_irrelevant_chunk = chunk_results[0]
+            combined_explanation = first_irrelevant_chunk.explanation
+            summary = first_irrelevant_chunk.summary
+        else:
+            # Combining information from relevant chunks
+            relevant_chunks = [result for result in chunk_results if result.classification == "Relevant"]
+            combined_explanation = " | ".join({chunk.explanation for chunk in relevant_chunks})
+            summary = " | ".join({chunk.summary for chunk in relevant_chunks if chunk.summary})
+
+        return ClassificationResult(classification=max_relevance_level, explanation=combined_explanation, summary=summary)
+
+    def classify_document_multi(self, document_text, user_queries, chunks=None):
+        """
+        Classifies a document against several queries with one LLM call per chunk, so the document tokens are paid once.
+
+        :param document_text: Document text to classify relevance
+        :param user_queries: List of user queries
+        :param chunks: Chunks already produced by the CpuStage; the document is split here if None
+        :return: List of ClassificationResult, one per query in the order of user_queries
+        :note:
+        - The summary is generated once per chunk and shared by all queries.
+        - Queries missing from a response are classified on their own with classify_document.
+        """
+        if len(user_queries) == 1:
+            return [self.classify_document(document_text, user_queries[0], chunks=chunks)]
         try:
-            chunks = self.split_into_chunks(document_text)
-            logging.info(f"Number of chunks: {len(chunks)}")
+            if chunks is None:
+                chunks = self.split_into_chunks(normalize_markdown(document_text) if self.normalize else document_text)
+            logger.info("Number of chunks: %s, queries: %s", len(chunks), len(user_queries))
+            output_tokens = MULTI_QUERY_OUTPUT_TOKENS * (len(user_queries) + 1)
+            chunks = self.budget_chunks(chunks, "\n".join(user_queries), output_tokens, self.prompt + MULTI_QUERY_PROMPT)
+            if chunks is None:
+                return [self.budget_exhausted_result() for _ in user_queries]
 
-            # If the document fits into one chunk
-            if len(chunks) == 1:
-                chunk = chunks[0]
-                # Build report for model (Langchain)
+            numbered_queries = "\n".join(f"{number}. {query}" for number, query in enumerate(user_queries, start=1))
+            per_query = [[] for _ in user_queries]
+            refused = False
+            for i, chunk in enumerate(chunks, start=1):
                 messages = [
-                    ( "system", self.prompt,),
-                    ("human", f"User query: {user_query}\n\nDocument text:\n{chunk}",),
+                    ("system", self.prompt + MULTI_QUERY_PROMPT,),
+                    ("human", f"User queries:\n{numbered_queries}\n\nDocument text:\n{chunk}",),
                 ]
+                content = self.invoke(messages, MULTI_QUERY_RESPONSE_FORMAT, output_tokens, chunk)
+                if content is None:
+                    refused = True
+                    break
+                for index, result in self.parse_multi_result(content, len(user_queries)).items():
+                    per_query[index].append(result)
 
-                # Call LLM using LangChain
-                response = self.llm.invoke(messages)
-                return response.content
-            else:
-                # For multiple chunks
-                chunk_results = []
-                for i, chunk in enumerate(chunks, start=1):
-                    logging.info(f"Proccessing chunk: {i}")
-                    messages = [
-                        ("system",self.prompt,),
-                        ("human",f"User query: {user_query}\n\nDocument text:\n{chunk}",),
-                    ]
-                    response = self.llm.invoke(messages)
-                    try:
-                        response_json = json.loads(response.content)
-                        chunk_results.append({
-                            "classification": response_json.get("classification", ""),
-                            "explanation": response_json.get("explanation", ""),
-                            "summary": response_json.get("summary", ""),
-                        })
-                    except json.JSONDecodeError:
-                        logging.error("Error decoding response.content into JSON.")
-                        continue
-
-                # Evaluation of the relevance of the entire document
-                relevance_priority = ["Irrelevant", "Relevant", "ERROR"]
-                # Determine the highest level of relevance
-                max_relevance_level = max(chunk_results, key=lambda x: relevance_priority.index(x["classification"]))["classification"]
-                # Processing by relevance category
-                if max_relevance_level == "Irrelevant" or max_relevance_level == "ERROR":
-                    first_irrelevant_chunk = chunk_results[0]
-                    combined_explanation = first_irrelevant_chunk["explanation"]
-                    summary = first_irrelevant_chunk["summary"]
+            results = []
+            for user_query, chunk_results in zip(user_queries, per_query):
+                if chunk_results:
+                    results.append(self.combine_chunk_results(chunk_results))
+                elif refused:
+                    results.append(self.budget_exhausted_result())
                 else:
-                    # Combining information from relevant chunks
-                    relevant_chunks = [result for result in chunk_results if result["classification"] == "Relevant"]
-                    combined_explanation = " | ".join({chunk["explanation"] for chunk in relevant_chunks})
-                    summary = " | ".join({chunk["summary"] for chunk in relevant_chunks if chunk["summary"]})
+                    # Missing from every response: classified on its own
+                    results.append(self.classify_document(document_text, user_query, chunks=chunks))
+            return results
+
+        except Exception as e:
+            logger.error("Error in classify_document_multi: %s", e)
+            self._count("failed")
+            return [error_result(f"Classification failed: {e.__class__.__name__}") for _ in user_queries]
 
-                return json.dumps({
-                    "classification": max_relevance_level,
-                    "explanation": combined_explanation,
-                    "summary": summary
-                },)
+    def parse_multi_result(self, content, num_queries):
+        """
+        Validates a multi-query response.
+
+        :param content: Response content
+        :param num_queries: Number of queries in the request
+        :return: Dictionary query index (0-based) -> ClassificationResult; queries that are missing or invalid are left out
+        """
+        match = JSON_OBJECT_PATTERN.search(content or "")
+        if not match:
+            return {}
+        try:
+            response = json.loads(match.group(0))
+        except json.JSONDecodeError:
+            return {}
+        results = {}
+        for item in response.get("results", []) if isinstance(response, dict) else []:
+            try:
+                index = int(item.get("query")) - 1
+                if 0 <= index < num_queries and index not in results:
+                    results[index] = ClassificationResult(classification=item.get("classification"), explanation=item.get("explanation") or "",
+                                                          summary=response.get("summary") or "")
+            except (ValidationError, TypeError, ValueError, AttributeError):
+                continue
+        return results
+
+    def classify_document_stream(self, document_text, user_query, on_verdict=None, chunks=None):
+        """
+        Streaming variant of classify_document that reports the verdict before the summary and explanation are generated.
+
+        :param document_text: Document text to classify relevance
+        :param user_query: User query for document relevance classification
+        :param on_verdict: Callback on_verdict(classification, seconds) invoked once, as soon as the verdict is known
+        :param chunks: Chunks already produced by the CpuStage; the document is split here if None
+        :return: The same ClassificationResult as classify_document
+        :note:
+        - The schema puts "classification" first, so the verdict arrives after a few tokens.
+        - For multi-chunk documents the verdict is final once every chunk has produced its classification,
+          or immediately when a chunk reports ERROR, which outranks every other verdict.
+        """
+        start = time.perf_counter()
+        verdict_sent = False
+
+        def send_verdict(classification):
+            nonlocal verdict_sent
+            if on_verdict is not None and not verdict_sent:
+                verdict_sent = True
+                on_verdict(classification, time.perf_counter() - start)
+
+        try:
+            if chunks is None:
+                chunks = self.split_into_chunks(normalize_markdown(document_text) if self.normalize else document_text)
+            logger.info("Number of chunks: %s", len(chunks))
+            chunks = self.budget_chunks(chunks, user_query)
+            if chunks is None:
+                result = self.budget_exhausted_result()
+                send_verdict(result.classification)
+                return result
+
+            chunk_results = []
+            chunk_verdicts = []
+            refused = False
+            for i, chunk in enumerate(chunks, start=1):
+                messages = self.messages(chunk, user_query)
+                reservation = self.reserve_call(messages, chunk=chunk)
+                if reservation is None:
+                    refused = True
+                    break
+                parser = VerdictParser()
+                usage_fragment = None
+                try:
+                    for fragment in self.llm.stream(messages, response_format=RESPONSE_FORMAT):
+                        if getattr(fragment, "usage_metadata", None):
+                            # Sent with the last fragment of the stream
+                            usage_fragment = fragment
+                        if parser.verdict is None and parser.feed(fragment.content) is not None:
+                            chunk_verdicts.append(parser.verdict)
+                            if parser.verdict == "ERROR" or len(chunk_verdicts) == len(chunks):
+                                send_verdict(max(chunk_verdicts, key=lambda x: RELEVANCE_PRIORITY.index(x) if x in RELEVANCE_PRIORITY else -1))
+                        elif parser.verdict is not None:
+                            parser.buffer += fragment.content
+                finally:
+                    self.record_usage(usage_fragment, reservation)
+
+                result = self.parse_result(parser.buffer)
+                if result is None:
+                    logger.error("Classifier output of chunk %s could not be parsed or repaired.", i)
+                    continue
+                chunk_results.append(result)
+
+            if chunk_results:
+                result = self.combine_chunk_results(chunk_results)
+            elif refused:
+                result = self.budget_exhausted_result()
+            else:
+                self._count("failed")
+                result = error_result("Classifier output could not be parsed")
+            # The verdict field was not recognised while streaming (e.g. a repaired response)
+            send_verdict(result.classification)
+            return result
 
         except Exception as e:
-            logging.error(f"Error in evaluate_document: {e}")
-            return None
-        
-        
\ No newline at end of file
+            logger.error("Error in classify_document_stream: %s", e)
+            self._count("failed")
+            result = error_result(f"Classification failed: {e.__class__.__name__}")
+            send_verdict(result.classification)
+            return result
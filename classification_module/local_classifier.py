@@ -0,0 +1,279 @@
+import os
+import re
+import logging
+import argparse
+import threading
+import joblib
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import GroupShuffleSplit, train_test_split
+from rich.console import Console
+from rich.table import Table
+from utils.logging_setup import setup_logging
+from classification_module.LLM_classification import ClassificationResult
+
+logger = logging.getLogger(__name__)
+
+console = Console()
+
+LOCAL_MODEL_PATH = os.path.join("OUTPUT", "local_classifier.joblib")
+LABELS = ["Irrelevant", "Relevant"]
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+class LocalClassifier:
+    """
+    CPU-only relevance classifier: hashed word n-grams of the document and of the query terms it contains,
+    plus a few query-overlap features, fed to logistic regression.
+    """
+
+    def __init__(self, n_features=2 ** 16, max_chars=20000, C=1.0):
+        """
+        :param n_features: Size of each hashed feature space
+        :param max_chars: Number of leading document characters used for features
+        :param C: Inverse regularization strength of the logistic regression
+        """
+        self.n_features = n_features
+        self.max_chars = max_chars
+        self.document_vectorizer = HashingVectorizer(n_features=n_features, ngram_range=(1, 2), alternate_sign=False, norm="l2")
+        self.overlap_vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False, norm="l2")
+        self.model = LogisticRegression(C=C, class_weight="balanced", max_iter=1000)
+
+    def query_overlap(self, document_text, user_query):
+        """
+        :return: Tuple (overlapping query terms joined by spaces, list of dense overlap features)
+        """
+        query_terms = set(TOKEN_PATTERN.findall(user_query.lower()))
+        document_terms = TOKEN_PATTERN.findall(document_text.lower())
+        head_terms = set(document_terms[:300])
+        document_terms = set(document_terms)
+        shared = query_terms & document_terms
+        size = max(1, len(query_terms))
+        return " ".join(sorted(shared)), [len(shared) / size, len(query_terms & head_terms) / size]
+
+    def features(self, document_texts, user_queries):
+        """
+        :param document_texts: List of document texts
+        :param user_queries: List of queries, one per document
+        :return: Sparse feature matrix
+        """
+        texts = [text[:self.max_chars] for text in document_texts]
+        overlaps, dense = zip(*(self.query_overlap(text, query) for text, query in zip(texts, user_queries)))
+        return sparse.hstack([
+            self.document_vectorizer.transform(texts),
+            self.overlap_vectorizer.transform(overlaps),
+            sparse.csr_matrix(np.asarray(dense, dtype=np.float64)),
+        ]).tocsr()
+
+    def fit(self, document_texts, user_queries, labels):
+        """
+        Trains the model.
+
+        :param labels: List of "Relevant"/"Irrelevant" verdicts
+        """
+        y = np.asarray([LABELS.index(label) for label in labels])
+        self.model.fit(self.features(document_texts, user_queries), y)
+        return self
+
+    def predict_proba(self, document_texts, user_queries):
+        """
+        :return: Array with the probability of "Relevant" for every document
+        """
+        return self.model.predict_proba(self.features(document_texts, user_queries))[:, 1]
+
+    def save(self, path=LOCAL_MODEL_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        joblib.dump(self, path, compress=3)
+        logger.info("Local classifier saved to: %s", path)
+
+    @classmethod
+    def load(cls, path=LOCAL_MODEL_PATH):
+        return joblib.load(path)
+
+
+class CascadeClassifier:
+    """
+    Puts a LocalClassifier in front of the LLM classifier.
+    Confident local predictions are accepted, everything else is sent to the LLM.
+    Exposes the same classify_document interface as OpenAI.
+    """
+
+    def __init__(self, llm_classifier, local_classifier, threshold=0.9):
+        """
+        :param llm_classifier: Instance of OpenAI
+        :param local_classifier: Trained LocalClassifier
+        :param threshold: Minimum probability of the predicted class for a local prediction to be accepted
+        """
+        self.llm_classifier = llm_classifier
+        self.local_classifier = local_classifier
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.stats = {"local": 0, "llm": 0}
+
+    def __getattr__(self, name):
+        # Everything not overridden here is served by the LLM classifier
+        return getattr(self.llm_classifier, name)
+
+    def local_result(self, document_text, user_query):
+        """
+        :return: ClassificationResult if the local prediction is confident, otherwise None
+        """
+        probability = float(self.local_classifier.predict_proba([document_text], [user_query])[0])
+        confidence = max(probability, 1 - probability)
+        if confidence < self.threshold:
+            return None
+        first_line = next((line.strip("# ").strip() for line in document_text.splitlines() if line.strip()), "")
+        return ClassificationResult(
+            classification=LABELS[int(probability >= 0.5)],
+            explanation=f"Local classifier confidence {confidence:.2f}",
+            summary=first_line[:200],
+            verdict_source="local",
+        )
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def classify_document(self, document_text, user_query, chunks=None):
+        """Same as OpenAI.classify_document, answered locally when the prediction is confident."""
+        result = self.local_result(document_text, user_query)
+        if result is not None:
+            self._count("local")
+            return result
+        self._count("llm")
+        return self.llm_classifier.classify_document(document_text, user_query, chunks=chunks)
+
+    def classify_document_stream(self, document_text, user_query, on_verdict=None, chunks=None):
+        """Same as OpenAI.classify_document_stream, answered locally when the prediction is confident."""
+        result = self.local_result(document_text, user_query)
+        if result is not None:
+            self._count("local")
+            if on_verdict is not None:
+                on_verdict(result.classification, 0.0)
+            return result
+        self._count("llm")
+        return self.llm_classifier.classify_document_stream(document_text, user_query, on_verdict=on_verdict, chunks=chunks)
+
+    def classify_document_multi(self, document_text, user_queries, chunks=None):
+        """Same as OpenAI.classify_document_multi; only the queries without a confident local prediction are sent to the LLM."""
+        results = [self.local_result(document_text, user_query) for user_query in user_queries]
+        remaining = [i for i, result in enumerate(results) if result is None]
+        with self._lock:
+            self.stats["local"] += len(results) - len(remaining)
+            self.stats["llm"] += len(remaining)
+        if remaining:
+            llm_results = self.llm_classifier.classify_document_multi(document_text, [user_queries[i] for i in remaining], chunks=chunks)
+            for i, result in zip(remaining, llm_results):
+                results[i] = result
+        return results
+
+    def cascade_report(self):
+        """
+        :return: Dictionary with local and LLM classification counts and the share of avoided LLM calls
+        """
+        with self._lock:
+            stats = dict(self.stats)
+        total = stats["local"] + stats["llm"]
+        return {**stats, "threshold": self.threshold, "llm_call_reduction": stats["local"] / total if total else 0.0}
+
+
+def load_training_data(database_handler, collection_names=None):
+    """
+    Collects LLM verdicts stored by MongoDB.save_document, with the search query stored on each record.
+    Verdicts of the local classifier and verdicts reused from an earlier run are left out, so the model does not
+    learn from its own output. Records written before verdict_source and search_query were stored are skipped.
+
+    :param database_handler: Instance of MongoDB pointing at the database with crawl collections
+    :param collection_names: Collections to use, defaults to every crawl collection (see ResultsQuery.crawl_collections)
+    :return: Tuple (document_texts, user_queries, labels)
+    """
+    if collection_names is None:
+        from database_module.results_query import ResultsQuery
+        collection_names = ResultsQuery(database_handler).crawl_collections()
+
+    document_texts, user_queries, labels = [], [], []
+    for collection_name in collection_names:
+        query = {"classification": {"$in": LABELS}, "verdict_source": "llm", "search_query": {"$type": "string"}}
+        for document in database_handler.find_documents(query, collection_name=collection_name):
+            if document.get("markdown"):
+                document_texts.append(document["markdown"])
+                user_queries.append(document["search_query"])
+                labels.append(document["classification"])
+    logger.info("Loaded %s labelled documents from %s collections", len(labels), len(collection_names))
+    return document_texts, user_queries, labels
+
+
+def evaluate(document_texts, user_queries, labels, thresholds=(0.6, 0.7, 0.8, 0.9, 0.95), test_size=0.2, seed=42):
+    """
+    Trains on one split and reports cascade behaviour on held-out data.
+    Documents of one query stay in the same split when several queries are available.
+
+    :return: List of dictionaries (threshold, llm_call_reduction, agreement, cascade_accuracy), one per threshold
+    """
+    indices = np.arange(len(labels))
+    if len(set(user_queries)) > 1:
+        splitter = GroupShuffleSplit(n_splits=1, test_size=test_size, random_state=seed)
+        train_idx, test_idx = next(splitter.split(indices, groups=user_queries))
+    else:
+        train_idx, test_idx = train_test_split(indices, test_size=test_size, random_state=seed, stratify=labels)
+
+    pick = lambda values, idx: [values[i] for i in idx]
+    classifier = LocalClassifier().fit(pick(document_texts, train_idx), pick(user_queries, train_idx), pick(labels, train_idx))
+    probabilities = classifier.predict_proba(pick(document_texts, test_idx), pick(user_queries, test_idx))
+    predicted = np.where(probabilities >= 0.5, "Relevant", "Irrelevant")
+    confidence = np.maximum(probabilities, 1 - probabilities)
+    truth = np.asarray(pick(labels, test_idx))
+
+    report = []
+    for threshold in thresholds:
+        confident = confidence >= threshold
+        agreement = float((predicted[confident] == truth[confident]).mean()) if confident.any() else None
+        report.append({
+            "threshold": threshold,
+            "llm_call_reduction": float(confident.mean()),
+            "agreement": agreement,
+            # Uncertain documents go to the LLM, whose verdict is the reference
+            "cascade_accuracy": float(((predicted == truth) | ~confident).mean()),
+        })
+    return report
+
+
+def main():
+    """
+    Offline training and evaluation:
+        python -m classification_module.local_classifier evaluate --database default_db
+        python -m classification_module.local_classifier train --database default_db
+    """
+    from database_module.mongoDB import MongoDB
+
+    parser = argparse.ArgumentParser(description="Train or evaluate the local relevance classifier on stored LLM verdicts.")
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument("--database", default="default_db")
+    parser.add_argument("--collections", nargs="*", default=None)
+    parser.add_argument("--output", default=LOCAL_MODEL_PATH)
+    args = parser.parse_args()
+
+    database_handler = MongoDB(database_name=args.database)
+    document_texts, user_queries, labels = load_training_data(database_handler, args.collections)
+    if len(set(labels)) < 2:
+        console.print("[bold red]Both Relevant and Irrelevant verdicts are needed for training.[/]")
+        return
+
+    if args.command == "train":
+        LocalClassifier().fit(document_texts, user_queries, labels).save(args.output)
+        console.print(f"[bold green]Local classifier trained on {len(labels)} documents and saved to {args.output}[/]")
+    else:
+        table = Table(title=f"Cascade evaluation on held-out data ({len(labels)} documents)")
+        for column in ("Threshold", "LLM-call reduction", "Agreement with LLM", "Cascade accuracy"):
+            table.add_column(column)
+        for row in evaluate(document_texts, user_queries, labels):
+            agreement = f"{row['agreement']:.1%}" if row["agreement"] is not None else "-"
+            table.add_row(f"{row['threshold']:.2f}", f"{row['llm_call_reduction']:.1%}", agreement, f"{row['cascade_accuracy']:.1%}")
+        console.print(table)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
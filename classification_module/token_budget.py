@@ -0,0 +1,144 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBudget:
+    """
+    Per-document and per-run token ceilings for LLM classification.
+
+    Every LLM call reserves its estimated input tokens (counted with tiktoken before the call) plus the maximum
+    number of output tokens. The reservation is replaced by the usage reported with the response, so concurrent
+    calls can never overshoot the run ceiling by more than the estimation error.
+
+    As the run budget runs low the classifier degrades instead of stopping:
+    - "ok": documents are classified chunk by chunk up to the per-document ceiling
+    - "low": only the first chunk of a document is classified and links are no longer expanded to deeper levels
+    - "exhausted": no further LLM calls are made; documents are reported as ERROR
+    """
+
+    def __init__(self, per_document=None, per_run=None, low_fraction=0.2):
+        """
+        :param per_document: Maximum input + output tokens spent on one document, or None for no limit
+        :param per_run: Maximum input + output tokens spent in the whole run, or None for no limit
+        :param low_fraction: Share of the run budget left at which the budget is considered low
+        """
+        self.per_document = per_document
+        self.per_run = per_run
+        self.low_fraction = low_fraction
+        self._lock = threading.Lock()
+        self.used = {"input_tokens": 0, "output_tokens": 0}
+        self.reserved = 0
+        self.stats = {"truncated_documents": 0, "skipped_chunks": 0, "refused_calls": 0}
+
+    def remaining(self):
+        """
+        :return: Tokens left in the run budget (reservations included), None if the run is unlimited
+        """
+        with self._lock:
+            return self._remaining()
+
+    def _remaining(self):
+        # Called with the lock held
+        if self.per_run is None:
+            return None
+        return max(0, self.per_run - self.used["input_tokens"] - self.used["output_tokens"] - self.reserved)
+
+    def state(self):
+        """
+        :return: "ok", "low" or "exhausted"
+        """
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        # Called with the lock held
+        remaining = self._remaining()
+        if remaining is None:
+            return "ok"
+        if remaining <= 0:
+            return "exhausted"
+        return "low" if remaining < self.low_fraction * self.per_run else "ok"
+
+    def plan(self, chunk_tokens, call_overhead, output_tokens):
+        """
+        Decides how much of a document is sent to the LLM.
+
+        :param chunk_tokens: Estimated tokens of each chunk
+        :param call_overhead: Tokens sent with every call besides the chunk (prompt and query)
+        :param output_tokens: Maximum output tokens of one call
+        :return: Tuple (number of chunks to classify, token limit of the last of them or None if it is sent whole)
+        """
+        with self._lock:
+            state = self._state()
+        if state == "exhausted" or not chunk_tokens:
+            return 0, None
+        count = 1 if state == "low" else len(chunk_tokens)
+        if self.per_document is not None:
+            spent = 0
+            for i, tokens in enumerate(chunk_tokens[:count]):
+                cost = call_overhead + tokens + output_tokens
+                if spent + cost > self.per_document:
+                    # The first chunk is cut to the ceiling rather than skipped, so every document gets a verdict
+                    count = i if i else 1
+                    break
+                spent += cost
+        limit = None
+        if self.per_document is not None and call_overhead + chunk_tokens[0] + output_tokens > self.per_document:
+            limit = max(0, self.per_document - call_overhead - output_tokens)
+        if count < len(chunk_tokens) or limit is not None:
+            with self._lock:
+                self.stats["truncated_documents"] += 1
+                self.stats["skipped_chunks"] += len(chunk_tokens) - count
+            logger.info("Token budget (%s): classifying %s of %s chunks%s", state, count, len(chunk_tokens),
+                        f", first chunk cut to {limit} tokens" if limit is not None else "")
+        return count, limit
+
+    def reserve(self, tokens):
+        """
+        Reserves tokens for one LLM call.
+
+        :param tokens: Estimated input tokens plus maximum output tokens of the call
+        :return: The reservation to pass to settle(), or None if the run budget does not allow the call
+        """
+        with self._lock:
+            remaining = self._remaining()
+            if remaining is not None and tokens > remaining:
+                self.stats["refused_calls"] += 1
+                return None
+            self.reserved += tokens
+            return tokens
+
+    def settle(self, reservation, input_tokens, output_tokens):
+        """
+        Replaces a reservation with the usage reported by the response.
+
+        :param reservation: Value returned by reserve()
+        :param input_tokens: Input tokens reported with the response
+        :param output_tokens: Output tokens reported with the response
+        """
+        with self._lock:
+            self.reserved -= reservation
+            self.used["input_tokens"] += input_tokens
+            self.used["output_tokens"] += output_tokens
+
+    def allows_expansion(self):
+        """
+        :return: False once the budget is low, so no deeper levels are added to the crawl
+        """
+        return self.state() == "ok"
+
+    def report(self):
+        """
+        :return: Dictionary with the ceilings, used and remaining tokens, the state and the degradation counters
+        """
+        with self._lock:
+            return {
+                "per_document": self.per_document,
+                "per_run": self.per_run,
+                **self.used,
+                "remaining": self._remaining(),
+                "state": self._state(),
+                **self.stats,
+            }
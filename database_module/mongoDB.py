@@ -1,25 +1,46 @@
 
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
+from pymongo.errors import DuplicateKeyError
+from bson.binary import Binary
+import gridfs
+import zstandard
 import os
+import json
+import time
+import hashlib
 import logging
+import threading
 from dotenv import load_dotenv
 from rich.console import Console
+from rich.table import Table
+from utils.logging_setup import setup_logging
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("search_log.log", mode='a', encoding='utf-8'), 
-    ]
-)
 
 logger = logging.getLogger(__name__)
 console = Console()
 
+# Fields kept in the per-query collection when compressed storage is enabled: the URL, its level, the verdict and
+# the validators used for conditional requests by an incremental re-crawl
+RECORD_FIELDS = ("url", "level", "classification", "explanation", "summary", "verdict_source", "search_query", "etag", "last_modified")
+# Page body fields moved to the blob collection, keyed by the hash of the markdown
+BODY_FIELDS = ("markdown",)
+# Fields stored zstd-compressed in the "page" field of the record. They belong to the URL, not to the content:
+# pages with the same markdown can link differently and carry their own status code and title
+PAGE_FIELDS = ("links", "metadata")
+
+
 class MongoDB:
 
-    def __init__(self, database_name="default_db", collection_name="default_collection"):
+    def __init__(self, database_name="default_db", collection_name="default_collection", compressed=False, blob_collection_name="blobs", compression_level=3, gridfs_threshold=8 * 1024 * 1024):
+        """
+        :param database_name: Name of the database to connect to
+        :param collection_name: Name of the per-query collection
+        :param compressed: If True, page bodies are stored zstd-compressed and deduplicated in the blob collection
+        :param blob_collection_name: Name of the content-hash-keyed blob collection
+        :param compression_level: zstd compression level
+        :param gridfs_threshold: Compressed size in bytes above which the body is stored in GridFS instead of a blob document
+        """
         load_dotenv()
         self.MONGO_DB_URI = os.getenv("MONGO_DB_URI")
         if not self.MONGO_DB_URI:
@@ -29,27 +50,168 @@ class MongoDB:
         try:
             # Connecting to the database
             self.client = MongoClient(self.MONGO_DB_URI, server_api=ServerApi('1')) # specifies the MongoDB Server API version - Compatibility ensured
-            self.database = self.client[database_name]
-            self.collection = self.database[collection_name]
-            logger.info(f"Connected to MongoDB database: {database_name}, collection: {collection_name}")
+            self.compressed = compressed
+            self.blob_collection_name = blob_collection_name
+            self.compression_level = compression_level
+            self.gridfs_threshold = gridfs_threshold
+            self._codec = threading.local()  # zstd (de)compressors are not thread-safe
+            self._stats_lock = threading.Lock()
+            self.dedup_stats = {"stored": 0, "deduplicated": 0}
+            self.set_database(database_name)
+            self.set_collection(collection_name)
+            logger.info("Connected to MongoDB database: %s, collection: %s", database_name, collection_name)
         except Exception as e:
-            logger.error(f"Unexpected error during MongoDB initialization: {e}")
+            logger.error("Unexpected error during MongoDB initialization: %s", e)
             raise
 
 
-    def save_document(self, document):
+    def save_document(self, document, upsert=False):
         """
         Saves a single document to the collection.
 
         :param document: A dictionary representing the document to be saved.
+        :param upsert: If True, an existing document with the same url is replaced, so repeated saves are idempotent.
         """
         try:
-            self.collection.insert_one(document)
+            if self.compressed:
+                document = self.store_body(document)
+            if upsert:
+                self.collection.replace_one({"url": document.get("url")}, document, upsert=True)
+            else:
+                self.collection.insert_one(document)
             logger.info("Document saved successfully.")
         except Exception as e:
-            logger.error(f"Error saving document: {e}")
+            logger.error("Error saving document: %s", e)
             raise
 
+    def content_hash(self, markdown):
+        """
+        Computes the key under which a page body is stored in the blob collection.
+
+        :param markdown: Markdown content of the page
+        :return: Hex SHA-256 digest of the markdown
+        """
+        return hashlib.sha256((markdown or "").encode("utf-8")).hexdigest()
+
+    def store_body(self, document):
+        """
+        Moves the page body of a document into the blob collection and returns the small record that replaces it.
+
+        :param document: Full document as produced by the extractor
+        :return: Record with url, level, the verdict and its source, the search query, validators, content_hash and
+                 the compressed links and metadata
+        :note:
+        - The body is keyed by the hash of its markdown, so a page crawled for several queries is stored once.
+        - Links and metadata are not covered by the hash; they are compressed into the "page" field of the record.
+        - Bodies whose compressed size exceeds gridfs_threshold are written to GridFS.
+        """
+        content_hash = self.content_hash(document.get("markdown"))
+        record = {field: document.get(field) for field in RECORD_FIELDS}
+        record["content_hash"] = content_hash
+        page = {field: document.get(field) for field in PAGE_FIELDS}
+        record["page"] = Binary(self._compressor().compress(json.dumps(page, ensure_ascii=False, default=str).encode("utf-8")))
+
+        if self.blobs.find_one({"_id": content_hash}, {"_id": 1}) is not None:
+            self._count("deduplicated")
+            return record
+
+        body = {field: document.get(field) for field in BODY_FIELDS}
+        raw = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+        compressed = self._compressor().compress(raw)
+        blob = {"_id": content_hash, "codec": "zstd", "raw_size": len(raw), "size": len(compressed)}
+
+        try:
+            if len(compressed) > self.gridfs_threshold:
+                if not self.gridfs.exists(content_hash):
+                    self.gridfs.put(compressed, _id=content_hash)
+                blob["gridfs"] = True
+            else:
+                blob["data"] = Binary(compressed)
+            self.blobs.insert_one(blob)
+        except (DuplicateKeyError, gridfs.errors.FileExists):
+            # Another writer stored the same body in the meantime
+            self._count("deduplicated")
+            return record
+        self._count("stored")
+        return record
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.dedup_stats[key] += 1
+
+    def load_body(self, content_hash):
+        """
+        Loads and decompresses a page body from the blob collection.
+
+        :param content_hash: Key of the body
+        :return: Dictionary with the markdown (and links and metadata for blobs written before they moved out of the blob),
+                 or None if the blob does not exist
+        """
+        blob = self.blobs.find_one({"_id": content_hash})
+        if blob is None:
+            logger.warning("Blob %s not found.", content_hash)
+            return None
+        compressed = self.gridfs.get(content_hash).read() if blob.get("gridfs") else blob["data"]
+        return json.loads(self._decompressor().decompress(compressed))
+
+    def hydrate(self, record, load_body=True):
+        """
+        Returns the full document for a stored record, decompressing the links, metadata and page body if they were
+        stored compressed.
+
+        :param record: Document read from a per-query collection
+        :param load_body: If False, only the links and metadata are decompressed, not the markdown
+        :return: Document with markdown, links and metadata filled in
+        """
+        if record is None:
+            return record
+        if "page" in record:
+            record = dict(record)
+            record.update(json.loads(self._decompressor().decompress(record.pop("page"))))
+        if not load_body or "content_hash" not in record or "markdown" in record:
+            return record
+        body = self.load_body(record["content_hash"]) or {}
+        # Fields of the record win; blobs written before links and metadata moved out of them still fill them in
+        # for older records, which lack the fields
+        return {**body, **record}
+
+    def find_documents(self, query=None, projection=None, collection_name=None):
+        """
+        Iterates over documents of a collection, transparently decompressing page bodies.
+
+        :param query: MongoDB filter
+        :param projection: Optional projection; bodies are only loaded when the projection allows them
+        :param collection_name: Collection to read from, defaults to the current collection
+        :return: Generator of documents
+        """
+        collection = self.db[collection_name] if collection_name else self.collection
+        wants_body = projection is None or any(projection.get(field) for field in BODY_FIELDS)
+        if projection is not None and any(projection.get(field) for field in PAGE_FIELDS):
+            projection = {**projection, "page": 1}
+        for record in collection.find(query or {}, projection):
+            yield self.hydrate(record, load_body=wants_body)
+
+    def find_document(self, url, collection_name=None):
+        """
+        Loads the stored document of a single URL.
+
+        :param url: URL of the document
+        :param collection_name: Collection to read from, defaults to the current collection
+        :return: Full document or None
+        """
+        collection = self.db[collection_name] if collection_name else self.collection
+        return self.hydrate(collection.find_one({"url": url}))
+
+    def _compressor(self):
+        if not hasattr(self._codec, "compressor"):
+            self._codec.compressor = zstandard.ZstdCompressor(level=self.compression_level)
+        return self._codec.compressor
+
+    def _decompressor(self):
+        if not hasattr(self._codec, "decompressor"):
+            self._codec.decompressor = zstandard.ZstdDecompressor()
+        return self._codec.decompressor
+
 
 
     def show_database(self):
@@ -64,15 +226,71 @@ class MongoDB:
                 for collection_name in collections:
                     console.print(f"[purple]  -- {collection_name}[/]")
         except Exception as e:
-            logger.error(f"Error showing databases and collections: {e}")
+            logger.error("Error showing databases and collections: %s", e)
             raise
 
     def set_database(self, database_name):
         """Changes the currently used database."""
         self.database_name = database_name
         self.db = self.client[database_name]
+        self.database = self.db
+        self.blobs = self.db[self.blob_collection_name]
+        self.gridfs = gridfs.GridFS(self.db, collection=f"{self.blob_collection_name}_fs")
 
     def set_collection(self, collection_name):
         """Changes the currently used collection."""
         self.collection_name = collection_name
         self.collection = self.db[collection_name]
+
+
+def benchmark_storage(num_documents=500, queries=10, database_name="storage_benchmark"):
+    """
+    Compares inline and compressed storage on a synthetic corpus.
+    Every page is saved once per query, as happens when several queries crawl the same URLs.
+
+    :param num_documents: Number of distinct pages
+    :param queries: Number of queries (collections) each page is saved to
+    :param database_name: Scratch database, dropped at the end
+    """
+    paragraph = "Solar panels convert sunlight into electricity and reduce energy costs for households. "
+    pages = [{
+        "url": f"https://example.com/page/{i}",
+        "markdown": f"# Page {i}\n\n" + paragraph * (200 + i % 50),
+        "links": [f"https://example.com/page/{i}/link/{j}" for j in range(150)],
+        "metadata": {"url": f"https://example.com/page/{i}", "statusCode": 200, "title": f"Page {i}"},
+        "level": i % 3,
+        "classification": "Relevant" if i % 2 else "Irrelevant",
+        "summary": "Explains benefits of solar energy.",
+    } for i in range(num_documents)]
+
+    table = Table(title=f"Storage benchmark: {num_documents} pages x {queries} queries")
+    for column in ("Mode", "Data bytes", "Storage bytes", "Inserts/sec"):
+        table.add_column(column)
+
+    for compressed in (False, True):
+        handler = MongoDB(database_name=database_name, compressed=compressed)
+        handler.client.drop_database(database_name)
+        handler.set_database(database_name)
+
+        start = time.perf_counter()
+        for q in range(queries):
+            handler.set_collection(f"query_{q}")
+            for page in pages:
+                handler.save_document(dict(page))
+        elapsed = time.perf_counter() - start
+
+        data_bytes = storage_bytes = 0
+        for name in handler.db.list_collection_names():
+            stats = handler.db.command("collstats", name)
+            data_bytes += stats.get("size", 0)
+            storage_bytes += stats.get("storageSize", 0)
+
+        table.add_row("compressed" if compressed else "inline", f"{data_bytes:,}", f"{storage_bytes:,}", f"{num_documents * queries / elapsed:,.0f}")
+        handler.client.drop_database(database_name)
+
+    console.print(table)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    benchmark_storage()
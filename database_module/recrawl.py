@@ -0,0 +1,138 @@
+import logging
+import threading
+
+import requests
+
+from classification_module.LLM_classification import ClassificationResult
+
+logger = logging.getLogger(__name__)
+
+# Firecrawl metadata keys (lower-cased) that carry the HTTP validators or an equivalent meta tag
+VALIDATOR_KEYS = {
+    "etag": ("etag",),
+    "last_modified": ("last-modified", "last_modified", "lastmodified", "article:modified_time", "og:updated_time"),
+}
+# Fields of the previous record needed to decide whether a page changed
+PREVIOUS_FIELDS = {"url": 1, "classification": 1, "explanation": 1, "summary": 1, "content_hash": 1, "etag": 1, "last_modified": 1}
+
+
+def validators(metadata):
+    """
+    :param metadata: Firecrawl metadata of a page
+    :return: Dictionary with etag and last_modified, None where the page did not report them
+    """
+    lowered = {str(key).lower(): value for key, value in (metadata or {}).items()}
+    found = {}
+    for field, keys in VALIDATOR_KEYS.items():
+        value = next((lowered[key] for key in keys if lowered.get(key)), None)
+        # Meta tags may repeat and arrive as lists
+        found[field] = value[0] if isinstance(value, list) else value
+    return found
+
+
+class IncrementalRecrawl:
+    """
+    Re-crawl of a query whose collection already holds the records of an earlier run.
+
+    The previous record of every URL (content hash, validators and verdict) is read from the target collection.
+    If it has an ETag or Last-Modified value, a conditional GET is sent to the site; on 304 Not Modified the stored
+    page is used and the extraction is skipped. Otherwise the page is extracted, and if its content hash equals the
+    stored one, the stored verdict is reused instead of calling the LLM. Only new and changed pages are classified.
+    """
+
+    def __init__(self, database_handler, conditional_requests=True, timeout=10):
+        """
+        :param database_handler: Instance of MongoDB pointing at the target collection
+        :param conditional_requests: If True, pages with stored validators are checked with a conditional GET before extraction
+        :param timeout: Timeout in seconds of a conditional GET
+        """
+        self.database_handler = database_handler
+        self.conditional_requests = conditional_requests
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._stats = {"fetched": 0, "not_modified": 0, "unchanged": 0, "changed": 0, "new": 0}
+
+    def previous(self, url):
+        """
+        :param url: URL of the page
+        :return: Most recent record of the URL in the target collection (without the page body), or None
+        """
+        return self.database_handler.collection.find_one({"url": url}, PREVIOUS_FIELDS, sort=[("_id", -1)])
+
+    def not_modified(self, url, previous):
+        """
+        Asks the site whether the page changed since the previous run.
+
+        :param url: URL of the page
+        :param previous: Record returned by previous()
+        :return: True only if the site answered 304 Not Modified; False without validators or on any error
+        """
+        headers = {}
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+        if not self.conditional_requests or not headers:
+            return False
+        try:
+            # The body of a changed page is not downloaded here; the extractor fetches it
+            with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                return response.status_code == 304
+        except requests.RequestException as e:
+            logger.debug("Conditional request for %s failed: %s", url, e)
+            return False
+
+    def extract(self, extractor, url, level, previous):
+        """
+        Returns the stored page if the site reports it unchanged, otherwise extracts it.
+
+        :param extractor: Extractor of the run
+        :param previous: Record returned by previous(), or None
+        :return: Tuple (document, status_code), as returned by the extractor
+        """
+        if previous is not None and self.not_modified(url, previous):
+            document = self.database_handler.find_document(url)
+            if document and document.get("markdown"):
+                self._count("not_modified")
+                logger.info("Not modified since the last run: %s", url, extra={"url": url, "level": level, "stage": "extraction"})
+                document.pop("_id", None)
+                return {**document, "level": level}, 200
+        self._count("fetched")
+        return extractor.extract_text_from_url(url, level)
+
+    def reuse(self, previous, content_hash):
+        """
+        :param previous: Record returned by previous(), or None
+        :param content_hash: Content hash of the page in this run
+        :return: The stored ClassificationResult if the content did not change and was classified, otherwise None
+        """
+        if previous is None:
+            self._count("new")
+            return None
+        if previous.get("content_hash") != content_hash or previous.get("classification") not in ("Relevant", "Irrelevant"):
+            self._count("changed")
+            return None
+        self._count("unchanged")
+        return ClassificationResult(classification=previous["classification"],
+                                    explanation=previous.get("explanation") or "Unchanged since the last run",
+                                    summary=previous.get("summary") or "",
+                                    verdict_source="reused")
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def report(self):
+        """
+        :return: Dictionary with the number of pages fetched, not modified (stored page used without a fetch), unchanged,
+                 changed and new, and the number of reused verdicts
+        """
+        with self._lock:
+            report = dict(self._stats)
+        # A page answered with 304 counts as unchanged as well, since its content hash matches
+        report["reused"] = report["unchanged"]
+        return report
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,195 @@
+import logging
+import pymongo
+from rich.console import Console
+
+from database_module.mongoDB import MongoDB
+from database_module.work_queue import QUEUE_COLLECTION_SUFFIXES
+from utils.logging_setup import setup_logging
+
+
+logger = logging.getLogger(__name__)
+console = Console()
+
+# Fields returned by default - page bodies are never loaded unless asked for
+DEFAULT_PROJECTION = {"url": 1, "level": 1, "classification": 1, "summary": 1, "content_hash": 1}
+
+
+class ResultsQuery:
+
+    def __init__(self, database_handler, page_size=50, batch_size=1000):
+        """
+        :param database_handler: Instance of MongoDB pointing at the database with crawl collections
+        :param page_size: Default number of documents per page
+        :param batch_size: Cursor batch size used when streaming
+        """
+        self.database_handler = database_handler
+        self.page_size = page_size
+        self.batch_size = batch_size
+
+    def _collection(self, collection_name=None):
+        if collection_name:
+            return self.database_handler.db[collection_name]
+        return self.database_handler.collection
+
+    def ensure_indexes(self, collection_name=None):
+        """
+        Creates the indexes used by the queries of this module. Safe to call repeatedly.
+
+        :param collection_name: Collection to index, defaults to the current collection
+        """
+        collection = self._collection(collection_name)
+        try:
+            collection.create_index([("url", pymongo.ASCENDING)])
+            # relevant_documents filters on the classification and pages on _id; no query filters on classification and level
+            collection.create_index([("classification", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)])
+            if "classification_1_level_1__id_1" in collection.index_information():
+                collection.drop_index("classification_1_level_1__id_1")
+            collection.create_index([("level", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)])
+            collection.create_index([("content_hash", pymongo.ASCENDING)], sparse=True)
+            collection.create_index([("summary", pymongo.TEXT)])
+            logger.info("Indexes ensured for collection: %s", collection.name)
+        except Exception as e:
+            logger.error("Error creating indexes: %s", e)
+            raise
+
+    def crawl_collections(self):
+        """
+        Lists the collections of the current database that hold crawl results.
+
+        :return: List of collection names (blob, GridFS, work queue and system collections excluded)
+        """
+        blob_name = self.database_handler.blob_collection_name
+        return [
+            name for name in self.database_handler.db.list_collection_names()
+            if name != blob_name and not name.startswith(f"{blob_name}_fs.") and not name.startswith("system.")
+            and not name.endswith(QUEUE_COLLECTION_SUFFIXES)
+        ]
+
+    def _page(self, query, collection_name, after_id, page_size, projection):
+        """
+        Returns one page using keyset pagination on _id, so the cost of a page does not depend on its position.
+
+        :return: A tuple (documents, next_after_id); next_after_id is None on the last page
+        """
+        page_size = page_size or self.page_size
+        if after_id is not None:
+            query = {**query, "_id": {"$gt": after_id}}
+        cursor = self._collection(collection_name).find(query, projection).sort("_id", pymongo.ASCENDING).limit(page_size + 1)
+        documents = list(cursor)
+        if len(documents) > page_size:
+            documents = documents[:page_size]
+            return documents, documents[-1]["_id"]
+        return documents, None
+
+    def relevant_documents(self, collection_name=None, after_id=None, page_size=None, projection=DEFAULT_PROJECTION):
+        """
+        Returns a page of documents classified as Relevant.
+
+        :param collection_name: Collection (query) to read, defaults to the current collection
+        :param after_id: _id returned as next_after_id by the previous page, None for the first page
+        :param page_size: Number of documents per page
+        :param projection: Fields to return
+        :return: A tuple (documents, next_after_id)
+        """
+        return self._page({"classification": "Relevant"}, collection_name, after_id, page_size, projection)
+
+    def documents_by_level(self, level, collection_name=None, after_id=None, page_size=None, projection=DEFAULT_PROJECTION):
+        """
+        Returns a page of documents found at the given depth level.
+
+        :param level: Depth level
+        :return: A tuple (documents, next_after_id)
+        """
+        return self._page({"level": level}, collection_name, after_id, page_size, projection)
+
+    def search_summaries(self, text, collection_name=None, after=None, page_size=None, projection=DEFAULT_PROJECTION):
+        """
+        Full-text search over document summaries, ordered by text score, then _id.
+
+        :param text: Search terms
+        :param after: (score, _id) tuple returned as next_after by the previous page, None for the first page
+        :param page_size: Number of documents per page
+        :return: A tuple (documents with their score, next_after); next_after is None on the last page
+        :note: Keyset pagination on (score, _id): the text score is not available to a find filter, so the page is
+               selected in an aggregation. Later pages skip nothing and keep only page_size + 1 documents in the sort.
+        """
+        page_size = page_size or self.page_size
+        pipeline = [
+            {"$match": {"$text": {"$search": text}}},
+            {"$addFields": {"score": {"$meta": "textScore"}}},
+        ]
+        if after is not None:
+            score, after_id = after
+            pipeline.append({"$match": {"$or": [{"score": {"$lt": score}}, {"score": score, "_id": {"$gt": after_id}}]}})
+        pipeline += [
+            {"$sort": {"score": pymongo.DESCENDING, "_id": pymongo.ASCENDING}},
+            {"$limit": page_size + 1},
+        ]
+        # An inclusion projection has to name the score; an exclusion projection keeps it anyway
+        if any(projection.values()):
+            projection = {**projection, "score": 1}
+        pipeline.append({"$project": projection})
+        documents = list(self._collection(collection_name).aggregate(pipeline))
+        if len(documents) > page_size:
+            documents = documents[:page_size]
+            return documents, (documents[-1]["score"], documents[-1]["_id"])
+        return documents, None
+
+    def find_url(self, url, collection_names=None, projection=DEFAULT_PROJECTION):
+        """
+        Looks up a URL in the crawl collections of the database.
+
+        :param url: URL to look up
+        :param collection_names: Collections to search, defaults to every crawl collection (see crawl_collections);
+                                 queue, blob and system collections are never searched
+        :return: Generator of (collection_name, document) tuples
+        """
+        crawl_collections = self.crawl_collections()
+        if collection_names is not None:
+            collection_names = set(collection_names)
+            crawl_collections = [name for name in crawl_collections if name in collection_names]
+        for collection_name in crawl_collections:
+            document = self._collection(collection_name).find_one({"url": url}, projection)
+            if document is not None:
+                yield collection_name, document
+
+    def stream(self, query=None, collection_name=None, projection=DEFAULT_PROJECTION):
+        """
+        Streams matching documents without materializing the result set.
+
+        :param query: MongoDB filter
+        :param projection: Fields to return
+        :return: Generator of documents
+        """
+        cursor = self._collection(collection_name).find(query or {}, projection, batch_size=self.batch_size)
+        try:
+            for document in cursor:
+                yield document
+        finally:
+            cursor.close()
+
+
+def main():
+    """
+    Test
+    """
+    database_handler = MongoDB()
+    database_handler.show_database()
+    database_handler.set_database(input("Database: "))
+    database_handler.set_collection(input("Collection: "))
+
+    results = ResultsQuery(database_handler)
+    results.ensure_indexes()
+
+    after_id = None
+    while True:
+        documents, after_id = results.relevant_documents(after_id=after_id)
+        for document in documents:
+            console.print(f"[bold green]{document.get('url')}[/] (level {document.get('level')}): {document.get('summary')}")
+        if after_id is None or input("Next page? [y/n] ").lower() != "y":
+            break
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
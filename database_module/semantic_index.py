@@ -0,0 +1,417 @@
+import os
+import glob
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+
+import numpy as np
+from filelock import FileLock
+from sklearn.feature_extraction.text import HashingVectorizer
+from rich.console import Console
+
+from database_module.results_query import ResultsQuery
+from utils.logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+console = Console()
+
+INDEX_DIR = os.path.join("OUTPUT", "semantic_index")
+EMBEDDINGS = ("lexical", "sentence-transformers")
+SENTENCE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class LexicalEmbedder:
+    """
+    Signed feature hashing of words and word bigrams. Signed hashing preserves inner products approximately, so the
+    cosine of two vectors tracks the overlap of their terms: documents that use other words for the same thing do not match.
+    """
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.vectorizer = HashingVectorizer(n_features=dim, ngram_range=(1, 2), alternate_sign=True, norm="l2", dtype=np.float32)
+
+    def embed(self, texts):
+        return self.vectorizer.transform(texts).toarray()
+
+
+class SentenceEmbedder:
+    """
+    Sentence-transformers model run on the CPU; matches documents by meaning rather than by shared words.
+    """
+
+    def __init__(self, model_name=SENTENCE_MODEL, batch_size=64):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.batch_size = batch_size
+
+    def embed(self, texts):
+        return self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+
+class SemanticIndex:
+    """
+    CPU-only index over the documents stored by earlier runs, so a new query can classify stored pages before any network fetch.
+
+    Every document (summary plus the leading part of its markdown) is embedded either lexically (hashed words and
+    bigrams, see LexicalEmbedder) or with a sentence-transformers model. The embedding is chosen when the index is
+    created and kept in meta.json. Vectors are float32 rows appended to vectors.f32, which is read through a NumPy
+    memmap; url, collection, content_hash and summary of every row are kept in documents.jsonl. A page whose content
+    changed (e.g. after an incremental re-crawl) gets a new row, and the newest row of a URL in a collection supersedes
+    the older ones at search time. Several processes can share an index: writes hold a file lock and first read the
+    rows other processes appended. Queries are scored block by block, so memory stays bounded by `block_rows`.
+    """
+
+    def __init__(self, index_dir=INDEX_DIR, embedding="lexical", dim=512, model_name=SENTENCE_MODEL, max_chars=4000, block_rows=65536):
+        """
+        :param index_dir: Folder of the index files
+        :param embedding: "lexical" or "sentence-transformers"; an existing index keeps the embedding it was built with
+        :param dim: Number of dimensions of the lexical embedding
+        :param model_name: Sentence-transformers model
+        :param max_chars: Number of leading markdown characters embedded with the summary
+        :param block_rows: Number of rows scored at once during a search
+        """
+        if embedding not in EMBEDDINGS:
+            raise ValueError(f"Unknown embedding {embedding}, expected one of {EMBEDDINGS}")
+        os.makedirs(index_dir, exist_ok=True)
+        self.index_dir = index_dir
+        self.vectors_path = os.path.join(index_dir, "vectors.f32")
+        self.documents_path = os.path.join(index_dir, "documents.jsonl")
+        self.meta_path = os.path.join(index_dir, "meta.json")
+        self.max_chars = max_chars
+        self.block_rows = block_rows
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(os.path.join(index_dir, "index.lock"))
+        self._memmap = None
+        self._documents_offset = 0
+        self.documents = []
+        # (collection, url) -> newest row
+        self.latest = {}
+        self.superseded = 0
+
+        with self._file_lock:
+            if os.path.exists(self.meta_path):
+                with open(self.meta_path, "r", encoding="utf-8") as file:
+                    meta = json.load(file)
+            else:
+                meta = {"embedding": embedding, "dim": dim, "model_name": model_name if embedding == "sentence-transformers" else None}
+            # Indexes written before the embedding was recorded are lexical
+            self.embedding = meta.get("embedding", "lexical")
+            self.model_name = meta.get("model_name")
+            if self.embedding == "sentence-transformers":
+                self.embedder = SentenceEmbedder(self.model_name)
+            else:
+                self.embedder = LexicalEmbedder(meta["dim"])
+            self.dim = self.embedder.dim
+            if not os.path.exists(self.meta_path):
+                open(self.vectors_path, "ab").close()
+                open(self.documents_path, "ab").close()
+                with open(self.meta_path, "w", encoding="utf-8") as file:
+                    json.dump({**meta, "dim": self.dim}, file)
+            self._refresh()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def embed(self, texts):
+        """
+        :param texts: List of texts
+        :return: float32 array (len(texts), dim) of unit-length vectors (zero for texts without words)
+        """
+        return self.embedder.embed(texts)
+
+    def document_text(self, record):
+        return f"{record.get('summary') or ''}\n{(record.get('markdown') or '')[:self.max_chars]}"
+
+    def _refresh(self):
+        """
+        Reads the documents appended since the last refresh, by this or another process, and cuts off a write that
+        was interrupted: a partial documents.jsonl line, or vector rows without their documents line.
+        Called with the file lock held.
+        """
+        with open(self.documents_path, "rb") as file:
+            file.seek(self._documents_offset)
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                self._append(json.loads(line))
+                self._documents_offset += len(line)
+        if os.path.getsize(self.documents_path) != self._documents_offset:
+            with open(self.documents_path, "r+b") as file:
+                file.truncate(self._documents_offset)
+        row_bytes = self.dim * 4
+        if os.path.getsize(self.vectors_path) != len(self.documents) * row_bytes:
+            with open(self.vectors_path, "r+b") as file:
+                file.truncate(len(self.documents) * row_bytes)
+        self._memmap = None
+
+    def _append(self, document):
+        if (document["collection"], document["url"]) in self.latest:
+            self.superseded += 1
+        self.latest[(document["collection"], document["url"])] = len(self.documents)
+        self.documents.append(document)
+
+    def is_current(self, collection, url, content_hash):
+        """
+        :return: True if the newest row of the URL in the collection holds this content
+        """
+        row = self.latest.get((collection, url))
+        return row is not None and self.documents[row].get("content_hash") == content_hash
+
+    def add(self, records):
+        """
+        Appends documents to the index. Documents already indexed with the same content for the same collection are
+        skipped, including those another process added in the meantime. A document with new content supersedes the
+        row of its previous content.
+
+        :param records: Iterable of dictionaries with url, collection, content_hash, summary and markdown
+        :return: Number of documents added
+        :note: Embedding happens before the file lock is taken, so concurrent workers only serialize on the writes.
+        """
+        records = [record for record in records if not self.is_current(record["collection"], record["url"], record.get("content_hash"))]
+        if not records:
+            return 0
+        vectors = self.embed([self.document_text(record) for record in records])
+        with self._lock, self._file_lock:
+            self._refresh()
+            new = [i for i, record in enumerate(records) if not self.is_current(record["collection"], record["url"], record.get("content_hash"))]
+            if not new:
+                return 0
+            with open(self.vectors_path, "ab") as file:
+                file.write(vectors[new].tobytes())
+            with open(self.documents_path, "ab") as file:
+                for i in new:
+                    record = records[i]
+                    entry = {field: record.get(field) for field in ("url", "collection", "content_hash", "summary")}
+                    line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+                    file.write(line)
+                    self._documents_offset += len(line)
+                    self._append(entry)
+            self._memmap = None
+        return len(new)
+
+    def update_from_database(self, database_handler, collection_names=None, batch_size=1000):
+        """
+        Adds the documents stored or changed since the last update.
+
+        :param database_handler: Instance of MongoDB pointing at the database with crawl collections
+        :param collection_names: Collections to index, defaults to all crawl collections
+        :param batch_size: Number of documents embedded at once
+        :return: Number of documents added
+        :note: Only the url and content_hash of every stored record are read for documents that are already indexed; page bodies
+               (decompressed from the blob collection with compressed storage) are loaded for new documents only.
+        """
+        results = ResultsQuery(database_handler, batch_size=batch_size)
+        added = 0
+        for collection_name in collection_names or results.crawl_collections():
+            batch = []
+            for record in results.stream(collection_name=collection_name, projection={"url": 1, "summary": 1, "content_hash": 1}):
+                if record.get("url") and not self.is_current(collection_name, record["url"], record.get("content_hash")):
+                    batch.append(record)
+                if len(batch) >= batch_size:
+                    added += self._add_stored(database_handler, collection_name, batch)
+                    batch = []
+            added += self._add_stored(database_handler, collection_name, batch)
+        logger.info("Semantic index updated with %s documents (%s in total)", added, len(self.documents))
+        return added
+
+    def _add_stored(self, database_handler, collection_name, batch):
+        if not batch:
+            return 0
+        bodies = {
+            document["url"]: document
+            for document in database_handler.find_documents({"url": {"$in": [record["url"] for record in batch]}},
+                                                            collection_name=collection_name)
+        }
+        return self.add({**record, "collection": collection_name, "markdown": bodies.get(record["url"], {}).get("markdown")} for record in batch)
+
+    def vectors(self):
+        """
+        :return: Read-only memmap (len(self), dim) of the document vectors
+        """
+        with self._lock:
+            if self._memmap is None and self.documents:
+                self._memmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.documents), self.dim))
+            return self._memmap
+
+    def search(self, query, k=20, min_score=0.1):
+        """
+        Finds the stored documents closest to a query.
+
+        :param query: Search query
+        :param k: Maximum number of documents returned
+        :param min_score: Minimum cosine similarity of a returned document
+        :return: List of dictionaries with url, collection, content_hash, summary and score, best first;
+                 a URL stored in several collections is returned once, with its current content only
+        """
+        vectors = self.vectors()
+        if vectors is None or k <= 0:
+            return []
+        query_vector = self.embed([query])[0]
+        # Keep more candidates than k, since the same URL can be stored in several collections and superseded
+        # rows are skipped
+        keep = min(len(self.documents), 4 * k + self.superseded)
+        best_scores, best_rows = np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        for start in range(0, len(self.documents), self.block_rows):
+            scores = np.asarray(vectors[start:start + self.block_rows]) @ query_vector
+            top = np.argpartition(scores, -keep)[-keep:] if len(scores) > keep else np.arange(len(scores))
+            best_scores = np.concatenate([best_scores, scores[top]])
+            best_rows = np.concatenate([best_rows, top + start])
+            if len(best_scores) > keep:
+                top = np.argpartition(best_scores, -keep)[-keep:]
+                best_scores, best_rows = best_scores[top], best_rows[top]
+
+        results, seen = [], set()
+        for position in np.argsort(-best_scores):
+            score = float(best_scores[position])
+            if score < min_score or len(results) >= k:
+                break
+            row = int(best_rows[position])
+            document = self.documents[row]
+            if self.latest[(document["collection"], document["url"])] != row or document["url"] in seen:
+                continue
+            seen.add(document["url"])
+            results.append({**document, "score": score})
+        return results
+
+
+def synthetic_documents(num_documents, seed=7):
+    rng = random.Random(seed)
+    topics = [[f"topic{topic}word{word}" for word in range(40)] for topic in range(200)]
+    common = [f"common{word}" for word in range(2000)]
+    for i in range(num_documents):
+        topic = topics[i % len(topics)]
+        words = [rng.choice(topic) if rng.random() < 0.3 else rng.choice(common) for _ in range(300)]
+        yield {
+            "url": f"https://www.example-{i % 997}.com/articles/{i}",
+            "collection": f"query_{i % 50}",
+            "content_hash": f"{i:064x}",
+            "summary": " ".join(rng.sample(topic, 8)),
+            "markdown": " ".join(words),
+        }
+
+
+def benchmark(num_documents=100_000, num_queries=200, batch_size=5000):
+    """
+    Measures index build and query times of the lexical embedding on synthetic documents.
+    The synthetic topics share no words, so retrieval quality is measured by benchmark_summaries instead.
+
+    :param num_documents: Number of indexed documents
+    :param num_queries: Number of timed queries
+    :param batch_size: Number of documents added at once
+    """
+    index = SemanticIndex(tempfile.mkdtemp())
+    start = time.perf_counter()
+    batch = []
+    for record in synthetic_documents(num_documents):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            index.add(batch)
+            batch = []
+    index.add(batch)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reopened = SemanticIndex(index.index_dir)
+    load = time.perf_counter() - start
+
+    rng = random.Random(11)
+    latencies = []
+    for _ in range(num_queries):
+        topic = rng.randrange(200)
+        query = " ".join(f"topic{topic}word{rng.randrange(40)}" for _ in range(4))
+        start = time.perf_counter()
+        reopened.search(query, k=20)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+
+    print(f"{num_documents} documents, {index.dim} dimensions, {os.path.getsize(index.vectors_path) / 2 ** 20:.1f} MiB of vectors")
+    print(f"Build: {build:.1f}s ({num_documents / build:,.0f} documents/s), reopen: {load:.2f}s")
+    print(f"Query: p50 {latencies[len(latencies) // 2] * 1e3:.1f} ms, p95 {latencies[int(len(latencies) * 0.95)] * 1e3:.1f} ms")
+
+
+def benchmark_summaries(dataset_dir="test_dataset", embedding="lexical", model_name=SENTENCE_MODEL):
+    """
+    Measures retrieval quality on the real summaries recorded in the overview_*.json files of test_dataset.
+
+    The summaries of all queries go into one index. Every query then ranks all of them. Topic precision@8 is the
+    share of the top 8 that was crawled for the same query. Relevant MAP is the mean average precision of the
+    documents recorded as Relevant for the query; the Irrelevant pages crawled for the same query are the hard negatives.
+
+    :param dataset_dir: Folder with the overview_*.json files
+    :param embedding: Embedding to evaluate
+    :param model_name: Sentence-transformers model, for that embedding
+    """
+    index = SemanticIndex(tempfile.mkdtemp(), embedding=embedding, model_name=model_name)
+    queries = {}
+    for path in sorted(glob.glob(os.path.join(dataset_dir, "overview_*.json"))):
+        query = os.path.basename(path)[len("overview_"):-len(".json")]
+        with open(path, "r", encoding="utf-8") as file:
+            overview = json.load(file)
+        records = [{"url": url, "collection": query, "summary": data["summary"]}
+                   for url, data in overview.items() if isinstance(data, dict) and data.get("summary")]
+        index.add(records)
+        queries[query] = {url for url, data in overview.items() if isinstance(data, dict) and data.get("classification") == "Relevant"}
+    if not queries:
+        print(f"No overview_*.json files in {dataset_dir}")
+        return
+
+    topic_precision, average_precisions = [], []
+    for query, relevant in queries.items():
+        ranking = index.search(query, k=len(index), min_score=-1.0)
+        topic_precision.append(sum(1 for result in ranking[:8] if result["collection"] == query) / 8)
+        hits, precisions = 0, []
+        for rank, result in enumerate(ranking, start=1):
+            if result["url"] in relevant:
+                hits += 1
+                precisions.append(hits / rank)
+        average_precisions.append(sum(precisions) / len(relevant) if relevant else 0.0)
+
+    name = embedding if embedding == "lexical" else f"{embedding} ({model_name})"
+    print(f"{name}: {len(index)} summaries, {len(queries)} queries")
+    print(f"Topic precision@8 {np.mean(topic_precision):.1%}, Relevant MAP {np.mean(average_precisions):.3f}")
+
+
+def main():
+    """
+    Updates the index of a database and searches it:
+        python -m database_module.semantic_index --database default_db --query "benefits of solar energy"
+        python -m database_module.semantic_index --benchmark 100000
+        python -m database_module.semantic_index --benchmark-summaries --embedding sentence-transformers
+    """
+    parser = argparse.ArgumentParser(description="Local semantic index over stored crawl documents.")
+    parser.add_argument("--database", default="default_db")
+    parser.add_argument("--query")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--embedding", choices=EMBEDDINGS, default="lexical", help="Embedding of a new index")
+    parser.add_argument("--model", default=SENTENCE_MODEL, help="Sentence-transformers model of a new index")
+    parser.add_argument("--benchmark", type=int, metavar="DOCUMENTS", help="Benchmark build and query times instead")
+    parser.add_argument("--benchmark-summaries", action="store_true", help="Benchmark retrieval quality on the test_dataset summaries instead")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return
+    if args.benchmark_summaries:
+        benchmark_summaries(embedding=args.embedding, model_name=args.model)
+        return
+
+    from database_module.mongoDB import MongoDB
+
+    database_handler = MongoDB(database_name=args.database)
+    index = SemanticIndex(os.path.join(INDEX_DIR, args.database), embedding=args.embedding, model_name=args.model)
+    added = index.update_from_database(database_handler)
+    console.print(f"[bold blue]Documents added to the index ({index.embedding}):[/] {added} ({len(index)} in total)")
+    if args.query:
+        for result in index.search(args.query, k=args.k):
+            console.print(f"[bold green]{result['score']:.3f}[/] {result['url']} [blue]({result['collection']})[/] {result.get('summary') or ''}")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
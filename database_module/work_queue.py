@@ -0,0 +1,218 @@
+import time
+import logging
+import threading
+import pymongo
+from pymongo import ReturnDocument, UpdateOne
+
+
+logger = logging.getLogger(__name__)
+
+# Suffixes of the collections a work queue adds next to its results collection
+QUEUE_COLLECTION_SUFFIXES = ("_frontier", "_control")
+
+
+class MongoWorkQueue:
+    """
+    Crawl frontier shared by several worker processes through MongoDB.
+
+    Frontier entries live in `<collection>_frontier` with the URL as _id. Workers claim entries with a lease
+    (find_one_and_update) and extend it with heartbeats. Entries whose lease expired are reclaimed by other workers.
+    The document budget is a counter in `<collection>_control` that is only incremented while it is below
+    max_scraped_docs, so the budget holds globally. Entries deeper than max_depth are never enqueued.
+    """
+
+    def __init__(self, database_handler, collection_name=None):
+        """
+        :param database_handler: Instance of MongoDB
+        :param collection_name: Name of the results collection the queue belongs to, defaults to the current collection
+        """
+        self.database_handler = database_handler
+        self.collection_name = collection_name or database_handler.collection_name
+        self.frontier = database_handler.db[f"{self.collection_name}_frontier"]
+        self.control = database_handler.db[f"{self.collection_name}_control"]
+        self._settings = None
+
+    def setup(self, search_query, max_depth, max_scraped_docs, lease_seconds=120, max_attempts=3):
+        """
+        Creates the control document and indexes. Called once by the coordinator.
+
+        :param search_query: Query the workers classify against
+        :param max_depth: Maximum depth level
+        :param max_scraped_docs: Maximum number of documents processed across all workers
+        :param lease_seconds: Lease duration; a worker that misses heartbeats for this long loses its URL
+        :param max_attempts: Number of leases a URL can get before it is marked failed
+        """
+        self.control.replace_one({"_id": "settings"}, {
+            "_id": "settings",
+            "search_query": search_query,
+            "max_depth": max_depth,
+            "max_scraped_docs": max_scraped_docs,
+            "lease_seconds": lease_seconds,
+            "max_attempts": max_attempts,
+            "claimed": 0,
+            "created": time.time(),
+        }, upsert=True)
+        self.frontier.create_index([("state", pymongo.ASCENDING), ("level", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)])
+        self.frontier.create_index([("state", pymongo.ASCENDING), ("lease_expires", pymongo.ASCENDING)])
+        self._settings = None
+        logger.info("Work queue %s set up: depth %s, budget %s", self.collection_name, max_depth, max_scraped_docs)
+
+    @property
+    def settings(self):
+        if self._settings is None:
+            self._settings = self.control.find_one({"_id": "settings"}, {"claimed": 0})
+            if self._settings is None:
+                raise ValueError(f"Work queue {self.collection_name} has not been set up")
+        return self._settings
+
+    def enqueue(self, urls, level, parent=None):
+        """
+        Adds URLs to the frontier. URLs already known (in any state) are ignored.
+
+        :param urls: URLs to add
+        :param level: Depth level of the URLs
+        :param parent: URL of the page the links were found on
+        :return: Number of newly added URLs
+        """
+        if level > self.settings["max_depth"] or not urls:
+            return 0
+        operations = [
+            UpdateOne({"_id": url}, {"$setOnInsert": {"level": level, "parent": parent, "state": "pending", "attempts": 0, "enqueued": time.time()}}, upsert=True)
+            for url in dict.fromkeys(urls)
+        ]
+        result = self.frontier.bulk_write(operations, ordered=False)
+        return result.upserted_count
+
+    def claim(self, worker_id):
+        """
+        Leases the next URL, shallowest level first.
+
+        :param worker_id: Unique ID of the worker
+        :return: Frontier entry (with _id = URL and level) or None if nothing can be claimed right now
+        """
+        now = time.time()
+        lease = {"state": "leased", "lease_owner": worker_id, "lease_expires": now + self.settings["lease_seconds"]}
+
+        # Expired leases were already counted against the budget
+        entry = self.frontier.find_one_and_update(
+            {"state": "leased", "lease_expires": {"$lt": now}, "attempts": {"$lt": self.settings["max_attempts"]}},
+            {"$set": lease, "$inc": {"attempts": 1}},
+            sort=[("level", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if entry is not None:
+            logger.info("Worker %s reclaimed expired lease on %s", worker_id, entry['_id'])
+            return entry
+
+        self.frontier.update_many(
+            {"state": "leased", "lease_expires": {"$lt": now}, "attempts": {"$gte": self.settings["max_attempts"]}},
+            {"$set": {"state": "failed", "error": "lease expired too often"}},
+        )
+
+        budget = self.control.find_one_and_update(
+            {"_id": "settings", "claimed": {"$lt": self.settings["max_scraped_docs"]}},
+            {"$inc": {"claimed": 1}},
+        )
+        if budget is None:
+            return None
+
+        entry = self.frontier.find_one_and_update(
+            {"state": "pending"},
+            {"$set": lease, "$inc": {"attempts": 1}},
+            sort=[("level", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if entry is None:
+            # Nothing pending: give the budget back
+            self.control.update_one({"_id": "settings"}, {"$inc": {"claimed": -1}})
+        return entry
+
+    def heartbeat(self, url, worker_id):
+        """
+        Extends the lease of a claimed URL.
+
+        :return: False if the worker no longer owns the lease
+        """
+        result = self.frontier.update_one(
+            {"_id": url, "state": "leased", "lease_owner": worker_id},
+            {"$set": {"lease_expires": time.time() + self.settings["lease_seconds"]}},
+        )
+        return result.matched_count == 1
+
+    def complete(self, url, worker_id, level, status_code, classification=None, links=None):
+        """
+        Marks a URL as done and enqueues the links of Relevant pages one level deeper.
+        Completing a URL twice (e.g. after a lease was reclaimed) has no further effect.
+
+        :return: Number of links added to the frontier
+        """
+        result = self.frontier.update_one(
+            {"_id": url, "state": "leased", "lease_owner": worker_id},
+            {"$set": {"state": "done", "status_code": status_code, "classification": classification, "finished": time.time()},
+             "$unset": {"lease_owner": "", "lease_expires": ""}},
+        )
+        if result.modified_count != 1:
+            logger.warning("Worker %s completed %s without owning its lease", worker_id, url)
+            return 0
+        if classification == "Relevant" and links:
+            return self.enqueue(links, level + 1, parent=url)
+        return 0
+
+    def release(self, url, worker_id):
+        """
+        Returns a claimed URL to the frontier without consuming another budget slot (e.g. after a rate limit).
+        The owner is cleared, so a heartbeat still running for the URL cannot extend the lease again.
+        """
+        self.frontier.update_one(
+            {"_id": url, "state": "leased", "lease_owner": worker_id},
+            {"$set": {"lease_expires": 0}, "$unset": {"lease_owner": ""}, "$inc": {"attempts": -1}},
+        )
+
+    def is_finished(self):
+        """
+        :return: True when no URL is leased and nothing pending can still be claimed
+        """
+        if self.frontier.count_documents({"state": "leased"}, limit=1):
+            return False
+        if not self.frontier.count_documents({"state": "pending"}, limit=1):
+            return True
+        claimed = self.control.find_one({"_id": "settings"}, {"claimed": 1})["claimed"]
+        return claimed >= self.settings["max_scraped_docs"]
+
+    def stats(self):
+        """
+        :return: Dictionary with the number of frontier entries per state and the consumed budget
+        """
+        counts = {item["_id"]: item["count"] for item in self.frontier.aggregate([{"$group": {"_id": "$state", "count": {"$sum": 1}}}])}
+        counts["claimed"] = self.control.find_one({"_id": "settings"}, {"claimed": 1})["claimed"]
+        return counts
+
+
+class LeaseHeartbeat:
+    """
+    Context manager that extends a lease in a background thread while a URL is processed.
+    """
+
+    def __init__(self, work_queue, url, worker_id):
+        self.work_queue = work_queue
+        self.url = url
+        self.worker_id = worker_id
+        self.interval = work_queue.settings["lease_seconds"] / 3
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.work_queue.heartbeat(self.url, self.worker_id):
+                self.lost = True
+                logger.warning("Worker %s lost the lease on %s", self.worker_id, self.url)
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,241 @@
+import time
+import zlib
+import random
+import logging
+import argparse
+import threading
+from multiprocessing import Process
+
+from database_module.work_queue import MongoWorkQueue
+from classification_module.LLM_classification import ClassificationResult
+from utils.logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = "harness"
+
+
+class QueueDatabase:
+    """Minimal stand-in for MongoDB: the work queue only needs `db` and `collection_name`."""
+
+    def __init__(self, db, collection_name=COLLECTION_NAME):
+        self.db = db
+        self.collection_name = collection_name
+        self.collection = db[collection_name]
+
+    def save_document(self, document, upsert=False):
+        self.collection.replace_one({"url": document["url"]}, document, upsert=True)
+
+
+class RecordingWorkQueue(MongoWorkQueue):
+    """
+    MongoWorkQueue that writes every successful claim, heartbeat, release and completion to an events collection,
+    so the lease history of every URL can be checked after the run.
+    """
+
+    def __init__(self, database_handler, collection_name=None):
+        super().__init__(database_handler, collection_name)
+        self.events = database_handler.db[f"{self.collection_name}_events"]
+
+    def _record(self, kind, url, worker_id, **fields):
+        self.events.insert_one({"kind": kind, "url": url, "worker_id": worker_id, "time": time.time(), **fields})
+
+    def claim(self, worker_id):
+        entry = super().claim(worker_id)
+        if entry is not None:
+            self._record("claim", entry["_id"], worker_id, attempts=entry["attempts"])
+        return entry
+
+    def heartbeat(self, url, worker_id):
+        owned = super().heartbeat(url, worker_id)
+        if owned:
+            self._record("heartbeat", url, worker_id)
+        return owned
+
+    def release(self, url, worker_id):
+        super().release(url, worker_id)
+        self._record("release", url, worker_id)
+
+    def complete(self, url, worker_id, level, status_code, classification=None, links=None):
+        owned = self.frontier.find_one({"_id": url, "state": "leased", "lease_owner": worker_id}, {"_id": 1}) is not None
+        added = super().complete(url, worker_id, level, status_code, classification, links)
+        if owned:
+            self._record("complete", url, worker_id)
+        return added
+
+
+class StubExtractor:
+    """Synthetic site: every page links to `fanout` children; a share of first requests is rate limited."""
+
+    def __init__(self, work_seconds, rate_limit_share, fanout=4, seed=0):
+        self.work_seconds = work_seconds
+        self.rate_limit_share = rate_limit_share
+        self.fanout = fanout
+        self.rng = random.Random(seed)
+        self.limited = set()
+
+    def extract_text_from_url(self, url, level):
+        time.sleep(self.rng.uniform(0.5, 1.5) * self.work_seconds)
+        if url not in self.limited and zlib.crc32(url.encode()) % 100 < self.rate_limit_share * 100:
+            self.limited.add(url)
+            return None, 429
+        links = [f"{url}/{i}" for i in range(self.fanout)]
+        return {"url": url, "markdown": f"Content of {url}", "links": links, "metadata": {}, "level": level}, 200
+
+
+class StubClassifier:
+    def classify_document(self, document_text, user_query):
+        classification = "Relevant" if zlib.crc32(document_text.encode()) % 2 else "Irrelevant"
+        return ClassificationResult(classification=classification, explanation="stub", summary="stub")
+
+
+def harness_worker(db, worker_index, options):
+    """
+    Worker loop of Worker.run_worker with stub extraction and classification. Some claims are abandoned without
+    heartbeats to simulate a crashed worker, so their leases expire and must be reclaimed by others.
+    """
+    from Worker import process_claimed_url
+
+    worker_id = f"harness-{worker_index}"
+    database_handler = QueueDatabase(db)
+    work_queue = RecordingWorkQueue(database_handler, COLLECTION_NAME)
+    extractor = StubExtractor(options["work_seconds"], options["rate_limit_share"], seed=worker_index)
+    classifier = StubClassifier()
+    rng = random.Random(worker_index)
+    while True:
+        entry = work_queue.claim(worker_id)
+        if entry is None:
+            if work_queue.is_finished():
+                break
+            time.sleep(0.02)
+            continue
+        if rng.random() < options["crash_share"]:
+            # Crash: the lease is neither extended nor released
+            continue
+        process_claimed_url(entry, work_queue, worker_id, extractor, classifier, database_handler, "harness query",
+                            rate_limit_pause=options["work_seconds"])
+
+
+def _thread_worker(db, worker_index, options, errors):
+    # Exceptions of a thread are otherwise only printed; run_harness re-raises them
+    try:
+        harness_worker(db, worker_index, options)
+    except BaseException as e:
+        errors.append(e)
+
+
+def _process_worker(uri, database_name, worker_index, options):
+    from pymongo import MongoClient
+
+    setup_logging()
+    harness_worker(MongoClient(uri)[database_name], worker_index, options)
+
+
+def check_events(db, lease_seconds, max_scraped_docs, tolerance=0.1):
+    """
+    Checks the recorded lease history.
+
+    :return: Dictionary with the counts of claims, reclaims after expiry, reclaims after release and completions
+    :raises AssertionError: On no claims at all, a URL claimed while another worker held a valid lease, a URL
+                            completed twice, a URL left leased, a budget overrun or claimed URLs left unfinished
+    """
+    events = list(db[f"{COLLECTION_NAME}_events"].find({}, {"_id": 0}).sort([("time", 1)]))
+    by_url = {}
+    for event in events:
+        by_url.setdefault(event["url"], []).append(event)
+
+    counts = {"urls": len(by_url), "claims": 0, "reclaimed_after_expiry": 0, "reclaimed_after_release": 0, "completed": 0}
+    for url, history in by_url.items():
+        owner, last_extension, released = None, None, False
+        completions = 0
+        for event in history:
+            if event["kind"] == "claim":
+                counts["claims"] += 1
+                if owner is not None:
+                    if released:
+                        counts["reclaimed_after_release"] += 1
+                    else:
+                        # The previous lease must have expired: no claim before its last extension plus the lease time
+                        assert event["time"] >= last_extension + lease_seconds - tolerance, \
+                            f"{url} claimed by {event['worker_id']} while {owner} held a valid lease"
+                        counts["reclaimed_after_expiry"] += 1
+                owner, last_extension, released = event["worker_id"], event["time"], False
+            elif event["kind"] == "heartbeat":
+                assert event["worker_id"] == owner, f"{event['worker_id']} extended the lease of {url} owned by {owner}"
+                last_extension = event["time"]
+            elif event["kind"] == "release":
+                released = True
+            elif event["kind"] == "complete":
+                assert event["worker_id"] == owner, f"{url} completed by {event['worker_id']}, owner {owner}"
+                completions += 1
+        assert completions <= 1, f"{url} completed {completions} times"
+        counts["completed"] += completions
+
+    frontier = db[f"{COLLECTION_NAME}_frontier"]
+    assert frontier.count_documents({"state": "leased"}) == 0, "URLs left leased"
+    claimed = db[f"{COLLECTION_NAME}_control"].find_one({"_id": "settings"})["claimed"]
+    assert claimed <= max_scraped_docs, f"budget overrun: {claimed} > {max_scraped_docs}"
+    counts["failed"] = frontier.count_documents({"state": "failed"})
+    counts["budget_claimed"] = claimed
+    assert counts["claims"] > 0, "no claims recorded"
+    # Every claimed URL within the budget is completed, unless its lease expired max_attempts times
+    expected = min(counts["urls"], max_scraped_docs) - counts["failed"]
+    assert counts["completed"] == expected, f"{counts['completed']} URLs completed, expected {expected}"
+    return counts
+
+
+def run_harness(workers=6, max_depth=3, max_scraped_docs=150, lease_seconds=1.0, work_seconds=0.05, crash_share=0.05,
+                rate_limit_share=0.05, uri=None, database_name="work_queue_harness"):
+    """
+    Runs several workers against one shared queue and checks for duplicate claims and lease expiry.
+
+    :param uri: MongoDB URI; the workers run as separate processes against it. Without a URI, they run as threads
+                on one in-memory mongomock database
+    """
+    if uri:
+        from pymongo import MongoClient
+
+        client = MongoClient(uri)
+        client.drop_database(database_name)
+        db = client[database_name]
+    else:
+        import mongomock
+
+        db = mongomock.MongoClient()[database_name]
+
+    work_queue = MongoWorkQueue(QueueDatabase(db), COLLECTION_NAME)
+    work_queue.setup("harness query", max_depth, max_scraped_docs, lease_seconds=lease_seconds)
+    work_queue.enqueue([f"https://site-{i}.example" for i in range(5)], 0)
+    options = {"work_seconds": work_seconds, "crash_share": crash_share, "rate_limit_share": rate_limit_share}
+
+    errors = []
+    start = time.perf_counter()
+    if uri:
+        runners = [Process(target=_process_worker, args=(uri, database_name, i, options)) for i in range(workers)]
+    else:
+        runners = [threading.Thread(target=_thread_worker, args=(db, i, options, errors)) for i in range(workers)]
+    for runner in runners:
+        runner.start()
+    for runner in runners:
+        runner.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+    failed_processes = [runner.name for runner in runners if getattr(runner, "exitcode", 0) != 0]
+    if failed_processes:
+        raise RuntimeError(f"Worker processes exited with an error: {', '.join(failed_processes)}")
+
+    counts = check_events(db, lease_seconds, max_scraped_docs)
+    print(f"{workers} {'processes' if uri else 'threads (mongomock)'}, {elapsed:.1f}s: {counts}")
+    return counts
+
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Run several workers against one MongoWorkQueue and check claims and lease expiry.")
+    parser.add_argument("--uri", help="MongoDB URI for a multi-process run; defaults to threads on mongomock")
+    parser.add_argument("--workers", type=int, default=6)
+    parser.add_argument("--max-docs", type=int, default=150)
+    parser.add_argument("--lease-seconds", type=float, default=1.0)
+    args = parser.parse_args()
+    run_harness(workers=args.workers, max_scraped_docs=args.max_docs, lease_seconds=args.lease_seconds, uri=args.uri)
@@ -0,0 +1,439 @@
+import os
+import re
+import glob
+import json
+import time
+import hashlib
+import argparse
+import threading
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Font
+from rich.console import Console
+from rich.table import Table
+from utils.logging_setup import setup_logging
+from utils.output_filter import normalize_markdown
+
+console = Console()
+
+DATASET_DIR = "test_dataset"
+CACHE_DIR = os.path.join("OUTPUT", "page_cache")
+# USD per 1M input / output tokens
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+
+def normalize_query(query):
+    """
+    Normalizes a query so that names from xlsx sheets, overview files and collections match.
+    Same sanitization as ExcelWriter.modify_serach_query_for_filename, plus lower case.
+    """
+    return re.sub(r'[^\w\s-]', '', query).strip().lower()
+
+
+def load_reference_sets(dataset_dir=DATASET_DIR):
+    """
+    Loads the labelled reference sets of test_dataset.
+
+    :param dataset_dir: Folder with Comparison.xlsx and the overview_*.json files
+    :return: Dictionary normalized query -> {"query": query, "labels": {url: label}, "recorded": {url: label}}
+    :note:
+    - "labels" holds the author classifications from Comparison.xlsx, the gold labels precision and recall are computed on.
+    - "recorded" holds the LLM classifications of the overview_*.json files. They are only used for the agreement
+      column: an LLM verdict is not ground truth.
+    """
+    references = {}
+
+    for path in glob.glob(os.path.join(dataset_dir, "overview_*.json")):
+        query = os.path.basename(path)[len("overview_"):-len(".json")]
+        with open(path, "r", encoding="utf-8") as file:
+            overview = json.load(file)
+        labels = {
+            url: data["classification"] for url, data in overview.items()
+            if isinstance(data, dict) and data.get("classification") in ("Relevant", "Irrelevant")
+        }
+        references[normalize_query(query)] = {"query": query, "labels": {}, "recorded": labels}
+
+    comparison_path = os.path.join(dataset_dir, "Comparison.xlsx")
+    if os.path.exists(comparison_path):
+        workbook = load_workbook(comparison_path, read_only=True)
+        for sheet in workbook.worksheets:
+            query, labels = None, {}
+            for row in sheet.iter_rows(values_only=True):
+                if len(row) < 4:
+                    continue
+                if row[1] == "Search query:":
+                    query = str(row[2]).strip()
+                elif row[1] == "Document:" and row[3] in ("Relevant", "Irrelevant"):
+                    labels[row[2]] = row[3]
+            if query:
+                entry = references.setdefault(normalize_query(query), {"query": query, "labels": {}, "recorded": {}})
+                entry["query"] = query
+                entry["labels"].update(labels)
+
+    return references
+
+
+def reference_urls(reference):
+    """
+    :return: URLs with a gold label or a recorded verdict, gold-labelled ones first
+    """
+    return list(dict.fromkeys([*reference["labels"], *reference["recorded"]]))
+
+
+class PageCache:
+    """
+    Recorded page content keyed by URL, so configurations can be replayed without network access.
+    One JSON file per URL in cache_dir.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, url):
+        return os.path.join(self.cache_dir, f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.json")
+
+    def get(self, url):
+        """
+        :return: Cached markdown of the URL or None
+        """
+        path = self.path(url)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file).get("markdown")
+
+    def put(self, url, markdown):
+        with open(self.path(url), "w", encoding="utf-8") as file:
+            json.dump({"url": url, "markdown": markdown}, file, ensure_ascii=False)
+
+    def fill_from_database(self, database_handler, urls):
+        """
+        Copies stored page content of the given URLs from MongoDB collections into the cache.
+
+        :return: Number of pages added
+        """
+        from database_module.results_query import ResultsQuery
+
+        results = ResultsQuery(database_handler)
+        added = 0
+        for url in urls:
+            if self.get(url) is not None:
+                continue
+            for collection_name, _ in results.find_url(url, projection={"_id": 1}):
+                document = database_handler.find_document(url, collection_name=collection_name)
+                if document and document.get("markdown"):
+                    self.put(url, document["markdown"])
+                    added += 1
+                    break
+        return added
+
+    def fill_from_extractor(self, extractor, urls):
+        """
+        Extracts the given URLs once and records their content.
+
+        :return: Number of pages added
+        """
+        added = 0
+        for url in urls:
+            if self.get(url) is not None:
+                continue
+            document, status_code = extractor.extract_text_from_url(url, 0)
+            if status_code == 200 and document and document.get("markdown"):
+                self.put(url, document["markdown"])
+                added += 1
+        return added
+
+
+class UsageTracker:
+    """
+    Wraps a LangChain chat model and sums the token usage reported with every response.
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+        self._lock = threading.Lock()
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.calls = 0
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def _record(self, message):
+        usage = getattr(message, "usage_metadata", None) or {}
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += usage.get("input_tokens", 0)
+            self.output_tokens += usage.get("output_tokens", 0)
+
+    def invoke(self, *args, **kwargs):
+        response = self.llm.invoke(*args, **kwargs)
+        self._record(response)
+        return response
+
+
+def _openai(**settings):
+    from classification_module.LLM_classification import OpenAI
+
+    classifier = OpenAI()
+    for key, value in settings.items():
+        setattr(classifier, key, value)
+    return classifier
+
+
+def _cascade(threshold):
+    from classification_module.local_classifier import LocalClassifier, CascadeClassifier
+
+    return CascadeClassifier(_openai(), LocalClassifier.load(), threshold)
+
+
+# Configuration name -> settings; "classifier" builds the classifier, "preprocess" turns stored markdown into classifier input
+CONFIGURATIONS = {
+    "baseline": {"classifier": lambda: _openai(), "preprocess": None},
+    "cascade-0.9": {"classifier": lambda: _cascade(0.9), "preprocess": None},
+    "cascade-0.8": {"classifier": lambda: _cascade(0.8), "preprocess": None},
+    "normalized": {"classifier": lambda: _openai(), "preprocess": normalize_markdown},
+}
+
+
+def llm_owner(classifier):
+    """Returns the object holding the `llm` attribute (the OpenAI instance inside a cascade)."""
+    return getattr(classifier, "llm_classifier", classifier)
+
+
+def run_configuration(name, references, page_cache):
+    """
+    Replays every reference query against cached page content with one configuration.
+
+    :param name: Key of CONFIGURATIONS
+    :param references: Output of load_reference_sets
+    :param page_cache: PageCache with the recorded content
+    :return: List of result rows, one per query
+    """
+    configuration = CONFIGURATIONS[name]
+    classifier = configuration["classifier"]()
+    owner = llm_owner(classifier)
+    preprocess = configuration["preprocess"]
+    input_price, output_price = MODEL_PRICES.get(owner.model, (0.0, 0.0))
+
+    rows = []
+    for reference in references.values():
+        tracker = UsageTracker(owner.llm)
+        owner.llm = tracker
+        predicted, missing = {}, 0
+        start = time.perf_counter()
+        for url in reference_urls(reference):
+            markdown = page_cache.get(url)
+            if markdown is None:
+                missing += 1
+                continue
+            document_text = preprocess(markdown) if preprocess else markdown
+            predicted[url] = classifier.classify_document(document_text, reference["query"]).classification
+        elapsed = time.perf_counter() - start
+        owner.llm = tracker.llm
+
+        # Precision and recall only on gold labels, agreement only with the recorded LLM verdicts
+        truth = {url: label for url, label in reference["labels"].items() if url in predicted}
+        true_positive = sum(1 for url, label in truth.items() if label == "Relevant" and predicted[url] == "Relevant")
+        predicted_positive = sum(1 for url in truth if predicted[url] == "Relevant")
+        actual_positive = sum(1 for label in truth.values() if label == "Relevant")
+        recorded = [url for url in predicted if url in reference["recorded"]]
+        agreeing = sum(1 for url in recorded if predicted[url] == reference["recorded"][url])
+        rows.append({
+            "configuration": name,
+            "query": reference["query"],
+            "documents": len(predicted),
+            "gold_documents": len(truth),
+            "missing": missing,
+            "precision": true_positive / predicted_positive if predicted_positive else None,
+            "recall": true_positive / actual_positive if actual_positive else None,
+            "agreement": agreeing / len(recorded) if recorded else None,
+            "docs_per_sec": len(predicted) / elapsed if elapsed > 0 else None,
+            "llm_calls": tracker.calls,
+            "input_tokens": tracker.input_tokens,
+            "output_tokens": tracker.output_tokens,
+            "cost_usd": (tracker.input_tokens * input_price + tracker.output_tokens * output_price) / 1_000_000,
+            "seconds": elapsed,
+            "true_positive": true_positive,
+            "predicted_positive": predicted_positive,
+            "actual_positive": actual_positive,
+            "agreeing": agreeing,
+            "recorded": len(recorded),
+        })
+    return rows
+
+
+def summarize(rows):
+    """
+    Aggregates per-query rows into one row per configuration (micro-averaged precision, recall and agreement).
+    """
+    totals = {}
+    keys = ("documents", "gold_documents", "missing", "llm_calls", "input_tokens", "output_tokens", "cost_usd", "seconds",
+            "true_positive", "predicted_positive", "actual_positive", "agreeing", "recorded")
+    for row in rows:
+        total = totals.setdefault(row["configuration"], {"configuration": row["configuration"], "query": "ALL", **{key: 0 for key in keys}})
+        for key in keys:
+            total[key] += row[key]
+    for total in totals.values():
+        total["precision"] = total["true_positive"] / total["predicted_positive"] if total["predicted_positive"] else None
+        total["recall"] = total["true_positive"] / total["actual_positive"] if total["actual_positive"] else None
+        total["agreement"] = total["agreeing"] / total["recorded"] if total["recorded"] else None
+        total["docs_per_sec"] = total["documents"] / total["seconds"] if total["seconds"] > 0 else None
+    return list(totals.values())
+
+
+REPORT_COLUMNS = ["configuration", "query", "documents", "gold_documents", "missing", "precision", "recall", "agreement", "docs_per_sec", "llm_calls", "input_tokens", "output_tokens", "cost_usd"]
+
+
+def write_report(rows, output_folder="OUTPUT"):
+    """
+    Writes the comparison table to an xlsx file.
+
+    :return: Path of the written file
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    file_path = os.path.join(output_folder, f"evaluation_{time.strftime('%Y%m%d_%H%M%S')}.xlsx")
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Comparison"
+    sheet.append(REPORT_COLUMNS)
+    for cell in sheet[1]:
+        cell.font = Font(bold=True)
+    for row in rows:
+        sheet.append([row.get(column) for column in REPORT_COLUMNS])
+    workbook.save(file_path)
+    return file_path
+
+
+def print_report(rows):
+    table = Table(title="Quality versus throughput")
+    for column in ("Configuration", "Docs (gold)", "Precision", "Recall", "Agreement with recorded", "Docs/sec", "LLM calls", "Tokens in/out", "Cost (USD)"):
+        table.add_column(column)
+    fmt = lambda value, pattern: pattern.format(value) if value is not None else "-"
+    for row in rows:
+        table.add_row(
+            row["configuration"], f"{row['documents']} ({row['gold_documents']})", fmt(row["precision"], "{:.1%}"), fmt(row["recall"], "{:.1%}"), fmt(row.get("agreement"), "{:.1%}"),
+            fmt(row["docs_per_sec"], "{:.2f}"), str(row["llm_calls"]), f"{row['input_tokens']:,}/{row['output_tokens']:,}", f"{row['cost_usd']:.4f}",
+        )
+    console.print(table)
+
+
+def compare_multi_query(references, page_cache, max_documents=None):
+    """
+    Classifies cached documents against all reference queries, once with one LLM call per (document, query) pair
+    and once with one multi-query call per document.
+
+    :param references: Output of load_reference_sets
+    :param page_cache: PageCache with the recorded content
+    :param max_documents: Optional limit of the number of documents
+    :return: List of two result rows ("single" and "multi") with calls, tokens and seconds per (document, query) pair
+             and the share of pairs with the same verdict in both modes
+    """
+    queries = [reference["query"] for reference in references.values()]
+    urls = sorted({url for reference in references.values() for url in reference_urls(reference)})
+    documents = [(url, markdown) for url, markdown in ((url, page_cache.get(url)) for url in urls) if markdown is not None]
+    documents = documents[:max_documents] if max_documents else documents
+    classifier = _openai()
+    input_price, output_price = MODEL_PRICES.get(classifier.model, (0.0, 0.0))
+
+    rows, verdicts = [], {}
+    for mode in ("single", "multi"):
+        tracker = UsageTracker(classifier.llm)
+        classifier.llm = tracker
+        predicted = {}
+        start = time.perf_counter()
+        for url, markdown in documents:
+            if mode == "single":
+                results = [classifier.classify_document(markdown, query) for query in queries]
+            else:
+                results = classifier.classify_document_multi(markdown, queries)
+            for query, result in zip(queries, results):
+                predicted[(url, query)] = result.classification
+        elapsed = time.perf_counter() - start
+        classifier.llm = tracker.llm
+        verdicts[mode] = predicted
+
+        pairs = max(1, len(predicted))
+        rows.append({
+            "mode": mode,
+            "documents": len(documents),
+            "queries": len(queries),
+            "llm_calls": tracker.calls,
+            "input_tokens_per_pair": tracker.input_tokens / pairs,
+            "output_tokens_per_pair": tracker.output_tokens / pairs,
+            "cost_usd_per_pair": (tracker.input_tokens * input_price + tracker.output_tokens * output_price) / 1_000_000 / pairs,
+            "seconds_per_pair": elapsed / pairs,
+        })
+    shared = verdicts["single"].keys() & verdicts["multi"].keys()
+    agreement = sum(1 for pair in shared if verdicts["single"][pair] == verdicts["multi"][pair]) / len(shared) if shared else None
+    for row in rows:
+        row["agreement"] = agreement
+    return rows
+
+
+def print_multi_query_report(rows):
+    table = Table(title="One call per (document, query) versus one call per document")
+    for column in ("Mode", "Docs x queries", "LLM calls", "Tokens in/out per pair", "Cost per pair (USD)", "Seconds per pair", "Agreement"):
+        table.add_column(column)
+    for row in rows:
+        table.add_row(
+            row["mode"], f"{row['documents']} x {row['queries']}", str(row["llm_calls"]),
+            f"{row['input_tokens_per_pair']:,.0f}/{row['output_tokens_per_pair']:,.0f}", f"{row['cost_usd_per_pair']:.6f}",
+            f"{row['seconds_per_pair']:.2f}", f"{row['agreement']:.1%}" if row["agreement"] is not None else "-",
+        )
+    console.print(table)
+
+
+def main():
+    """
+    Replays the test_dataset queries against cached content:
+        python -m evaluation_module.evaluation_harness --fill-from-db default_db --configs baseline cascade-0.9
+    """
+    parser = argparse.ArgumentParser(description="Compare pipeline configurations on the labelled test_dataset queries.")
+    parser.add_argument("--configs", nargs="+", default=["baseline"], choices=list(CONFIGURATIONS))
+    parser.add_argument("--dataset", default=DATASET_DIR)
+    parser.add_argument("--cache", default=CACHE_DIR)
+    parser.add_argument("--fill-from-db", metavar="DATABASE", help="Copy missing pages from stored crawl collections")
+    parser.add_argument("--fill-from-extractor", metavar="BACKEND", help="Extract missing pages once with this backend")
+    parser.add_argument("--compare-multi-query", nargs="?", const=0, type=int, metavar="MAX_DOCUMENTS",
+                        help="Compare single-query and multi-query classification of the cached documents against all queries")
+    args = parser.parse_args()
+
+    references = load_reference_sets(args.dataset)
+    page_cache = PageCache(args.cache)
+    urls = {url for reference in references.values() for url in reference_urls(reference)}
+
+    if args.fill_from_db:
+        from database_module.mongoDB import MongoDB
+        added = page_cache.fill_from_database(MongoDB(database_name=args.fill_from_db), urls)
+        console.print(f"[bold blue]Pages added from database:[/] {added}")
+    if args.fill_from_extractor:
+        from extraction_module.extractors import create_extractor
+        extractor = create_extractor(args.fill_from_extractor)
+        added = page_cache.fill_from_extractor(extractor, urls)
+        extractor.close()
+        console.print(f"[bold blue]Pages added by extraction:[/] {added}")
+
+    if args.compare_multi_query is not None:
+        with console.status("[bold blue]Comparing single-query and multi-query classification...[/]", spinner="aesthetic"):
+            multi_rows = compare_multi_query(references, page_cache, args.compare_multi_query or None)
+        print_multi_query_report(multi_rows)
+        return
+
+    rows = []
+    for name in args.configs:
+        with console.status(f"[bold blue]Evaluating configuration {name}...[/]", spinner="aesthetic"):
+            rows.extend(run_configuration(name, references, page_cache))
+
+    summary = summarize(rows)
+    print_report(summary)
+    file_path = write_report(summary + rows)
+    console.print(f"[bold green]Comparison table saved to {file_path}[/]")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
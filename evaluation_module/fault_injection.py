@@ -0,0 +1,81 @@
+import os
+import json
+import argparse
+from classification_module.LLM_classification import OpenAI, ClassificationResult, REPAIR_PROMPT
+from utils.logging_setup import setup_logging
+
+
+class FaultInjectingLLM:
+    """
+    Stub chat model for fault_injection_check. Returns a fixed sequence of responses, some of them broken,
+    and raises for the fault "raise".
+    """
+
+    def __init__(self, faults):
+        self.faults = list(faults)
+        self.position = 0
+
+    def _next(self, messages):
+        if messages[0][1] == REPAIR_PROMPT:
+            # The repair call receives only the broken response; the stub re-emits a valid object
+            return json.dumps({"classification": "Irrelevant", "explanation": "Repaired.", "summary": messages[1][1][:40]})
+        fault = self.faults[self.position % len(self.faults)]
+        self.position += 1
+        valid = {"classification": "Relevant", "explanation": "Matches the query.", "summary": "Stub document."}
+        if fault == "raise":
+            raise ConnectionError("injected failure")
+        return {
+            "valid": json.dumps(valid),
+            "fenced": f"```json\n{json.dumps(valid)}\n```",
+            "prose": f"Here is the result: {json.dumps(valid)} Hope this helps.",
+            "lowercase": json.dumps({**valid, "classification": "relevant"}),
+            "truncated": json.dumps(valid)[:30],
+            "empty": "",
+            "missing_field": json.dumps({"classification": "Relevant"}),
+        }[fault]
+
+    def invoke(self, messages, **kwargs):
+        content = self._next(messages)
+        return type("Message", (), {"content": content, "usage_metadata": {"input_tokens": 100, "output_tokens": 20}})()
+
+    def stream(self, messages, **kwargs):
+        content = self._next(messages)
+        for start in range(0, len(content), 7):
+            yield type("Fragment", (), {"content": content[start:start + 7], "usage_metadata": None})()
+
+
+def fault_injection_check(num_documents=700):
+    """
+    Classifies documents against a stub LLM that injects malformed responses and failed calls.
+    Every document must come back as a ClassificationResult, so no URL is lost.
+    """
+    faults = ["valid", "fenced", "prose", "lowercase", "truncated", "empty", "missing_field", "raise"]
+    os.environ.setdefault("OPENAI_API_KEY", "fault-injection")
+    classifier = OpenAI()
+    classifier.llm = FaultInjectingLLM(faults)
+
+    lost = 0
+    verdicts = {}
+    for i in range(num_documents):
+        classify = classifier.classify_document_stream if i % 2 else classifier.classify_document
+        result = classify(f"Document {i}", "stub query", chunks=[f"Document {i}"])
+        if not isinstance(result, ClassificationResult):
+            lost += 1
+            continue
+        verdicts[result.classification] = verdicts.get(result.classification, 0) + 1
+
+    usage = classifier.usage_report()
+    print(f"{num_documents} documents, injected faults: {', '.join(faults)}")
+    print(f"Lost URLs: {lost}, verdicts: {verdicts}")
+    print(f"LLM calls: {usage['calls']} ({usage['repair_calls']} repair calls), repaired: {usage['repaired']}, "
+          f"unclassifiable (returned as ERROR): {usage['failed']}")
+    assert lost == 0, "documents without a ClassificationResult"
+    assert usage["repair_calls"] <= num_documents, "more than one repair call per document"
+
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Classify documents against a stub LLM that injects malformed responses and failed calls.")
+    parser.add_argument("--documents", type=int, default=700)
+    args = parser.parse_args()
+    fault_injection_check(args.documents)
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import logging
+import threading
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveTimeout:
+    """
+    Learns a request timeout per host from observed extraction latency.
+
+    Latency is tracked with smoothed mean and mean deviation (the estimator TCP uses for its retransmission timeout),
+    and the timeout is mean + multiplier * deviation, clamped to [floor, ceiling]:
+    - A host that timed out repeatedly and never answered is held at the floor, so dead hosts stop costing the full wait.
+      Every probe_every-th request to it is a probe with the default timeout, so a host that is only slow can still answer.
+    - A host that answered before and then timed out gets an exponentially larger timeout, so slow but healthy hosts are not cut off.
+    - Unknown hosts, and hosts whose statistics are older than max_age, get the default timeout.
+    """
+
+    def __init__(self, path=os.path.join("OUTPUT", "domain_latency.json"), floor=5, ceiling=60, default=31, multiplier=4, alpha=0.125, beta=0.25, dead_after=2, probe_every=5, save_every=50, max_age=7 * 24 * 3600):
+        """
+        :param path: JSON file the statistics are persisted to between runs
+        :param floor: Minimum timeout in seconds
+        :param ceiling: Maximum timeout in seconds
+        :param default: Timeout in seconds for hosts without statistics
+        :param multiplier: Number of mean deviations added to the smoothed latency
+        :param alpha: Smoothing factor of the mean latency
+        :param beta: Smoothing factor of the mean deviation
+        :param dead_after: Consecutive timeouts after which a host that never answered is treated as dead
+        :param probe_every: A dead host gets the default timeout on every probe_every-th request, the floor otherwise
+        :param save_every: Number of observations between automatic saves
+        :param max_age: Seconds after the last observation at which the statistics of a host expire
+        """
+        self.path = path
+        self.floor = floor
+        self.ceiling = ceiling
+        self.default = default
+        self.multiplier = multiplier
+        self.alpha = alpha
+        self.beta = beta
+        self.dead_after = dead_after
+        self.probe_every = probe_every
+        self.save_every = save_every
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._observations = 0
+        self.wasted_wait = 0.0
+        self.requests = 0
+        self.timeouts = 0
+        self.hosts = self.load()
+
+    def load(self):
+        """
+        Loads persisted statistics. Hosts not observed for max_age seconds are dropped, so the file does not grow
+        without bound and a host is not judged by how it behaved weeks ago.
+
+        :return: Dictionary host -> statistics, empty if the file does not exist or is invalid
+        """
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                hosts = json.load(file)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Could not load domain latency statistics from %s: %s", self.path, e)
+            return {}
+        now = time.time()
+        return {host: stats for host, stats in hosts.items() if not self._expired(stats, now)}
+
+    def _expired(self, stats, now):
+        return now - stats.get("updated", 0) > self.max_age
+
+    def save(self):
+        """Writes the statistics to the JSON file."""
+        with self._lock:
+            snapshot = json.dumps(self.hosts, indent=4)
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temporary_path = f"{self.path}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                file.write(snapshot)
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            logger.error("Error saving domain latency statistics: %s", e)
+
+    def host(self, url):
+        return (urlparse(url).hostname or url).lower()
+
+    def timeout_for(self, url):
+        """
+        Computes the timeout for the next request to the host of the URL.
+
+        :param url: URL to be extracted
+        :return: Timeout in seconds
+        """
+        with self._lock:
+            stats = self.hosts.get(self.host(url))
+            if stats is None or self._expired(stats, time.time()):
+                return self.default
+            if stats["samples"] == 0:
+                dead_timeouts = stats["consecutive_timeouts"] - self.dead_after
+                if dead_timeouts >= 0 and (dead_timeouts + 1) % self.probe_every:
+                    return self.floor
+                return self.default
+            timeout = stats["srtt"] + self.multiplier * stats["rttvar"]
+            timeout *= 2 ** stats["consecutive_timeouts"]
+        return min(self.ceiling, max(self.floor, timeout))
+
+    def observe(self, url, seconds, timed_out=False):
+        """
+        Updates the statistics of the host with the outcome of one request.
+
+        :param url: Extracted URL
+        :param seconds: Time the request took (the timeout if it timed out)
+        :param timed_out: Whether the request hit its timeout
+        """
+        host = self.host(url)
+        with self._lock:
+            stats = self.hosts.get(host)
+            if stats is None or self._expired(stats, time.time()):
+                stats = self.hosts[host] = {"srtt": 0.0, "rttvar": 0.0, "samples": 0, "timeouts": 0, "consecutive_timeouts": 0}
+            self.requests += 1
+            if timed_out:
+                stats["timeouts"] += 1
+                stats["consecutive_timeouts"] += 1
+                self.timeouts += 1
+                self.wasted_wait += seconds
+            elif stats["samples"] == 0:
+                stats["srtt"] = seconds
+                stats["rttvar"] = seconds / 2
+                stats["samples"] = 1
+                stats["consecutive_timeouts"] = 0
+            else:
+                stats["rttvar"] = (1 - self.beta) * stats["rttvar"] + self.beta * abs(stats["srtt"] - seconds)
+                stats["srtt"] = (1 - self.alpha) * stats["srtt"] + self.alpha * seconds
+                stats["samples"] += 1
+                stats["consecutive_timeouts"] = 0
+            stats["updated"] = time.time()
+            self._observations += 1
+            should_save = self._observations % self.save_every == 0
+        if should_save:
+            self.save()
+
+    def report(self):
+        """
+        :return: Dictionary with requests, timeouts, timeout rate and seconds spent waiting on requests that timed out in this run
+        """
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "timeouts": self.timeouts,
+                "timeout_rate": self.timeouts / self.requests if self.requests else 0.0,
+                "wasted_wait_seconds": self.wasted_wait,
+                "known_hosts": len(self.hosts),
+            }
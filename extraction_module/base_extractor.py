@@ -0,0 +1,198 @@
+import sys
+import math
+import time
+import logging
+import threading
+
+from utils.output_filter import filter_markdown_content, filter_links
+from utils import profiler
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of a list of numbers.
+
+    :param values: Samples
+    :param p: Percentile between 0 and 100
+    :return: The percentile, or None for an empty list
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class BaseExtractor:
+    """
+    Common interface of the extraction backends.
+
+    Subclasses implement `_extract(url, level)` and return the same `(document, status_code)` tuple as
+    `extract_text_from_url`. The base class measures the latency of every request and post-processes
+    the raw content, in a process pool when a CpuStage is attached.
+    """
+
+    name = "base"
+    timeout = 31
+
+    def __init__(self, timeout_policy=None, cpu_stage=None):
+        """
+        :param timeout_policy: Optional AdaptiveTimeout deriving the timeout of each request from per-host latency
+        :param cpu_stage: Optional CpuStage running the markdown and link filtering (and token chunking) in worker processes
+        """
+        self._lock = threading.Lock()
+        self._latencies = []
+        self._timeout_policy = timeout_policy
+        self._cpu_stage = cpu_stage
+
+    def __getstate__(self):
+        # Extractors are passed to worker processes; locks and samples stay in the parent
+        state = {key: value for key, value in self.__dict__.items() if not key.startswith("_")}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._latencies = []
+        self._cpu_stage = None
+
+    def extract_text_from_url(self, url, level, cancel_event=None):
+        """
+        Extracts content of a URL and records the request latency.
+
+        :param url: The URL to scrape for content
+        :param level: The depth level of the scraping URL
+        :param cancel_event: Optional threading.Event; when set, the backend abandons the request and returns (None, None)
+        :return: A tuple (document, status_code); document holds url, markdown, links, metadata and level
+        """
+        start = time.perf_counter()
+        document, status_code = None, None
+        try:
+            document, status_code = self._extract(url, level, cancel_event)
+            return document, status_code
+        finally:
+            self.record_latency(url, time.perf_counter() - start, status_code)
+
+    def _extract(self, url, level, cancel_event=None):
+        raise NotImplementedError
+
+    def build_result(self, url, level, status_code, markdown, links, metadata):
+        """
+        Turns a raw scrape result into the `(document, status_code)` tuple shared by all backends.
+
+        :param url: The requested URL
+        :param level: The depth level of the URL
+        :param status_code: HTTP status code of the target page
+        :param markdown: Raw markdown content
+        :param links: Raw list of links
+        :param metadata: Backend metadata of the page
+        :return: A tuple (document, status_code); document is None unless status_code is 200
+        :note:
+        - Markdown and links are filtered by postprocess; the document holds "chunks" if the CpuStage chunked it
+        - 401, 402: Logs critical errors and terminates the program
+        - Other error codes are logged and returned without a document
+        """
+        if status_code == 200:
+            markdown, links, chunks = self.postprocess(markdown, links)
+            document = {
+                "url": (metadata or {}).get("url") or url,
+                "markdown": markdown,
+                "links": links,
+                "metadata": metadata,
+                "level": level
+            }
+            if chunks is not None:
+                document["chunks"] = chunks
+            logger.info("Successfully extracted content for URL: %s", url)
+            return document, status_code
+        elif status_code in [400, 404, 429]:
+            logger.warning("Non-critical error %s for URL: %s", status_code, url)
+            return None, status_code
+        elif status_code in [401, 402]:
+            logger.critical("Critical error %s for URL: %s. Terminating program...", status_code, url)
+            sys.exit(f"Critical error {status_code} encountered for URL: {url}")
+        elif status_code is not None and 500 <= status_code < 600:
+            logger.warning("Server error %s for URL: %s. Skipping...", status_code, url)
+            return None, status_code
+        elif status_code == 403:
+            logger.warning("Access denied (403) for URL: %s. Skipping...", url)
+            return None, status_code
+        else:
+            logger.warning("Unexpected status code %s for URL: %s. Handling as non-critical.", status_code, url)
+            return None, status_code
+
+    def postprocess(self, markdown, links):
+        """
+        Removes reference sections and undesired links.
+
+        :param markdown: Raw markdown content
+        :param links: Raw list of links
+        :return: Tuple (markdown, links, chunks); chunks is None unless the CpuStage tokenized the markdown
+        :note: With a CpuStage, the time this thread waits for the worker is profiled as cpu_wait, and the filter and
+               chunk durations measured in the worker are added to the filter and chunk stages.
+        """
+        if self._cpu_stage is None:
+            with profiler.stage("filter"):
+                return filter_markdown_content(markdown or ""), filter_links(links or []), None
+        with profiler.stage("cpu_wait"):
+            result = self._cpu_stage.submit(markdown or "", links or []).result()
+        for stage_name, seconds in result["timings"].items():
+            profiler.record(stage_name, seconds)
+        return result["markdown"], result["links"], result["chunks"]
+
+    def request_timeout(self, url):
+        """
+        :param url: URL about to be extracted
+        :return: Timeout in seconds for the request, learned per host if a timeout policy is set
+        """
+        if self._timeout_policy is None:
+            return self.timeout
+        return self._timeout_policy.timeout_for(url)
+
+    def observe_request(self, url, seconds, timed_out=False):
+        """
+        Reports the outcome of a request to the timeout policy.
+
+        :param url: Extracted URL
+        :param seconds: Time the request took
+        :param timed_out: Whether the request hit its timeout
+        """
+        if self._timeout_policy is not None:
+            self._timeout_policy.observe(url, seconds, timed_out)
+
+    def record_latency(self, url, seconds, status_code):
+        """
+        Stores the latency of one request.
+
+        :param url: The requested URL
+        :param seconds: Wall-clock duration of the request
+        :param status_code: Resulting status code, None on timeout or error
+        """
+        with self._lock:
+            self._latencies.append(seconds)
+        logger.info("[%s] %s took %.2fs (status %s)", self.name, url, seconds, status_code,
+                    extra={"url": url, "stage": "extraction", "latency": seconds, "status_code": status_code, "backend": self.name})
+
+    def latency_report(self):
+        """
+        Summarizes the request latencies observed so far.
+
+        :return: Dictionary with backend name, request count and mean/p50/p95/p99/max latency in seconds
+        """
+        with self._lock:
+            latencies = list(self._latencies)
+        return {
+            "backend": self.name,
+            "requests": len(latencies),
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else None,
+        }
+
+    def close(self):
+        """Releases resources held by the backend."""
+        pass
@@ -0,0 +1,23 @@
+import importlib
+
+# Backend name -> (module, class); modules are imported lazily so unused backends need no dependencies
+EXTRACTOR_BACKENDS = {
+    "firecrawl": ("extraction_module.firecrawl_extractor_v3", "FirecrawlExtractor"),
+    "jina": ("extraction_module.jina_reader_extractor", "JinaReaderExtractor"),
+    "firecrawl_batch": ("extraction_module.firecrawl_batch_extractor", "FirecrawlBatchExtractor"),
+}
+
+
+def create_extractor(backend="firecrawl", **kwargs):
+    """
+    Creates an extractor for the selected backend.
+
+    :param backend: Name of the backend, one of EXTRACTOR_BACKENDS
+    :param kwargs: Arguments passed to the extractor constructor
+    :return: Instance of a BaseExtractor subclass
+    """
+    if backend not in EXTRACTOR_BACKENDS:
+        raise ValueError(f"Unknown extractor backend: {backend}")
+    module_name, class_name = EXTRACTOR_BACKENDS[backend]
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)(**kwargs)
@@ -0,0 +1,369 @@
+import os
+import json
+import time
+import queue
+import random
+import logging
+import argparse
+import threading
+import http.server
+import concurrent.futures
+from urllib.parse import urlparse, parse_qs
+
+import requests
+from dotenv import load_dotenv
+from extraction_module.base_extractor import BaseExtractor
+from utils.logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+class FirecrawlBatchExtractor(BaseExtractor):
+    """
+    Firecrawl backend that scrapes many URLs per request through the batch scrape API.
+
+    URLs requested by concurrent workers are collected for up to `max_wait` seconds (or until `batch_size` URLs are
+    waiting) and submitted as one job with POST /v1/batch/scrape. Each job is polled with GET /v1/batch/scrape/{id};
+    every page returned so far is handed to the worker waiting for it as soon as it appears, and then goes through
+    the same status-code handling and post-processing as FirecrawlExtractor. Batches only fill up if the scheduler
+    runs at least `batch_size` workers.
+    """
+
+    name = "firecrawl_batch"
+
+    def __init__(self, batch_size=50, max_wait=1.0, poll_interval=2.0, batch_timeout=180, api_url=None, api_key=None, timeout_policy=None, cpu_stage=None):
+        """
+        :param batch_size: Maximum number of URLs per batch job
+        :param max_wait: Seconds a URL waits for more URLs before its batch is submitted
+        :param poll_interval: Seconds between two status requests of a job
+        :param batch_timeout: Seconds a URL waits for its result after its batch was submitted
+        :param api_url: Base URL of the Firecrawl API, defaults to FIRECRAWL_API_URL or https://api.firecrawl.dev
+        :param api_key: API key, defaults to FIRECRAWL_API_KEY
+        :param timeout_policy: Accepted for interface compatibility; batch latency is not a per-host latency
+        :param cpu_stage: Optional CpuStage for post-processing
+        """
+        super().__init__(timeout_policy, cpu_stage)
+        load_dotenv()
+        self.api_key = api_key or os.getenv("FIRECRAWL_API_KEY")
+        if not self.api_key:
+            logger.error("API key not found")
+            raise ValueError("API key not set!")
+        self.api_url = (api_url or os.getenv("FIRECRAWL_API_URL", "https://api.firecrawl.dev")).rstrip("/")
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.batch_timeout = batch_timeout
+
+        self.params = {
+                "formats": [ "markdown", "links" ],
+                "excludeTags": [ 'img', 'iframe', 'header', 'nav', 'footer', 'form' ],
+                "onlyMainContent": True,
+                'waitFor': 1000,
+                "timeout": 30000,
+        }
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"})
+        self._pending = queue.Queue()
+        self._closed = threading.Event()
+        self._stats = {"jobs": 0, "urls": 0, "status_requests": 0, "failed_jobs": 0}
+        self._dispatcher = threading.Thread(target=self._dispatch, name="firecrawl-batch-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def _extract(self, url, level, cancel_event=None):
+        """
+        Queues the URL for the next batch job and waits for its result.
+
+        :param url: The URL to scrape for content
+        :param level: The depth level of the scraping URL
+        :param cancel_event: Optional threading.Event; when set, the URL is abandoned and (None, None) returned
+        :return: A tuple (document, status_code) in the same shape as FirecrawlExtractor
+        """
+        future = concurrent.futures.Future()
+        self._pending.put((url, future))
+        deadline = time.monotonic() + self.max_wait + self.batch_timeout
+        while time.monotonic() < deadline:
+            done, _ = concurrent.futures.wait([future], timeout=0.5)
+            if done:
+                break
+            if cancel_event is not None and cancel_event.is_set():
+                future.cancel()
+                logger.info("Extraction cancelled for URL: %s.", url)
+                return None, None
+        else:
+            future.cancel()
+            logger.error("TIMEOUT reached for URL: %s after %.0fs in a batch job.", url, self.batch_timeout)
+            return None, None
+
+        scrape_result = future.result()
+        if "error" in scrape_result:
+            logger.error("Error during scraping: %s", scrape_result["error"])
+            return None, None
+
+        status_code = (scrape_result.get("metadata") or {}).get("statusCode")
+        if status_code != 200:
+            return self.build_result(url, level, status_code, None, None, scrape_result.get("metadata"))
+
+        return self.build_result(
+            url,
+            level,
+            status_code,
+            scrape_result.get("markdown", ""),
+            scrape_result.get("links", []),
+            scrape_result.get("metadata"),
+        )
+
+    def _dispatch(self):
+        # Collects waiting URLs into batches until the extractor is closed
+        while not self._closed.is_set():
+            try:
+                batch = [self._pending.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            futures = {}
+            for url, future in batch:
+                if not future.done():
+                    futures.setdefault(url, []).append(future)
+            if futures:
+                self._submit(futures)
+
+    def _submit(self, futures):
+        """
+        Starts a batch job and a thread polling it.
+
+        :param futures: Dictionary url -> list of Futures waiting for the result of the URL
+        """
+        try:
+            response = self.session.post(f"{self.api_url}/v1/batch/scrape", json={"urls": list(futures), **self.params}, timeout=30)
+        except requests.RequestException as e:
+            self._resolve_all(futures, {"error": f"Batch request failed: {e}"})
+            return
+        if response.status_code != 200:
+            # 429 goes back to the scheduler for every URL of the batch; 401 and 402 terminate in build_result
+            logger.warning("Batch scrape request rejected with status %s", response.status_code, extra={"status_code": response.status_code, "backend": self.name})
+            self._resolve_all(futures, {"metadata": {"statusCode": response.status_code}})
+            return
+        try:
+            payload = response.json()
+        except json.JSONDecodeError as e:
+            self._resolve_all(futures, {"error": f"Invalid JSON format: {e}"})
+            return
+        if not payload.get("success") or not payload.get("id"):
+            self._resolve_all(futures, {"error": payload.get("error") or "Batch scrape job was not created"})
+            return
+
+        for url in payload.get("invalidURLs") or []:
+            self._resolve(futures, url, {"metadata": {"statusCode": 400, "sourceURL": url}})
+        with self._lock:
+            self._stats["jobs"] += 1
+            self._stats["urls"] += len(futures)
+        logger.info("Batch scrape job %s started with %s URLs", payload["id"], len(futures), extra={"backend": self.name})
+        threading.Thread(target=self._poll, args=(payload["id"], futures), name=f"firecrawl-batch-{payload['id']}", daemon=True).start()
+
+    def _poll(self, job_id, futures):
+        # Hands every scraped page to its waiting worker as soon as the status endpoint returns it
+        deadline = time.monotonic() + self.batch_timeout
+        status = None
+        while futures and time.monotonic() < deadline and not self._closed.is_set():
+            time.sleep(self.poll_interval)
+            next_url = f"{self.api_url}/v1/batch/scrape/{job_id}"
+            # The job is only finished once a pass that started on a finished job has read every page
+            status = None
+            try:
+                while next_url and futures:
+                    response = self.session.get(next_url, timeout=30)
+                    with self._lock:
+                        self._stats["status_requests"] += 1
+                    if response.status_code == 429:
+                        break
+                    response.raise_for_status()
+                    payload = response.json()
+                    status = status or payload.get("status")
+                    for scrape_result in payload.get("data") or []:
+                        metadata = scrape_result.get("metadata") or {}
+                        self._resolve(futures, metadata.get("sourceURL") or metadata.get("url"), scrape_result)
+                    next_url = payload.get("next")
+            except (requests.RequestException, json.JSONDecodeError) as e:
+                logger.warning("Status request of batch job %s failed: %s", job_id, e, extra={"backend": self.name})
+                continue
+            if status in ("completed", "failed", "cancelled"):
+                break
+        if status == "failed":
+            with self._lock:
+                self._stats["failed_jobs"] += 1
+        # URLs the job did not return (failed scrapes, failed job, timeout) are released as errors
+        self._resolve_all(futures, {"error": f"No result in batch job {job_id} (status {status})"})
+
+    def _resolve(self, futures, url, scrape_result):
+        for future in futures.pop(url, []):
+            if not future.done():
+                try:
+                    future.set_result(scrape_result)
+                except concurrent.futures.InvalidStateError:
+                    # Cancelled by its worker in the meantime
+                    pass
+
+    def _resolve_all(self, futures, scrape_result):
+        for url in list(futures):
+            self._resolve(futures, url, scrape_result)
+
+    def batch_report(self):
+        """
+        :return: Dictionary with the number of batch jobs, submitted URLs, status requests and failed jobs
+        """
+        with self._lock:
+            report = dict(self._stats)
+        report["urls_per_job"] = report["urls"] / report["jobs"] if report["jobs"] else None
+        return report
+
+    def close(self):
+        """Stops the dispatcher and closes the HTTP session."""
+        self._closed.set()
+        self._dispatcher.join()
+        self.session.close()
+
+
+class StubBatchServer:
+    """
+    Local HTTP server emulating the Firecrawl batch scrape endpoints, for checking FirecrawlBatchExtractor offline.
+
+    Every page of a job completes after a random delay. URLs containing "status-<code>" are returned with that status
+    code, and URLs containing "invalid" are reported in invalidURLs. Status responses are paginated with `next`.
+    """
+
+    def __init__(self, min_delay=0.05, max_delay=0.5, page_size=10, seed=7):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.page_size = page_size
+        self.rng = random.Random(seed)
+        self.jobs = {}
+        self.requests = {"POST": 0, "GET": 0}
+        self.lock = threading.Lock()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_job(self, urls):
+        valid = [url for url in urls if "invalid" not in url]
+        with self.lock:
+            job_id = f"job-{len(self.jobs)}"
+            now = time.monotonic()
+            self.jobs[job_id] = [(now + self.rng.uniform(self.min_delay, self.max_delay), url) for url in valid]
+        return {"success": True, "id": job_id, "url": f"{self.url}/v1/batch/scrape/{job_id}",
+                "invalidURLs": [url for url in urls if "invalid" in url]}
+
+    def job_status(self, job_id, skip):
+        now = time.monotonic()
+        with self.lock:
+            pages = self.jobs[job_id]
+        # Pages are listed in the order they completed, so `skip` stays valid while the job runs
+        completed = [url for ready, url in sorted(pages) if ready <= now]
+        data = []
+        for url in completed[skip:skip + self.page_size]:
+            status_code = int(url.split("status-")[1][:3]) if "status-" in url else 200
+            data.append({
+                "markdown": f"# {url}\n\nContent of {url}." if status_code == 200 else None,
+                "links": [f"{url}/child-{i}" for i in range(3)] if status_code == 200 else [],
+                "metadata": {"sourceURL": url, "url": url, "statusCode": status_code},
+            })
+        more = skip + self.page_size < len(completed)
+        return {
+            "success": True,
+            "status": "completed" if len(completed) == len(pages) else "scraping",
+            "total": len(pages),
+            "completed": len(completed),
+            "creditsUsed": len(completed),
+            "next": f"{self.url}/v1/batch/scrape/{job_id}?skip={skip + self.page_size}" if more else None,
+            "data": data,
+        }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                with stub.lock:
+                    stub.requests["POST"] += 1
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                self._send(200, stub.create_job(body["urls"]))
+
+            def do_GET(self):
+                with stub.lock:
+                    stub.requests["GET"] += 1
+                parsed = urlparse(self.path)
+                job_id = parsed.path.rsplit("/", 1)[-1]
+                if job_id not in stub.jobs:
+                    self._send(404, {"success": False, "error": "Job not found"})
+                    return
+                skip = int(parse_qs(parsed.query).get("skip", ["0"])[0])
+                self._send(200, stub.job_status(job_id, skip))
+
+            def _send(self, status_code, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def check_against_stub(num_urls=200, concurrency=100, batch_size=50):
+    """
+    Extracts synthetic URLs through a StubBatchServer and checks every result, including error statuses and invalid URLs.
+
+    :param num_urls: Number of URLs
+    :param concurrency: Number of concurrent workers, as set in the CrawlScheduler
+    :param batch_size: Maximum number of URLs per batch job
+    """
+    urls = [f"https://www.example-{i % 13}.com/page/{i}" for i in range(num_urls)]
+    urls[1::25] = [f"https://www.example.com/status-404/{i}" for i in range(len(urls[1::25]))]
+    urls[2::50] = [f"https://www.example.com/invalid/{i}" for i in range(len(urls[2::50]))]
+    with StubBatchServer() as stub:
+        extractor = FirecrawlBatchExtractor(batch_size=batch_size, max_wait=0.2, poll_interval=0.1, batch_timeout=30, api_url=stub.url, api_key="stub")
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(lambda url: extractor.extract_text_from_url(url, 1), urls))
+        elapsed = time.perf_counter() - start
+        extractor.close()
+
+    for url, (document, status_code) in zip(urls, results):
+        expected = 400 if "invalid" in url else 404 if "status-404" in url else 200
+        assert status_code == expected, (url, status_code)
+        assert (document is not None) == (expected == 200), url
+        if document is not None:
+            assert document["url"] == url and document["markdown"] and len(document["links"]) == 3
+    report = extractor.batch_report()
+    print(f"{num_urls} URLs in {elapsed:.2f}s: {report['jobs']} batch jobs ({report['urls_per_job']:.0f} URLs per job), "
+          f"{stub.requests['POST']} POST and {stub.requests['GET']} GET requests instead of {num_urls} scrape requests")
+    print(f"Latency: {extractor.latency_report()}")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Check the Firecrawl batch extractor against a local stub of the batch scrape API.")
+    parser.add_argument("--urls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+    check_against_stub(args.urls, args.concurrency, args.batch_size)
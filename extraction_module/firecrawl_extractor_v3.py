@@ -1,29 +1,27 @@
 from firecrawl import FirecrawlApp
 import os
+import math
+import time
 import logging
 from dotenv import load_dotenv
-from utils.output_filter import filter_markdown_content, filter_links
-import sys
+from extraction_module.base_extractor import BaseExtractor
+from utils.logging_setup import setup_logging, stop_logging
 import json
 
 from multiprocessing import Process, Queue
 
-logging.getLogger().handlers.clear()
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("search_log.log", mode='a', encoding='utf-8'), 
-    ]
-)
+logger = logging.getLogger(__name__)
 
-class FirecrawlExtractor:
+class FirecrawlExtractor(BaseExtractor):
 
-    def __init__(self):
+    name = "firecrawl"
+
+    def __init__(self, timeout_policy=None, cpu_stage=None):
+        super().__init__(timeout_policy, cpu_stage)
         load_dotenv()
         self.api_key = os.getenv("FIRECRAWL_API_KEY")
         if not self.api_key:
-            logging.error("API key not found")
+            logger.error("API key not found")
             raise ValueError("API key not set!")
         
         self.app = FirecrawlApp(api_key=self.api_key)
@@ -45,12 +43,13 @@ class FirecrawlExtractor:
         :return: Slovník s extrahovaným obsahem nebo None v případě chyby
         """
 
-    def extract_text_from_url(self, url, level):
+    def _extract(self, url, level, cancel_event=None):
         """
         Extracts text content from a given URL while handling potential errors and timeouts.
 
         :param url: The URL to scrape for content
         :param level: The depth level of the scraping RUL
+        :param cancel_event: Optional threading.Event; when set, the scraping process is terminated
         :return: A tuple containing:
             - document: A dictionary with extracted content, including:
                 - url: The original URL
@@ -62,98 +61,104 @@ class FirecrawlExtractor:
 
         :note:
         - Uses multiprocessing to scrape the URL content in a separate process.(Regularly checks the result queue for the scraping output until the timeout is reached.)
-        - Handles various HTTP status codes with appropriate actions:
+        - Status codes are handled by BaseExtractor.build_result:
             - 200: Successful extraction; returns the document
             - 400, 404, 429: Logs warnings and skips the URL
             - 401, 402: Logs critical errors and terminates the program
             - 500-599: Logs server errors and skips the URL
             - 403: Logs access denied warnings and skips the URL
             - Unexpected codes are logged as non-critical warnings
-        - Implements a timeout mechanism to terminate unresponsive scraping processes.
-        - Filters and processes markdown content and links using helper functions filter_markdown_content and filter_links
+        - Implements a timeout mechanism to terminate unresponsive scraping processes. With a timeout policy the timeout is learned per host.
+        - Filters and processes markdown content and links in BaseExtractor.postprocess (filter_markdown_content and filter_links)
         - Logs detailed information, warnings, and errors for debugging and monitoring purposes, because Firecrawl is not pereft despite they are trying
         """
         
         # Queue for sharing results between processes + start a separate process for the scraping task, passing the queue and URL as arguments
+        timeout = self.request_timeout(url)
+        params = {**self.params, "timeout": int(max(1, timeout - 1) * 1000)}
         queue = Queue()  
-        process = Process(target=self.scrape_task, args=(queue, url))
+        process = Process(target=self.scrape_task, args=(queue, url, params))
         process.start()
+        start = time.monotonic()
 
         try:
             # Periodically checks the queue to see if the result is ready
             scrape_result = None
             status_code = None
-            for _ in range(self.timeout):
+            for _ in range(math.ceil(timeout)):
                 if not queue.empty():
                     scrape_result = queue.get()
                     break
+                if cancel_event is not None and cancel_event.is_set():
+                    logger.info("Extraction cancelled for URL: %s. Terminating process.", url)
+                    process.terminate()
+                    process.join()
+                    return None, None
                 process.join(timeout=1)  
 
             if scrape_result is None:  # Timeout
-                logging.error(f"TIMEOUT reached for URL: {url}. Terminating process.")
+                logger.error("TIMEOUT reached for URL: %s after %.0fs. Terminating process.", url, timeout)
                 process.terminate()  # Terminates the process
                 process.join()
+                self.observe_request(url, time.monotonic() - start, timed_out=True)
                 return None, None
 
             if "error" in scrape_result:
-                logging.error(f"Error during scraping: {scrape_result['error']}")
+                logger.error("Error during scraping: %s", scrape_result['error'])
+                # Firecrawl reports its own server-side timeout as an error
+                self.observe_request(url, time.monotonic() - start, timed_out="timeout" in scrape_result["error"].lower())
                 return None, None
 
-            status_code = scrape_result.get("metadata", {}).get("statusCode", None)
+            self.observe_request(url, time.monotonic() - start)
 
-            if status_code == 200:
-                document = {
-                    "url": scrape_result.get("metadata", {}).get("url"),
-                    "markdown": filter_markdown_content(scrape_result.get("markdown", "")),
-                    "links": filter_links(scrape_result.get("links", [])),
-                    "metadata": scrape_result.get("metadata"),
-                    "level": level
-                }
-                logging.info(f"Successfully extracted content for URL: {url}")
-                return document, status_code
-            elif status_code in [400, 404, 429]:
-                logging.warning(f"Non-critical error {status_code} for URL: {url}")
-                return None, status_code
-            elif status_code in [401, 402]:
-                logging.critical(f"Critical error {status_code} for URL: {url}. Terminating program...")
-                sys.exit(f"Critical error {status_code} encountered for URL: {url}")
-            elif 500 <= status_code < 600:
-                logging.warning(f"Server error {status_code} for URL: {url}. Skipping...")
-                return None, status_code
-            elif status_code == 403:
-                logging.warning(f"Access denied (403) for URL: {url}. Skipping...")
-                return None, status_code
-            else:
-                logging.warning(f"Unexpected status code {status_code} for URL: {url}. Handling as non-critical.")
-                return None, status_code
+            status_code = scrape_result.get("metadata", {}).get("statusCode", None)
+            if status_code != 200:
+                return self.build_result(url, level, status_code, None, None, scrape_result.get("metadata"))
+
+            return self.build_result(
+                url,
+                level,
+                status_code,
+                scrape_result.get("markdown", ""),
+                scrape_result.get("links", []),
+                scrape_result.get("metadata"),
+            )
 
         except Exception as e:
-            logging.error(f"Unexpected error for URL: {url}. Terminating process. Error: {e}")
+            logger.error("Unexpected error for URL: %s. Terminating process. Error: %s", url, e)
             process.terminate()  # Process termination on error
             process.join()
             return None, None
 
-    def scrape_task(self, queue, url):
+    def scrape_task(self, queue, url, params=None):
         """
         Scrapes the content of a given URL and puts the result in a queue.
 
         :param queue: A multiprocessing queue used to share the scraping result with the main process
         :param url: The URL to scrape
+        :param params: Scrape parameters, defaults to self.params
+        :note: Runs in a forked child process, which starts its own logging listener and flushes it before exiting
         """
+        setup_logging()
         try:
-            result = self.app.scrape_url(url, self.params)
+            result = self.app.scrape_url(url, params or self.params)
             queue.put(result)  # Výsledek vrací do fronty
         except json.JSONDecodeError as e:
+            logger.error("Invalid JSON returned for URL: %s: %s", url, e, extra={"url": url, "stage": "extraction"})
             queue.put({"error": f"Invalid JSON format: {e}"})
         except Exception as e:
+            logger.error("Scraping failed for URL: %s: %s", url, e, extra={"url": url, "stage": "extraction"})
             queue.put({"error": str(e)})
+        finally:
+            # multiprocessing ends the child without running atexit handlers
+            stop_logging()
  
 
 
 
 def test_extract_text():
         """Test"""
-        logging.info("Starting test for extract_text_from_url...")
+        logger.info("Starting test for extract_text_from_url...")
         extractor = FirecrawlExtractor()
 
         test_url = "https://example.com"
@@ -172,6 +177,7 @@ def test_extract_text():
             print(f"An error occurred during the test: {e}")
 
 if __name__ == "__main__":
+     setup_logging()
      test_extract_text()
 
 
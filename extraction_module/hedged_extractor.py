@@ -0,0 +1,166 @@
+import time
+import logging
+import threading
+import concurrent.futures
+from extraction_module.base_extractor import BaseExtractor, percentile
+
+logger = logging.getLogger(__name__)
+
+
+class HedgedExtractor(BaseExtractor):
+    """
+    Wraps a primary extractor and launches a second attempt when the primary is slower than usual.
+
+    The hedge delay is a percentile of the primary latencies so far. A primary that was cancelled after losing to the
+    hedge enters with the time it ran, a lower bound of its latency; leaving it out would censor exactly the slow tail
+    and pull the delay down.
+    The first successful result wins and the other attempt is cancelled.
+    """
+
+    def __init__(self, primary, secondary=None, hedge_percentile=95, initial_delay=10.0, min_delay=1.0, min_samples=10, concurrency=4, max_workers=None, measure_primary=False):
+        """
+        :param primary: Extractor used for every request
+        :param secondary: Extractor used for the hedge; defaults to the primary (plain retry)
+        :param hedge_percentile: Percentile of primary latency after which the hedge is launched
+        :param initial_delay: Hedge delay in seconds used until min_samples latencies are known
+        :param min_delay: Lower bound of the hedge delay in seconds
+        :param min_samples: Number of primary latencies needed before the percentile is used
+        :param concurrency: Number of URLs the crawl extracts at the same time
+        :param max_workers: Threads available for concurrent attempts, defaults to two per concurrent URL (primary and hedge)
+        :param measure_primary: If True, a primary that lost to the hedge is left to finish in the background
+                                so its real latency enters the report instead of a lower bound
+        """
+        super().__init__()
+        self.primary = primary
+        self.secondary = secondary or primary
+        self.name = f"hedged({primary.name}+{self.secondary.name})"
+        self.hedge_percentile = hedge_percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.measure_primary = measure_primary
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or 2 * concurrency, thread_name_prefix="hedge")
+        self._primary_bounds = []
+        self._stats = {"requests": 0, "hedges": 0, "hedge_wins": 0}
+
+    def hedge_delay(self):
+        """
+        :return: Seconds to wait for the primary before launching the hedge
+        """
+        with self._lock:
+            latencies = list(self._primary_bounds)
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, percentile(latencies, self.hedge_percentile))
+
+    def _attempt(self, extractor, url, level, cancel_event):
+        start = time.perf_counter()
+        document, status_code = extractor.extract_text_from_url(url, level, cancel_event)
+        return document, status_code, time.perf_counter() - start
+
+    def _is_final(self, result):
+        # A real answer from the target ends the race; timeouts, rate limits and server errors do not
+        document, status_code, _ = result
+        if document is not None:
+            return True
+        return status_code is not None and status_code != 429 and not 500 <= status_code < 600
+
+    def _extract(self, url, level, cancel_event=None):
+        """
+        Extracts a URL with the primary extractor and hedges with the secondary one if the primary is slow.
+
+        :param url: The URL to scrape for content
+        :param level: The depth level of the scraping URL
+        :param cancel_event: Optional threading.Event cancelling both attempts
+        :return: A tuple (document, status_code)
+        """
+        start = time.perf_counter()
+        delay = self.hedge_delay()
+        cancels = {"primary": threading.Event()}
+        futures = {self._executor.submit(self._attempt, self.primary, url, level, cancels["primary"]): "primary"}
+
+        concurrent.futures.wait(futures, timeout=delay)
+        hedged = not next(iter(futures)).done() and not (cancel_event is not None and cancel_event.is_set())
+        if hedged:
+            logger.info("Primary extraction of %s slower than %.2fs, launching hedge on %s", url, delay, self.secondary.name)
+            cancels["hedge"] = threading.Event()
+            futures[self._executor.submit(self._attempt, self.secondary, url, level, cancels["hedge"])] = "hedge"
+
+        winner, fallback = None, None
+        primary_elapsed = None
+        pending = set(futures)
+        while pending and winner is None:
+            done, pending = concurrent.futures.wait(pending, timeout=0.1, return_when=concurrent.futures.FIRST_COMPLETED)
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            for future in done:
+                result = future.result()
+                if futures[future] == "primary":
+                    primary_elapsed = result[2]
+                if self._is_final(result) and winner is None:
+                    winner = (futures[future], result)
+                elif fallback is None or fallback[1][1] is None:
+                    fallback = (futures[future], result)
+
+        primary_future = next(iter(futures))
+        measure_in_background = self.measure_primary and primary_elapsed is None and not primary_future.done()
+        for name, event in cancels.items():
+            if not (name == "primary" and measure_in_background):
+                event.set()
+        if measure_in_background:
+            primary_future.add_done_callback(self._record_primary_bound)
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["hedges"] += int(hedged)
+            if winner is not None and winner[0] == "hedge":
+                self._stats["hedge_wins"] += 1
+            if primary_elapsed is not None:
+                self._primary_bounds.append(primary_elapsed)
+            elif not measure_in_background:
+                # Primary was cancelled; it would have taken at least this long
+                self._primary_bounds.append(elapsed)
+
+        chosen = winner or fallback
+        if chosen is None:
+            return None, None
+        document, status_code, _ = chosen[1]
+        logger.info("Extraction of %s won by %s after %.2fs", url, chosen[0], elapsed,
+                    extra={"url": url, "stage": "hedged_extraction", "latency": elapsed, "backend": chosen[0]})
+        return document, status_code
+
+    def _record_primary_bound(self, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        with self._lock:
+            self._primary_bounds.append(future.result()[2])
+
+    def hedge_report(self):
+        """
+        Summarizes hedging for the run.
+
+        :return: Dictionary with request and hedge counts, extra request cost and the p99 latency with and without hedging
+        :note: Unless measure_primary is set, primary latencies of cancelled attempts are lower bounds, so the reported p99 reduction is conservative.
+        """
+        observed = self.latency_report()
+        with self._lock:
+            stats = dict(self._stats)
+            bounds = list(self._primary_bounds)
+        primary_p99 = percentile(bounds, 99)
+        hedged_p99 = observed["p99"]
+        return {
+            **stats,
+            "extra_request_ratio": stats["hedges"] / stats["requests"] if stats["requests"] else 0.0,
+            "hedge_delay": self.hedge_delay(),
+            "primary_p99": primary_p99,
+            "hedged_p99": hedged_p99,
+            "p99_reduction": primary_p99 - hedged_p99 if primary_p99 is not None and hedged_p99 is not None else None,
+        }
+
+    def close(self):
+        """Closes the wrapped extractors and the thread pool."""
+        self._executor.shutdown(wait=True)
+        self.primary.close()
+        if self.secondary is not self.primary:
+            self.secondary.close()
@@ -0,0 +1,212 @@
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import threading
+import concurrent.futures
+import httpx
+from dotenv import load_dotenv
+from extraction_module.base_extractor import BaseExtractor
+from utils.logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+class JinaReaderExtractor(BaseExtractor):
+
+    name = "jina"
+
+    def __init__(self, max_connections=20, timeout=31, timeout_policy=None, cpu_stage=None):
+        """
+        :param max_connections: Size of the keep-alive connection pool to r.jina.ai
+        :param timeout: Default request timeout in seconds
+        :param timeout_policy: Optional AdaptiveTimeout learning the timeout per host
+        :param cpu_stage: Optional CpuStage for post-processing
+        """
+        super().__init__(timeout_policy, cpu_stage)
+        load_dotenv()
+        self.api_key = os.getenv("JINA_API_KEY")
+        self.api_url = os.getenv("JINA_API_URL", "https://r.jina.ai/")
+        self.timeout = timeout
+        self.max_connections = max_connections
+
+        self.headers = {
+            "Accept": "application/json",
+            "X-With-Links-Summary": "true",
+            "X-Remove-Selector": "header, nav, footer, form, iframe",
+            "X-Retain-Images": "none",
+        }
+        if self.api_key:
+            self.headers["Authorization"] = f"Bearer {self.api_key}"
+        else:
+            logger.warning("JINA_API_KEY not found, using anonymous rate limits")
+
+        # One event loop and one pooled client for the lifetime of the extractor
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="jina-reader-loop", daemon=True)
+        self._thread.start()
+        self._client = asyncio.run_coroutine_threadsafe(self._create_client(), self._loop).result()
+
+    async def _create_client(self):
+        return httpx.AsyncClient(
+            headers=self.headers,
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections, keepalive_expiry=30),
+        )
+
+    def _extract(self, url, level, cancel_event=None):
+        """
+        Extracts text content from a given URL through the Jina Reader API.
+
+        :param url: The URL to scrape for content
+        :param level: The depth level of the scraping URL
+        :param cancel_event: Optional threading.Event; when set, the request is cancelled
+        :return: A tuple (document, status_code) in the same shape as FirecrawlExtractor
+        :note: Only the request runs on the event loop. The response is turned into a document on the calling thread,
+               so postprocessing (and a CpuStage wait or a sys.exit on 401/402) never blocks or ends the loop thread.
+        """
+        timeout = self.request_timeout(url)
+        future = asyncio.run_coroutine_threadsafe(self.aextract(url, timeout), self._loop)
+        deadline = time.monotonic() + timeout + 1
+        while time.monotonic() < deadline:
+            done, _ = concurrent.futures.wait([future], timeout=0.1)
+            if done:
+                response_status, payload = future.result()
+                return self.document_from_payload(url, level, response_status, payload)
+            if cancel_event is not None and cancel_event.is_set():
+                future.cancel()
+                logger.info("Extraction cancelled for URL: %s.", url)
+                return None, None
+        future.cancel()
+        logger.error("TIMEOUT reached for URL: %s.", url)
+        return None, None
+
+    async def aextract(self, url, timeout=None):
+        """
+        Coroutine fetching the raw Jina Reader response, usable directly from asyncio code.
+        Pass the result to document_from_payload (outside the event loop) to get the document.
+
+        :param url: The URL to scrape for content
+        :param timeout: Request timeout in seconds, defaults to the timeout policy or self.timeout
+        :return: A tuple (response_status, payload); payload is the parsed JSON response, None if the response was not
+                 valid JSON. Both are None if the request failed or timed out
+        """
+        timeout = timeout or self.request_timeout(url)
+        start = time.monotonic()
+        try:
+            response = await self._client.post(
+                self.api_url,
+                json={"url": url},
+                headers={"X-Timeout": str(int(max(1, timeout - 1)))},
+                timeout=timeout,
+            )
+        except httpx.TimeoutException:
+            logger.error("TIMEOUT reached for URL: %s after %.0fs.", url, timeout)
+            self.observe_request(url, time.monotonic() - start, timed_out=True)
+            return None, None
+        except httpx.HTTPError as e:
+            logger.error("Error during scraping: %s", e)
+            return None, None
+        self.observe_request(url, time.monotonic() - start)
+
+        try:
+            return response.status_code, response.json()
+        except json.JSONDecodeError as e:
+            logger.error("Invalid JSON format from Jina Reader for URL %s: %s", url, e)
+            return response.status_code, None
+
+    def document_from_payload(self, url, level, response_status, payload):
+        """
+        Turns a raw Jina Reader response into the `(document, status_code)` tuple shared by all backends.
+
+        :param url: The requested URL
+        :param level: The depth level of the URL
+        :param response_status: HTTP status of the Jina response, None if the request failed
+        :param payload: Parsed JSON response, None if missing or invalid
+        :return: A tuple (document, status_code)
+        """
+        if payload is None:
+            return None, response_status if response_status != 200 else None
+
+        data = payload.get("data") or {}
+        status_code = self.target_status_code(response_status, payload)
+        metadata = {
+            "url": data.get("url") or url,
+            "sourceURL": url,
+            "title": data.get("title"),
+            "description": data.get("description"),
+            "publishedTime": data.get("publishedTime"),
+            "statusCode": status_code,
+        }
+        if status_code != 200:
+            return self.build_result(url, level, status_code, None, None, metadata)
+
+        return self.build_result(
+            url,
+            level,
+            status_code,
+            data.get("content", ""),
+            self.links_from_payload(data.get("links")),
+            metadata,
+        )
+
+    def target_status_code(self, response_status, payload):
+        """
+        Determines the status code of the target page.
+        Jina answers 200 even when the target page failed and reports the failure in a warning.
+
+        :param response_status: HTTP status of the Jina response
+        :param payload: Parsed JSON response
+        :return: Status code of the target page
+        """
+        if response_status != 200:
+            return response_status
+        warning = (payload.get("data") or {}).get("warning") or ""
+        match = re.search(r"returned error (\d{3})", warning)
+        if match:
+            return int(match.group(1))
+        return payload.get("code", response_status)
+
+    def links_from_payload(self, links):
+        """
+        Normalizes the links summary, which is either a {text: url} mapping or a list of [text, url] pairs.
+
+        :param links: Links summary from the Jina response
+        :return: List of URLs
+        """
+        if not links:
+            return []
+        if isinstance(links, dict):
+            return list(links.values())
+        return [link[-1] if isinstance(link, (list, tuple)) else link for link in links]
+
+    def close(self):
+        """Closes the connection pool and stops the event loop."""
+        if self._loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def test_extract_text():
+    """Test"""
+    extractor = JinaReaderExtractor()
+    try:
+        document, status_code = extractor.extract_text_from_url("https://example.com", 1)
+        if document:
+            print("Document successfully extracted:")
+            print(json.dumps(document, indent=2))
+        else:
+            print(f"Failed to extract document. Status code: {status_code}")
+        print(extractor.latency_report())
+    finally:
+        extractor.close()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    test_extract_text()
@@ -0,0 +1,60 @@
+import logging
+from extraction_module.base_extractor import BaseExtractor
+
+logger = logging.getLogger(__name__)
+
+
+class StoredExtractor(BaseExtractor):
+    """
+    Serves URLs found in the SemanticIndex from the content stored by earlier runs and passes all other URLs
+    to the wrapped extractor, so stored candidates are classified without a network fetch.
+    """
+
+    def __init__(self, extractor, database_handler, stored_urls):
+        """
+        :param extractor: Extractor used for URLs without stored content
+        :param database_handler: Instance of MongoDB pointing at the database the index was built from
+        :param stored_urls: Dictionary url -> collection holding its stored document
+        """
+        super().__init__()
+        self.extractor = extractor
+        self.database_handler = database_handler
+        self.stored_urls = dict(stored_urls)
+        self.name = f"stored+{extractor.name}"
+        self._stats = {"served": 0, "missing": 0}
+
+    def _extract(self, url, level, cancel_event=None):
+        collection_name = self.stored_urls.get(url)
+        if collection_name is not None:
+            document = self.database_handler.find_document(url, collection_name=collection_name)
+            if document and document.get("markdown"):
+                with self._lock:
+                    self._stats["served"] += 1
+                logger.info("Serving stored content of %s from collection %s", url, collection_name, extra={"url": url, "level": level, "stage": "extraction"})
+                return {
+                    "url": url,
+                    "markdown": document["markdown"],
+                    "links": document.get("links") or [],
+                    "metadata": document.get("metadata"),
+                    "level": level,
+                }, 200
+            with self._lock:
+                self._stats["missing"] += 1
+        return self.extractor.extract_text_from_url(url, level, cancel_event)
+
+    def record_latency(self, url, seconds, status_code):
+        # Latencies of network requests are recorded by the wrapped extractor
+        pass
+
+    def latency_report(self):
+        return self.extractor.latency_report()
+
+    def stored_report(self):
+        """
+        :return: Dictionary with the number of stored candidates, those served from storage and those no longer stored
+        """
+        with self._lock:
+            return {"candidates": len(self.stored_urls), **self._stats}
+
+    def close(self):
+        self.extractor.close()
@@ -3,14 +3,8 @@ import logging
 from langchain_community.tools import BraveSearch
 import os
 from dotenv import load_dotenv
+from utils.logging_setup import setup_logging
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("search_log.log", mode='a', encoding='utf-8'), 
-        ]
-)
 logger = logging.getLogger(__name__)
 
 class BraveSearchEngine:
@@ -18,7 +12,7 @@ class BraveSearchEngine:
         load_dotenv()
         self.BRAVE_SEARCH_API_KEY = os.getenv("BRAVE_SEARCH_API_KEY")
         if not self.BRAVE_SEARCH_API_KEY:
-            logging.error("API key not found")
+            logger.error("API key not found")
             raise ValueError("API key not set!")
 
         self.brave_search = BraveSearch.from_api_key(
@@ -55,10 +49,10 @@ class BraveSearchEngine:
             raw_results = self.brave_search.run(query)
             results_json = json.loads(raw_results)
         except json.JSONDecodeError as e:
-            logger.error(f"Error decoding JSON: {e}")
+            logger.error("Error decoding JSON: %s", e)
             return []
         except Exception as e:
-            logger.error(f"An unexpected error occurred while searching: {e}")
+            logger.error("An unexpected error occurred while searching: %s", e)
             return []
         
         links = self.extract_links_from_results(results_json)
@@ -85,4 +79,5 @@ def main():
         print("No links found.")
 
 if __name__ == "__main__":
+    setup_logging()
     main()
\ No newline at end of file
@@ -0,0 +1,253 @@
+import os
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from utils.output_filter import filter_markdown_content, filter_links, normalize_markdown
+from utils.logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# tiktoken encodings loaded in this (worker) process, by model name
+_encodings = {}
+
+
+class Chunk(str):
+    """
+    Text of one chunk with its token count, so the classifier can apply the token budget without encoding it again.
+    """
+
+    def __new__(cls, text, tokens):
+        chunk = super().__new__(cls, text)
+        chunk.tokens = tokens
+        return chunk
+
+    def __reduce__(self):
+        # Sent back from the worker processes with the count
+        return Chunk, (str(self), self.tokens)
+
+
+def split_into_chunks(document_text, model, max_tokens, overlap_tokens):
+    """
+    Same chunking as OpenAI.split_into_chunks, with the encoding cached per process.
+
+    :return: A list of Chunk, or None if the encoding is not available
+    """
+    import tiktoken
+
+    try:
+        if model not in _encodings:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        encoding = _encodings[model]
+    except Exception as e:
+        logger.error("Error loading tiktoken encoding for %s: %s", model, e)
+        return None
+
+    tokens = encoding.encode(document_text)
+    chunks = []
+    start = 0
+    while start < len(tokens):
+        chunk = tokens[start:start + max_tokens]
+        chunks.append(Chunk(encoding.decode(chunk), len(chunk)))
+        start += max_tokens - overlap_tokens
+    return chunks
+
+
+def postprocess_document(markdown, links, chunking=None):
+    """
+    CPU-bound post-processing of one extracted page.
+
+    :param markdown: Raw markdown returned by the extraction backend
+    :param links: Raw list of links
+    :param chunking: Tuple (model, max_tokens, overlap_tokens, normalize) to tokenize and chunk the markdown
+                     (normalized with normalize_markdown first if normalize is True), or None
+    :return: Dictionary with the filtered markdown and links, the chunks (None if not chunked) and the seconds
+             spent on filtering and chunking in the worker, by profiler stage name
+    """
+    start = time.perf_counter()
+    markdown = filter_markdown_content(markdown)
+    links = filter_links(links)
+    timings = {"filter": time.perf_counter() - start}
+    chunks = None
+    if chunking and markdown:
+        model, max_tokens, overlap_tokens, normalize = chunking
+        start = time.perf_counter()
+        chunks = split_into_chunks(normalize_markdown(markdown) if normalize else markdown, model, max_tokens, overlap_tokens)
+        timings["chunk"] = time.perf_counter() - start
+    return {"markdown": markdown, "links": links, "chunks": chunks, "timings": timings}
+
+
+def postprocess_batch(items, chunking=None):
+    """
+    Runs postprocess_document over a batch, so one task (and one pickling round trip) covers several pages.
+
+    :param items: List of (markdown, links) tuples
+    :return: List of postprocess_document results in the same order
+    """
+    return [postprocess_document(markdown, links, chunking) for markdown, links in items]
+
+
+class CpuStage:
+    """
+    Runs the per-document CPU work (reference removal, link filtering, token chunking) in a process pool.
+
+    Pages submitted one by one are collected into batches of `batch_size`. A batch is sent early when its oldest
+    page has waited `max_wait` seconds. Every submission returns its own Future.
+    """
+
+    def __init__(self, max_workers=None, batch_size=8, max_wait=0.05, chunking=None):
+        """
+        :param max_workers: Number of worker processes, defaults to the number of CPUs
+        :param batch_size: Number of pages per task
+        :param max_wait: Maximum time in seconds a page waits for its batch to fill
+        :param chunking: Tuple (model, max_tokens, overlap_tokens, normalize), or None to skip chunking
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.chunking = chunking
+        # Each worker process writes its records through its own logging listener
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=setup_logging)
+        self._pending = []
+        self._oldest = 0.0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._flusher = threading.Thread(target=self._run, daemon=True)
+        self._flusher.start()
+        self.stats = {"documents": 0, "batches": 0}
+
+    def set_chunking(self, model, max_tokens, overlap_tokens, normalize=False):
+        """Enables token chunking with the settings of the classifier."""
+        self.chunking = (model, max_tokens, overlap_tokens, normalize)
+
+    def submit(self, markdown, links):
+        """
+        Queues one page for post-processing.
+
+        :param markdown: Raw markdown
+        :param links: Raw list of links
+        :return: concurrent.futures.Future resolving to the postprocess_document result
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("CpuStage is closed")
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append(((markdown, links), future))
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+            else:
+                self._condition.notify()
+        return future
+
+    def _flush(self):
+        # Called with the condition held
+        batch, self._pending = self._pending, []
+        self.stats["documents"] += len(batch)
+        self.stats["batches"] += 1
+        task = self.executor.submit(postprocess_batch, [item for item, _ in batch], self.chunking)
+        task.add_done_callback(lambda done: self._resolve(done, [future for _, future in batch]))
+
+    @staticmethod
+    def _resolve(task, futures):
+        error = task.exception()
+        if error is not None:
+            for future in futures:
+                future.set_exception(error)
+            return
+        for future, result in zip(futures, task.result()):
+            future.set_result(result)
+
+    def _run(self):
+        with self._condition:
+            while not self._closed:
+                if not self._pending:
+                    self._condition.wait()
+                    continue
+                remaining = self._oldest + self.max_wait - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                self._flush()
+
+    def map(self, items):
+        """
+        Post-processes a known list of pages in batches.
+
+        :param items: List of (markdown, links) tuples
+        :return: List of postprocess_document results in the same order
+        """
+        batches = [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+        results = []
+        for batch_result in self.executor.map(postprocess_batch, batches, [self.chunking] * len(batches)):
+            results.extend(batch_result)
+        return results
+
+    def close(self):
+        """Processes the remaining pages and shuts the pool down."""
+        with self._condition:
+            if self._pending:
+                self._flush()
+            self._closed = True
+            self._condition.notify()
+        self._flusher.join()
+        self.executor.shutdown(wait=True)
+
+
+def synthetic_page(i, paragraphs=400, links=3000):
+    """
+    :return: Tuple (markdown, links) resembling a large scraped article with a reference section
+    """
+    body = "\n\n".join(
+        f"## Section {p}\nThe history of archery in document {i} covers longbows, crossbows and hunting practices. " * 3
+        for p in range(paragraphs)
+    )
+    references = "\n".join(f"- Reference {r}: https://doi.org/10.1000/{i}.{r}" for r in range(200))
+    page_links = [
+        f"https://www.example-{j % 97}.com/articles/{i}/{j}" if j % 5 else f"https://www.pinterest.com/pin/{j}.jpg"
+        for j in range(links)
+    ]
+    return f"# Page {i}\n\n{body}\n\n## References\n{references}", page_links
+
+
+def benchmark(num_docs=200, batch_size=8, chunking=None):
+    """
+    Compares docs/sec of inline post-processing with CpuStage at increasing worker counts.
+
+    :param num_docs: Number of synthetic pages
+    :param batch_size: Pages per task
+    :param chunking: Optional (model, max_tokens, overlap_tokens, normalize) to include tiktoken chunking
+    """
+    pages = [synthetic_page(i) for i in range(num_docs)]
+    print(f"Synthetic corpus: {num_docs} pages, {sum(len(m) for m, _ in pages) / num_docs / 1024:.0f} KiB markdown "
+          f"and {len(pages[0][1])} links per page, chunking {'on' if chunking else 'off'}")
+
+    start = time.perf_counter()
+    postprocess_batch(pages, chunking)
+    inline = num_docs / (time.perf_counter() - start)
+    print(f"{'inline':>10}: {inline:8.1f} docs/sec")
+
+    cpus = os.cpu_count() or 1
+    for workers in sorted({2 ** n for n in range(cpus.bit_length()) if 2 ** n <= cpus} | {cpus}):
+        stage = CpuStage(max_workers=workers, batch_size=batch_size, chunking=chunking)
+        stage.map(pages[:workers])  # start the worker processes
+        start = time.perf_counter()
+        futures = [stage.submit(markdown, links) for markdown, links in pages]
+        for future in futures:
+            future.result()
+        rate = num_docs / (time.perf_counter() - start)
+        stage.close()
+        print(f"{workers:>3} worker{'s' if workers > 1 else ' '}: {rate:8.1f} docs/sec ({rate / inline:.2f}x inline)")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Benchmark process-pool post-processing on a synthetic corpus.")
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--chunk-model", default=None, help="Include tiktoken chunking for this model (e.g. gpt-4o-mini)")
+    args = parser.parse_args()
+    benchmark(args.docs, args.batch_size, (args.chunk_model, 90000, 9000, False) if args.chunk_model else None)
@@ -0,0 +1,410 @@
+import time
+import zlib
+import heapq
+import random
+import logging
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+class CrawlScheduler:
+    """
+    Pipelined crawl frontier without level barriers.
+
+    Every frontier entry carries its depth level. Up to `concurrency` URLs are processed at the same time,
+    shallowest level first. Links enqueued by a finished (or streaming) classification become eligible immediately.
+    `max_depth` is enforced when links are enqueued and `max_scraped_docs` when URLs are dispatched,
+    so both limits stay exact. Within a level, URLs with a higher priority (see set_priorities) go first.
+    """
+
+    def __init__(self, process_url, max_depth, max_scraped_docs, concurrency=4, rate_limit=(100, 61), backoff_seconds=61, max_retries=3, on_result=None, frontier_store=None):
+        """
+        :param process_url: Function process_url(url, level) returning a dictionary with at least "status_code".
+                            It may call enqueue() for the links of Relevant documents at any point, also tentatively
+                            for a streamed verdict (see withdraw).
+        :param max_depth: Maximum depth level
+        :param max_scraped_docs: Maximum number of URLs processed
+        :param concurrency: Number of URLs processed at the same time
+        :param rate_limit: Tuple (requests, seconds) limiting dispatches per sliding window, or None
+        :param backoff_seconds: Pause of all dispatching after a 429 response
+        :param max_retries: Number of times a rate-limited URL is put back into the frontier
+        :param on_result: Optional callback on_result(result), called from a worker thread with every final process_url result
+        :param frontier_store: Optional FrontierStore holding the frontier and the visited URLs with bounded memory.
+                               Without it, both are kept in memory and the frontier holds at most the remaining budget,
+                               filled shallowest level first.
+        """
+        self.process_url = process_url
+        self.max_depth = max_depth
+        self.max_scraped_docs = max_scraped_docs
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+        self.backoff_seconds = backoff_seconds
+        self.max_retries = max_retries
+        self.on_result = on_result
+        self.frontier_store = frontier_store
+
+        self._condition = threading.Condition()
+        self._heap = []
+        self._sequence = 0
+        self.priorities = {}
+        self._dispatch_times = deque()
+        self._retries = {}
+        self.seen = set()
+        self.frontier_by_level = {}
+        self.dispatched = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.backoff_until = 0.0
+        self.processed_by_level = {}
+        # Running sums of the *_time fields of the results and the number of results with a non-zero value
+        self.totals = {}
+        self.timed = {}
+        self._fatal = None
+        # Links enqueued tentatively: parent URL -> added URLs, added URL -> parent, and those already dispatched
+        self._tentative = {}
+        self._tentative_parent = {}
+        self._tentative_dispatched = set()
+
+    def enqueue(self, urls, level, parent=None):
+        """
+        Adds URLs at a depth level. URLs seen before are ignored. Without a frontier store, the frontier never holds
+        more URLs than the remaining budget; once it is full, a URL replaces the deepest waiting URL if it is shallower,
+        so the budget still goes to the shallowest levels. Thread-safe; may be called from process_url.
+
+        :param parent: URL whose links these are, if they are enqueued before its verdict is final. The links are
+                       then taken back with withdraw(parent), or kept with confirm(parent).
+        :return: Number of newly added URLs
+        """
+        if level > self.max_depth:
+            return 0
+        added = 0
+        with self._condition:
+            tentative = self._tentative.setdefault(parent, set()) if parent is not None else None
+            for url in urls:
+                if self.frontier_store is not None:
+                    # Every candidate is kept, so scoring can choose among all of them
+                    if self.frontier_store.add(url, level, self.priorities.get(url, 0.0)):
+                        self.frontier_by_level[level] = self.frontier_by_level.get(level, 0) + 1
+                        added += 1
+                        if tentative is not None:
+                            tentative.add(url)
+                            self._tentative_parent[url] = parent
+                    continue
+                if url in self.seen:
+                    continue
+                if self.dispatched + len(self._heap) >= self.max_scraped_docs:
+                    deepest = max(self._heap) if self._heap else None
+                    if deepest is None or deepest[0] <= level:
+                        # The remaining URLs have the same level and cannot replace anything either
+                        break
+                    self._heap.remove(deepest)
+                    heapq.heapify(self._heap)
+                    self.frontier_by_level[deepest[0]] -= 1
+                    # An evicted URL may be enqueued again later
+                    self.seen.discard(deepest[3])
+                    self._forget_tentative(deepest[3])
+                self.seen.add(url)
+                self._push(url, level)
+                added += 1
+                if tentative is not None:
+                    tentative.add(url)
+                    self._tentative_parent[url] = parent
+            if added:
+                self._condition.notify()
+        return added
+
+    def _forget_tentative(self, url):
+        # Called with the condition held
+        parent = self._tentative_parent.pop(url, None)
+        if parent is not None:
+            self._tentative[parent].discard(url)
+        self._tentative_dispatched.discard(url)
+
+    def confirm(self, parent):
+        """
+        Keeps the links enqueued tentatively for `parent`: its final verdict agrees with the streamed one.
+        """
+        with self._condition:
+            for url in self._tentative.pop(parent, ()):
+                self._tentative_parent.pop(url, None)
+                self._tentative_dispatched.discard(url)
+
+    def withdraw(self, parent):
+        """
+        Takes back the links enqueued tentatively for `parent`, e.g. when a streamed "Relevant" verdict ends as an
+        ERROR result. Links still waiting are removed from the frontier (and can be enqueued again by another page,
+        unless a frontier store keeps them as visited). Links already dispatched cannot be stopped; their budget
+        slots are given back, so they do not count against max_scraped_docs.
+
+        :return: Tuple (number of links removed from the frontier, number of budget slots given back)
+        """
+        with self._condition:
+            urls = self._tentative.pop(parent, set())
+            dispatched = urls & self._tentative_dispatched
+            waiting = urls - dispatched
+            for url in urls:
+                self._tentative_parent.pop(url, None)
+                self._tentative_dispatched.discard(url)
+            if self.frontier_store is not None:
+                removed = self.frontier_store.remove(waiting)
+                self.frontier_by_level = self.frontier_store.sizes_by_level()
+            else:
+                removed = {entry[3] for entry in self._heap if entry[3] in waiting}
+                if removed:
+                    for entry in self._heap:
+                        if entry[3] in removed:
+                            self.frontier_by_level[entry[0]] -= 1
+                    self._heap = [entry for entry in self._heap if entry[3] not in removed]
+                    heapq.heapify(self._heap)
+                    self.seen -= removed
+            self.dispatched -= len(dispatched)
+            if dispatched:
+                self._condition.notify()
+        return len(removed), len(dispatched)
+
+    def frontier_sizes(self):
+        """
+        :return: Dictionary level -> number of URLs waiting in the frontier
+        """
+        with self._condition:
+            return {level: count for level, count in self.frontier_by_level.items() if count}
+
+    def dispatch_delay(self):
+        """
+        :return: Seconds until the rate limit or a 429 backoff allows the next dispatch, 0 if dispatching is allowed
+        """
+        with self._condition:
+            return self._dispatch_delay(time.monotonic())
+
+    def frontier_urls(self):
+        """
+        :return: List of the URLs waiting in the frontier
+        """
+        with self._condition:
+            if self.frontier_store is not None:
+                return self.frontier_store.hot_urls()
+            return [url for _, _, _, url in self._heap]
+
+    def set_priorities(self, priorities):
+        """
+        Reorders the frontier within each level. Thread-safe.
+
+        :param priorities: Dictionary url -> score; higher scores are dispatched first, URLs without a score count as 0
+        """
+        with self._condition:
+            self.priorities = priorities
+            if self.frontier_store is not None:
+                self.frontier_store.set_priorities(priorities)
+                return
+            self._heap = [(level, -priorities.get(url, 0.0), sequence, url) for level, _, sequence, url in self._heap]
+            heapq.heapify(self._heap)
+
+    def _frontier_size(self):
+        # Called with the condition held
+        return len(self.frontier_store) if self.frontier_store is not None else len(self._heap)
+
+    def _push(self, url, level):
+        # Called with the condition held
+        self.frontier_by_level[level] = self.frontier_by_level.get(level, 0) + 1
+        if self.frontier_store is not None:
+            self.frontier_store.push(url, level, self.priorities.get(url, 0.0))
+            return
+        heapq.heappush(self._heap, (level, -self.priorities.get(url, 0.0), self._sequence, url))
+        self._sequence += 1
+
+    def _pop(self):
+        # Called with the condition held
+        if self.frontier_store is not None:
+            url, level = self.frontier_store.pop()
+        else:
+            level, _, _, url = heapq.heappop(self._heap)
+        self.frontier_by_level[level] -= 1
+        return url, level
+
+    def _dispatch_delay(self, now):
+        # Called with the condition held; seconds until the next dispatch is allowed, 0 if allowed now
+        delay = max(0.0, self.backoff_until - now)
+        if self.rate_limit:
+            requests, window = self.rate_limit
+            while self._dispatch_times and self._dispatch_times[0] <= now - window:
+                self._dispatch_times.popleft()
+            if len(self._dispatch_times) >= requests:
+                delay = max(delay, self._dispatch_times[0] + window - now)
+        return delay
+
+    def _finished(self):
+        if self._fatal is not None:
+            return self.in_flight == 0
+        return self.in_flight == 0 and (not self._frontier_size() or self.dispatched >= self.max_scraped_docs)
+
+    def _run_one(self, url, level):
+        result = {"url": url, "level": level, "status_code": None}
+        try:
+            result = self.process_url(url, level) or result
+        except Exception as e:
+            logger.error("Error processing %s: %s", url, e, extra={"url": url, "level": level})
+        except BaseException as e:
+            # SystemExit (e.g. build_result on 401/402) or KeyboardInterrupt in a worker stops the whole run;
+            # run() stops dispatching and re-raises it on the calling thread
+            logger.critical("Stopping the crawl after %s while processing %s", type(e).__name__, url, extra={"url": url, "level": level})
+            with self._condition:
+                if self._fatal is None:
+                    self._fatal = e
+                self.in_flight -= 1
+                self._condition.notify()
+            return
+        with self._condition:
+            self.in_flight -= 1
+            retry = result.get("status_code") == 429 and self._retries.get(url, 0) < self.max_retries
+            if retry:
+                # The URL goes back to the frontier and does not use up the budget
+                self._retries[url] = self._retries.get(url, 0) + 1
+                self.backoff_until = time.monotonic() + self.backoff_seconds
+                self.dispatched -= 1
+                self._push(url, level)
+                logger.warning("Rate limit exceeded for URL %s. Pausing dispatch for %s seconds...", url, self.backoff_seconds,
+                               extra={"url": url, "level": level, "status_code": 429})
+            else:
+                self.completed += 1
+                self.processed_by_level[level] = self.processed_by_level.get(level, 0) + 1
+                for key, value in result.items():
+                    if key.endswith("_time") and value:
+                        self.totals[key] = self.totals.get(key, 0) + value
+                        self.timed[key] = self.timed.get(key, 0) + 1
+            self._condition.notify()
+        if self.on_result is not None and not retry:
+            try:
+                self.on_result(result)
+            except Exception as e:
+                logger.error("Error handling the result of %s: %s", url, e, extra={"url": url, "level": level})
+
+    def run(self, seed_urls, on_progress=None, progress_interval=0.5):
+        """
+        Processes the frontier until it is empty or the budget is used up.
+
+        :param seed_urls: URLs of depth level 0
+        :param on_progress: Optional callback on_progress(scheduler), called from the calling thread
+        :param progress_interval: Maximum number of seconds between two progress callbacks
+        :return: Dictionary with the sums of the *_time fields of the results (see totals); results themselves are
+                 not kept, they are passed to on_result
+        :raises: The SystemExit or KeyboardInterrupt raised by process_url in a worker, once the URLs in flight are done
+        """
+        self.enqueue(seed_urls, 0)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            with self._condition:
+                while not self._finished():
+                    now = time.monotonic()
+                    delay = self._dispatch_delay(now)
+                    while (self._fatal is None and delay == 0 and self._frontier_size() and self.in_flight < self.concurrency
+                           and self.dispatched < self.max_scraped_docs):
+                        url, level = self._pop()
+                        if url in self._tentative_parent:
+                            self._tentative_dispatched.add(url)
+                        self.dispatched += 1
+                        self.in_flight += 1
+                        self._dispatch_times.append(now)
+                        pool.submit(self._run_one, url, level)
+                        delay = self._dispatch_delay(now)
+                    if self._finished():
+                        break
+                    self._condition.wait(min(delay, progress_interval) if delay else progress_interval)
+                    if on_progress is not None:
+                        self._condition.release()
+                        try:
+                            on_progress(self)
+                        finally:
+                            self._condition.acquire()
+        if self._fatal is not None:
+            raise self._fatal
+        if on_progress is not None:
+            on_progress(self)
+        return dict(self.totals)
+
+
+def run_level_barrier(process_url, seed_urls, max_depth, max_scraped_docs, concurrency):
+    """
+    Former level-by-level processing, with each level run concurrently: level N+1 starts when all of level N is done.
+    Used as the baseline of the benchmark.
+    """
+    current, seen, processed = list(seed_urls), set(seed_urls), 0
+    for level in range(max_depth + 1):
+        current = current[:max_scraped_docs - processed]
+        if not current:
+            break
+        children = []
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for links in pool.map(lambda url: process_url(url, level)["links"], current):
+                for link in links:
+                    if link not in seen:
+                        seen.add(link)
+                        children.append(link)
+        processed += len(current)
+        current = children
+
+
+def benchmark(seeds=20, max_depth=3, max_scraped_docs=300, concurrency=8, scale=0.05, seed=7):
+    """
+    Compares the level barrier with the pipelined scheduler on a stub crawl.
+    Page latency is log-normal with a heavy tail, a third of the pages are Relevant and link to 6 new pages.
+
+    :param scale: Median page latency in seconds
+    """
+    rng = random.Random(seed)
+    latency = {}
+    work = {"seconds": 0.0}
+    lock = threading.Lock()
+
+    def page_latency(url):
+        with lock:
+            if url not in latency:
+                latency[url] = scale * rng.lognormvariate(0, 1.2)
+            return latency[url]
+
+    def make_process(scheduler=None):
+        def process(url, level):
+            seconds = page_latency(url)
+            time.sleep(seconds)
+            with lock:
+                work["seconds"] += seconds
+            links = [f"{url}/{i}" for i in range(6)] if zlib.crc32(url.encode()) % 3 == 0 else []
+            if scheduler is not None:
+                scheduler.enqueue(links, level + 1)
+            return {"status_code": 200, "links": links}
+        return process
+
+    urls = [f"https://site-{i}.example" for i in range(seeds)]
+
+    work["seconds"] = 0.0
+    start = time.perf_counter()
+    run_level_barrier(make_process(), urls, max_depth, max_scraped_docs, concurrency)
+    barrier_time, barrier_work = time.perf_counter() - start, work["seconds"]
+
+    work["seconds"] = 0.0
+    scheduler = CrawlScheduler(None, max_depth, max_scraped_docs, concurrency, rate_limit=None)
+    scheduler.process_url = make_process(scheduler)
+    start = time.perf_counter()
+    scheduler.run(urls)
+    pipelined_time, pipelined_work = time.perf_counter() - start, work["seconds"]
+
+    print(f"Stub crawl: {seeds} seeds, depth {max_depth}, budget {max_scraped_docs}, concurrency {concurrency}")
+    for name, elapsed, total in (("level barrier", barrier_time, barrier_work), ("pipelined", pipelined_time, pipelined_work)):
+        ideal = total / concurrency
+        print(f"{name:>14}: {elapsed:6.2f}s end-to-end, work/concurrency {ideal:6.2f}s, ratio {elapsed / ideal:.2f}")
+    print(f"Pipelined processed {scheduler.completed} URLs by level {dict(sorted(scheduler.processed_by_level.items()))}")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Benchmark the pipelined crawl scheduler against level barriers.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--budget", type=int, default=300)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--scale", type=float, default=0.05)
+    args = parser.parse_args()
+    benchmark(max_depth=args.depth, max_scraped_docs=args.budget, concurrency=args.concurrency, scale=args.scale)
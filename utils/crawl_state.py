@@ -0,0 +1,225 @@
+import json
+import tempfile
+import threading
+import tracemalloc
+from array import array
+
+# Classifications are stored as one-byte codes into a per-state table that starts with these values
+CLASSIFICATIONS = (None, "Relevant", "Irrelevant", "ERROR")
+
+
+class UrlTable:
+    """
+    Interns URLs and assigns them consecutive integer IDs.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.urls = []
+
+    def __len__(self):
+        return len(self.urls)
+
+    def __contains__(self, url):
+        return url in self.ids
+
+    def get_id(self, url):
+        """
+        :return: ID of the URL, or None if it was never interned
+        """
+        return self.ids.get(url)
+
+    def intern(self, url):
+        """
+        :return: ID of the URL, assigning a new one if needed
+        """
+        url_id = self.ids.get(url)
+        if url_id is None:
+            url_id = len(self.urls)
+            self.ids[url] = url_id
+            self.urls.append(url)
+        return url_id
+
+    def url(self, url_id):
+        return self.urls[url_id]
+
+
+class CrawlState:
+    """
+    Memory-bounded replacement for the total_links dictionary.
+
+    Level and classification live in array columns indexed by URL ID. Explanation and summary are spilled
+    to an append-only temporary file, and only their offset stays in memory. Reads through the mapping interface
+    (`state[url]`, `items()`, `values()`) return the same dictionaries total_links used to hold.
+    Non-URL entries such as "search" and "overview" are kept with `set_meta` and keep their position in the overview.
+    """
+
+    def __init__(self, spill_file=None):
+        """
+        :param spill_file: Binary file object for explanations and summaries, defaults to an anonymous temporary file
+        """
+        self.urls = UrlTable()
+        self.levels = array("h")
+        self.classifications = array("B")
+        self.offsets = array("q")
+        # Unknown classifications are appended; the codes only mean something together with this table
+        self.classification_labels = list(CLASSIFICATIONS)
+        self.meta = {}
+        self._spill = spill_file or tempfile.TemporaryFile()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.urls) + len(self.meta)
+
+    def __contains__(self, url):
+        return url in self.urls or url in self.meta
+
+    def _classification_code(self, classification):
+        if classification not in self.classification_labels:
+            self.classification_labels.append(classification)
+        return self.classification_labels.index(classification)
+
+    def _spill_text(self, explanation, summary):
+        self._spill.seek(0, 2)
+        offset = self._spill.tell()
+        self._spill.write(json.dumps([explanation, summary], ensure_ascii=False).encode("utf-8") + b"\n")
+        return offset
+
+    def _read_text(self, offset):
+        if offset < 0:
+            return None, None
+        self._spill.seek(offset)
+        return json.loads(self._spill.readline())
+
+    def __setitem__(self, url, data):
+        """
+        Stores the record of a processed URL.
+
+        :param url: Processed URL
+        :param data: Dictionary with level, classification, explanation and summary
+        """
+        with self._lock:
+            url_id = self.urls.intern(url)
+            offset = self._spill_text(data.get("explanation"), data.get("summary"))
+            code = self._classification_code(data.get("classification"))
+            if url_id == len(self.levels):
+                self.levels.append(data.get("level", -1))
+                self.classifications.append(code)
+                self.offsets.append(offset)
+            else:
+                self.levels[url_id] = data.get("level", -1)
+                self.classifications[url_id] = code
+                self.offsets[url_id] = offset
+
+    def _record(self, url_id):
+        explanation, summary = self._read_text(self.offsets[url_id])
+        return {
+            "level": self.levels[url_id],
+            "classification": self.classification_labels[self.classifications[url_id]],
+            "explanation": explanation,
+            "summary": summary,
+        }
+
+    def __getitem__(self, url):
+        with self._lock:
+            if url in self.meta:
+                return self.meta[url][1]
+            url_id = self.urls.get_id(url)
+            if url_id is None:
+                raise KeyError(url)
+            return self._record(url_id)
+
+    def get(self, url, default=None):
+        try:
+            return self[url]
+        except KeyError:
+            return default
+
+    def set_meta(self, key, value):
+        """
+        Stores a non-URL entry of the overview (e.g. "search", "overview") at the current position.
+        """
+        with self._lock:
+            position = self.meta[key][0] if key in self.meta else len(self.urls)
+            self.meta[key] = (position, value)
+
+    def items(self):
+        """
+        Iterates over all entries in insertion order, reading spilled texts sequentially.
+
+        :return: Generator of (key, dictionary) tuples
+        """
+        with self._lock:
+            meta = sorted(self.meta.items(), key=lambda item: item[1][0])
+            count = len(self.urls)
+        meta_index = 0
+        for url_id in range(count):
+            while meta_index < len(meta) and meta[meta_index][1][0] <= url_id:
+                yield meta[meta_index][0], meta[meta_index][1][1]
+                meta_index += 1
+            with self._lock:
+                record = self._record(url_id)
+            yield self.urls.url(url_id), record
+        for key, (_, value) in meta[meta_index:]:
+            yield key, value
+
+    def keys(self):
+        return (key for key, _ in self.items())
+
+    def values(self):
+        return (value for _, value in self.items())
+
+    def __iter__(self):
+        return self.keys()
+
+    def classification_counts(self):
+        """
+        Counts classifications without touching the spilled texts.
+
+        :return: Dictionary classification -> number of URLs
+        """
+        counts = {}
+        with self._lock:
+            for code in self.classifications:
+                classification = self.classification_labels[code]
+                counts[classification] = counts.get(classification, 0) + 1
+        return counts
+
+    def close(self):
+        """Deletes the spill file."""
+        self._spill.close()
+
+
+def benchmark_memory(num_urls=100_000):
+    """
+    Compares memory per URL of the total_links dict of dicts and CrawlState with tracemalloc.
+
+    :param num_urls: Number of synthetic URLs
+    """
+    def records():
+        for i in range(num_urls):
+            yield f"https://www.example-{i % 997}.com/articles/{i}/the-history-of-the-bow-and-arrow", {
+                "level": i % 4,
+                "classification": "Relevant" if i % 3 else "Irrelevant",
+                "explanation": f"Discusses the history of the bow and arrow in detail, document {i}.",
+                "summary": f"Covers ancient archery, longbows and the development of hunting weapons, part {i}.",
+            }
+
+    results = {}
+    for name, factory in (("dict", dict), ("CrawlState", CrawlState)):
+        tracemalloc.start()
+        state = factory()
+        for url, data in records():
+            state[url] = data
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = (current, peak)
+        print(f"{name:>10}: {current / num_urls:8.1f} bytes/URL retained, peak {peak / 2 ** 20:8.1f} MiB")
+        del state
+
+    saving = 1 - results["CrawlState"][0] / results["dict"][0]
+    print(f"CrawlState retains {saving:.0%} less memory per URL")
+
+
+if __name__ == "__main__":
+    benchmark_memory()
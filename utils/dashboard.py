@@ -0,0 +1,196 @@
+import os
+import time
+import threading
+from collections import deque
+
+from rich.console import Console, Group
+from rich.live import Live
+from rich.panel import Panel
+from rich.table import Table
+from rich.progress_bar import ProgressBar
+
+STAGES = ("extraction", "classification")
+
+
+class CrawlMetrics:
+    """
+    Thread-safe counters of the crawl stages, updated by the worker threads.
+    Rates are computed over a sliding window of recent completions.
+    """
+
+    def __init__(self, window=30):
+        """
+        :param window: Length in seconds of the window used for docs/sec
+        """
+        self.window = window
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._completions = {stage: deque() for stage in STAGES}
+        self.completed = {stage: 0 for stage in STAGES}
+        self.in_flight = {stage: 0 for stage in STAGES}
+
+    def begin(self, stage):
+        """Marks the start of a request in a stage."""
+        with self._lock:
+            self.in_flight[stage] += 1
+
+    def end(self, stage):
+        """Marks the end of a request in a stage."""
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight[stage] -= 1
+            self.completed[stage] += 1
+            self._completions[stage].append(now)
+
+    def rate(self, stage):
+        """
+        :return: Completions per second over the last `window` seconds (or since the start, if shorter)
+        """
+        now = time.monotonic()
+        with self._lock:
+            completions = self._completions[stage]
+            while completions and completions[0] < now - self.window:
+                completions.popleft()
+            count = len(completions)
+        span = min(self.window, now - self.started)
+        return count / span if span > 0 else 0.0
+
+    def snapshot(self):
+        """
+        :return: Dictionary stage -> {completed, in_flight, rate}
+        """
+        rates = {stage: self.rate(stage) for stage in STAGES}
+        with self._lock:
+            return {stage: {"completed": self.completed[stage], "in_flight": self.in_flight[stage], "rate": rates[stage]} for stage in STAGES}
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "-"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class Dashboard:
+    """
+    Live terminal view of a running crawl.
+
+    Rendering happens on the refresh thread of rich.live.Live at a fixed rate and only reads counters,
+    so the worker threads pay nothing beyond the CrawlMetrics updates.
+    """
+
+    def __init__(self, metrics, scheduler, max_scraped_docs, classification_counts=None, token_usage=None, token_budget=None, cache_stats=None, refresh_per_second=2, console=None):
+        """
+        :param metrics: CrawlMetrics updated by process_url
+        :param scheduler: CrawlScheduler of the run (in-flight URLs, frontier per level, rate-limit backoff)
+        :param max_scraped_docs: Document budget used for progress and ETA
+        :param classification_counts: Callable returning a dictionary classification -> count
+        :param token_usage: Callable returning a dictionary with calls, input_tokens and output_tokens
+        :param token_budget: Callable returning TokenBudget.report() (or None without a budget)
+        :param cache_stats: Callable returning a dictionary name -> (hits, lookups)
+        :param refresh_per_second: Refresh rate of the view
+        """
+        self.metrics = metrics
+        self.scheduler = scheduler
+        self.max_scraped_docs = max_scraped_docs
+        self.classification_counts = classification_counts
+        self.token_usage = token_usage
+        self.token_budget = token_budget
+        self.cache_stats = cache_stats
+        self.live = Live(get_renderable=self.render, refresh_per_second=refresh_per_second, console=console or Console(), transient=False)
+
+    def eta(self):
+        """
+        :return: Estimated seconds until max_scraped_docs URLs are processed at the current rate, None if unknown
+        """
+        remaining = self.max_scraped_docs - self.scheduler.completed
+        elapsed = time.monotonic() - self.metrics.started
+        if remaining <= 0:
+            return 0
+        if not self.scheduler.completed or elapsed <= 0:
+            return None
+        return remaining / (self.scheduler.completed / elapsed)
+
+    def render(self):
+        snapshot = self.metrics.snapshot()
+        completed = self.scheduler.completed
+        elapsed = time.monotonic() - self.metrics.started
+
+        throughput = Table(box=None, padding=(0, 2), show_header=True, header_style="bold blue")
+        for column in ("Stage", "Done", "In flight", "Docs/sec"):
+            throughput.add_column(column, justify="right" if column != "Stage" else "left")
+        for stage, values in snapshot.items():
+            throughput.add_row(stage.capitalize(), str(values["completed"]), str(values["in_flight"]), f"{values['rate']:.2f}")
+
+        status = Table.grid(padding=(0, 2))
+        status.add_column(style="bold blue")
+        status.add_column()
+        frontier = self.scheduler.frontier_sizes()
+        status.add_row("URLs in flight", str(self.scheduler.in_flight))
+        status.add_row("Frontier", ", ".join(f"L{level}: {count}" for level, count in sorted(frontier.items())) or "empty")
+        if self.classification_counts is not None:
+            counts = self.classification_counts()
+            errors = sum(count for classification, count in counts.items() if classification and "ERROR" in classification)
+            status.add_row("Classified", f"[green]{counts.get('Relevant', 0)} relevant[/], [magenta]{counts.get('Irrelevant', 0)} irrelevant[/], [red]{errors} error[/]")
+        if self.token_usage is not None:
+            usage = self.token_usage()
+            status.add_row("LLM tokens", f"{usage['input_tokens']:,} in / {usage['output_tokens']:,} out ({usage['calls']} calls)")
+        budget = self.token_budget() if self.token_budget is not None else None
+        if budget is not None and budget["per_run"] is not None:
+            style = {"ok": "green", "low": "yellow", "exhausted": "red"}[budget["state"]]
+            status.add_row("Token budget", f"[{style}]{budget['remaining']:,} of {budget['per_run']:,} left ({budget['state']})[/]"
+                           + (f", {budget['truncated_documents']} documents truncated" if budget["truncated_documents"] else ""))
+        if self.cache_stats is not None:
+            caches = [f"{name} {hits / lookups:.0%} ({hits}/{lookups})" for name, (hits, lookups) in self.cache_stats().items() if lookups]
+            if caches:
+                status.add_row("Cache hits", ", ".join(caches))
+        delay = self.scheduler.dispatch_delay()
+        status.add_row("Rate limit", f"[yellow]paused {delay:.0f}s[/]" if delay else "ok")
+        status.add_row("Elapsed / ETA", f"{format_duration(elapsed)} / {format_duration(self.eta())}")
+
+        progress = Table.grid(padding=(0, 1))
+        progress.add_column(ratio=1)
+        progress.add_column()
+        progress.add_row(ProgressBar(total=self.max_scraped_docs, completed=completed), f"{completed}/{self.max_scraped_docs}")
+        return Panel(Group(progress, throughput, status), title="[bold blue]Crawl progress[/]", border_style="blue")
+
+    def __enter__(self):
+        self.live.start(refresh=True)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.live.stop()
+
+
+def benchmark(num_updates=200_000, num_renders=200):
+    """
+    Measures the cost of a metrics update on the hot path and of one dashboard render.
+    """
+    from utils.crawl_scheduler import CrawlScheduler
+
+    metrics = CrawlMetrics()
+    start = time.perf_counter()
+    for _ in range(num_updates):
+        metrics.begin("extraction")
+        metrics.end("extraction")
+    update = (time.perf_counter() - start) / num_updates
+
+    scheduler = CrawlScheduler(None, max_depth=3, max_scraped_docs=10_000)
+    scheduler.enqueue([f"https://example.com/{i}" for i in range(5000)], 1)
+    counts = {"Relevant": 1200, "Irrelevant": 3400, "ERROR": 12}
+    dashboard = Dashboard(metrics, scheduler, 10_000, classification_counts=lambda: counts,
+                          token_usage=lambda: {"calls": 4612, "input_tokens": 9_800_000, "output_tokens": 310_000},
+                          cache_stats=lambda: {"local classifier": (1900, 4612)}, console=Console(file=open(os.devnull, "w")))
+    start = time.perf_counter()
+    for _ in range(num_renders):
+        dashboard.live.console.print(dashboard.render())
+    render = (time.perf_counter() - start) / num_renders
+
+    print(f"Metrics update (begin + end): {update * 1e6:.2f} µs")
+    print(f"Dashboard render: {render * 1e3:.2f} ms, {render * 2:.2%} of one core at 2 refreshes per second")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -5,14 +5,7 @@ import re
 from openpyxl.styles import Alignment
 import logging
 
-logging.getLogger().handlers.clear()
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("search_log.log", mode='a', encoding='utf-8'),  # Nastavení UTF-8
-    ]
-)
+logger = logging.getLogger(__name__)
 
 
 class ExcelWriter:
@@ -55,11 +48,11 @@ class ExcelWriter:
             sheet["B2"].alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
 
             workbook.save(file_path)
-            logging.info(f"File created successfully: {file_path}")
+            logger.info("File created successfully: %s", file_path)
             return file_path
 
         except Exception as e:
-            logging.error(f"An error occurred while creating the file: {str(e)}")
+            logger.error("An error occurred while creating the file: %s", e)
             print(f"An error occurred while creating the file: {str(e)}")
             return None
         
@@ -72,7 +65,7 @@ class ExcelWriter:
         """
         try:
             if not os.path.exists(file_path):
-                logging.error(f"The file {file_path} does not exist. Please create the file first.")
+                logger.error("The file %s does not exist. Please create the file first.", file_path)
                 print(f"The file {file_path} does not exist. Please create the file first.")
                 return
 
@@ -94,10 +87,10 @@ class ExcelWriter:
             sheet[f"B{last_row}"].border = border
 
             workbook.save(file_path)
-            logging.info(f"URL '{url}' successfully added to file: {file_path}")
+            logger.info("URL '%s' successfully added to file: %s", url, file_path)
 
         except Exception as e:
-            logging.error(f"An error occurred while writing URL to the file: {str(e)}")
+            logger.error("An error occurred while writing URL to the file: %s", e)
             print(f"An error occurred while writing URL to the file: {str(e)}")
 
     def modify_serach_query_for_filename(self, query):
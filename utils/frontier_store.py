@@ -0,0 +1,327 @@
+import os
+import gc
+import math
+import time
+import heapq
+import random
+import sqlite3
+import hashlib
+import logging
+import argparse
+import resource
+import tempfile
+import threading
+
+from utils.logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def url_hashes(url):
+    """
+    :return: Tuple of two 64-bit hashes of the URL, used for the Bloom filter positions and as the visited key
+    """
+    digest = hashlib.blake2b(url.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+class BloomFilter:
+    """
+    Bit array with k positions per key (double hashing). No false negatives; false positives at about `error_rate`
+    while at most `capacity` keys are added.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        """
+        :param capacity: Expected number of keys
+        :param error_rate: False positive rate at capacity
+        """
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, hashes):
+        first, second = hashes
+        return [(first + i * second) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, hashes):
+        for position in self._positions(hashes):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, hashes):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(hashes))
+
+
+class FrontierStore:
+    """
+    Crawl frontier and visited set for millions of candidate links with bounded memory.
+
+    The best entries (shallowest level, then highest priority, then first added) are kept in an in-memory heap of at
+    most 2 * `hot_capacity` entries. When it is full, its worse half is spilled to a SQLite table in `path`; entries
+    after that boundary go straight to disk, and the best of them are moved back in batches once the heap is empty.
+    The dispatch order is the same as with a single heap.
+
+    Visited URLs are tracked with a Bloom filter plus a SQLite table of 63-bit URL hashes. The table is only read when
+    the Bloom filter reports a possible duplicate, so new URLs, the common case, never touch the disk on lookup.
+    New hashes and spilled entries are written in batches.
+    """
+
+    def __init__(self, path=None, hot_capacity=100_000, expected_urls=10_000_000, error_rate=0.01, batch_size=10_000):
+        """
+        :param path: SQLite file, defaults to a temporary file removed on close
+        :param hot_capacity: Number of frontier entries kept in memory after a spill; the heap holds at most twice as many
+        :param expected_urls: Expected number of distinct URLs, sizes the Bloom filter
+        :param error_rate: False positive rate of the Bloom filter; false positives only cost a disk lookup
+        :param batch_size: Number of rows written to SQLite at once
+        """
+        self._temporary = path is None
+        if path is None:
+            handle, path = tempfile.mkstemp(suffix=".sqlite")
+            os.close(handle)
+        self.path = path
+        self.hot_capacity = hot_capacity
+        self.batch_size = batch_size
+        self.bloom = BloomFilter(expected_urls, error_rate)
+        self._lock = threading.RLock()
+        self._hot = []
+        self._sequence = 0
+        self._pending_visited = set()
+        self._pending_spill = []
+        self._boundary = None
+        self._level_counts = {}
+        self.spilled = 0
+        self.visited = 0
+        self.stats = {"bloom_positives": 0, "duplicates": 0, "spilled": 0, "refilled": 0}
+
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.executescript("""
+            PRAGMA journal_mode=OFF;
+            PRAGMA synchronous=OFF;
+            PRAGMA cache_size=-16384;
+            CREATE TABLE IF NOT EXISTS visited (hash INTEGER PRIMARY KEY) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS frontier (level INTEGER, priority REAL, sequence INTEGER PRIMARY KEY, url TEXT);
+            CREATE INDEX IF NOT EXISTS frontier_order ON frontier (level, priority, sequence);
+        """)
+
+    def __len__(self):
+        return len(self._hot) + self.spilled
+
+    def add(self, url, level, priority=0.0):
+        """
+        Adds a URL to the frontier unless it was added before. Thread-safe.
+
+        :param url: URL
+        :param level: Depth level
+        :param priority: Higher priorities are popped first within a level
+        :return: True if the URL was new
+        """
+        hashes = url_hashes(url)
+        key = hashes[0] >> 1
+        with self._lock:
+            if hashes in self.bloom:
+                self.stats["bloom_positives"] += 1
+                if key in self._pending_visited or self._connection.execute("SELECT 1 FROM visited WHERE hash = ?", (key,)).fetchone():
+                    self.stats["duplicates"] += 1
+                    return False
+            self.bloom.add(hashes)
+            self._pending_visited.add(key)
+            self.visited += 1
+            if len(self._pending_visited) >= self.batch_size:
+                self._flush_visited()
+            self.push(url, level, priority)
+            return True
+
+    def push(self, url, level, priority=0.0):
+        """
+        Puts a URL into the frontier without the visited check, e.g. a rate-limited URL that is retried. Thread-safe.
+        """
+        with self._lock:
+            self._push((level, -priority, self._sequence, url))
+            self._sequence += 1
+            self._level_counts[level] = self._level_counts.get(level, 0) + 1
+
+    def _push(self, entry):
+        # Called with the lock held. Every entry in memory precedes the boundary and every spilled entry follows it,
+        # so the top of the heap is always the next entry overall.
+        if self._boundary is None or entry < self._boundary:
+            heapq.heappush(self._hot, entry)
+            if len(self._hot) > 2 * self.hot_capacity:
+                self._evict()
+            return
+        self._pending_spill.append(entry)
+        self.spilled += 1
+        self.stats["spilled"] += 1
+        if len(self._pending_spill) >= self.batch_size:
+            self._flush_spill()
+
+    def pop(self):
+        """
+        :return: Tuple (url, level) of the next entry, or None if the frontier is empty
+        """
+        with self._lock:
+            if not self._hot and self.spilled:
+                self._refill()
+            if not self._hot:
+                return None
+            level, _, _, url = heapq.heappop(self._hot)
+            self._level_counts[level] -= 1
+            return url, level
+
+    def remove(self, urls):
+        """
+        Takes URLs out of the frontier, in memory or spilled. They stay visited, so they are not added again.
+
+        :param urls: URLs to remove
+        :return: Set of the URLs that were waiting in the frontier and were removed
+        """
+        urls = set(urls)
+        removed = set()
+        if not urls:
+            return removed
+        with self._lock:
+            kept = []
+            for entry in self._hot:
+                if entry[3] in urls:
+                    removed.add(entry[3])
+                    self._level_counts[entry[0]] -= 1
+                else:
+                    kept.append(entry)
+            if removed:
+                heapq.heapify(kept)
+                self._hot = kept
+            if self.spilled:
+                self._flush_spill()
+                pending = list(urls - removed)
+                for start in range(0, len(pending), 500):
+                    batch = pending[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self._connection.execute(f"SELECT level, url FROM frontier WHERE url IN ({placeholders})", batch).fetchall()
+                    self._connection.execute(f"DELETE FROM frontier WHERE url IN ({placeholders})", batch)
+                    for level, url in rows:
+                        removed.add(url)
+                        self._level_counts[level] -= 1
+                        self.spilled -= 1
+        return removed
+
+    def _evict(self):
+        # Called with the lock held; keeps the best hot_capacity entries in memory and spills the rest.
+        # The best spilled entry becomes the new boundary. A sorted list is a valid heap.
+        self._hot.sort()
+        evicted = self._hot[self.hot_capacity:]
+        del self._hot[self.hot_capacity:]
+        self._boundary = evicted[0]
+        self._pending_spill.extend(evicted)
+        self.spilled += len(evicted)
+        self.stats["spilled"] += len(evicted)
+        self._flush_spill()
+
+    def _refill(self):
+        # Called with the lock held and an empty heap; moves the best spilled entries back into memory.
+        # The boundary moves to the best entry left on disk.
+        self._flush_spill()
+        rows = self._connection.execute(
+            "SELECT level, priority, sequence, url FROM frontier ORDER BY level, priority, sequence LIMIT ?",
+            (min(self.batch_size, self.hot_capacity),)).fetchall()
+        self._connection.executemany("DELETE FROM frontier WHERE sequence = ?", ((row[2],) for row in rows))
+        self._hot = [tuple(row) for row in rows]
+        self.spilled -= len(rows)
+        self.stats["refilled"] += len(rows)
+        head = self._connection.execute("SELECT level, priority, sequence, url FROM frontier ORDER BY level, priority, sequence LIMIT 1").fetchone()
+        self._boundary = tuple(head) if head else None
+
+    def _flush_visited(self):
+        # Called with the lock held
+        if self._pending_visited:
+            self._connection.executemany("INSERT OR IGNORE INTO visited (hash) VALUES (?)", ((key,) for key in self._pending_visited))
+            self._pending_visited.clear()
+
+    def _flush_spill(self):
+        # Called with the lock held
+        if self._pending_spill:
+            self._connection.executemany("INSERT INTO frontier (level, priority, sequence, url) VALUES (?, ?, ?, ?)", self._pending_spill)
+            self._pending_spill.clear()
+
+    def hot_urls(self):
+        """
+        :return: List of the URLs held in memory (the next ones to be popped)
+        """
+        with self._lock:
+            return [url for _, _, _, url in self._hot]
+
+    def set_priorities(self, priorities):
+        """
+        Reorders the in-memory entries; spilled entries keep their priority until they are moved back.
+
+        :param priorities: Dictionary url -> score; higher scores are popped first, URLs without a score count as 0
+        """
+        with self._lock:
+            self._hot = [(level, -priorities.get(url, 0.0), sequence, url) for level, _, sequence, url in self._hot]
+            heapq.heapify(self._hot)
+
+    def sizes_by_level(self):
+        """
+        :return: Dictionary level -> number of frontier entries, in memory and spilled
+        """
+        with self._lock:
+            return {level: count for level, count in self._level_counts.items() if count}
+
+    def report(self):
+        """
+        :return: Dictionary with the frontier sizes, the number of visited URLs and the dedup and spill counters
+        """
+        with self._lock:
+            return {"hot": len(self._hot), "spilled": self.spilled, "visited": self.visited, **self.stats}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+            if self._temporary:
+                os.remove(self.path)
+
+
+def benchmark(num_links=10_000_000, duplicate_share=0.3, pop_share=0.1, hot_capacity=100_000, report_every=1_000_000, seed=7):
+    """
+    Adds a synthetic stream of links (with duplicates) to a FrontierStore while popping some, and reports throughput
+    and peak RSS per segment. Both should stay flat as the frontier grows.
+
+    :param num_links: Number of links added
+    :param duplicate_share: Share of links that repeat an earlier link
+    :param pop_share: Number of pops per added link
+    :param hot_capacity: In-memory frontier entries
+    :param report_every: Links per reported segment
+    """
+    rng = random.Random(seed)
+    store = FrontierStore(hot_capacity=hot_capacity, expected_urls=num_links)
+    added, popped, distinct = 0, 0, 0
+    start = segment_start = time.perf_counter()
+    print(f"{'links':>12} {'links/s':>10} {'frontier':>12} {'spilled':>12} {'peak RSS MiB':>13}")
+    for i in range(1, num_links + 1):
+        if distinct and rng.random() < duplicate_share:
+            j = rng.randrange(distinct)
+            url = f"https://www.example-{j % 9973}.com/page/{j}"
+        else:
+            url = f"https://www.example-{distinct % 9973}.com/page/{distinct}"
+            distinct += 1
+        added += store.add(url, level=rng.randrange(4), priority=rng.random())
+        if rng.random() < pop_share and store.pop() is not None:
+            popped += 1
+        if i % report_every == 0:
+            now = time.perf_counter()
+            gc.collect()
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f"{i:>12,} {report_every / (now - segment_start):>10,.0f} {len(store):>12,} {store.spilled:>12,} {rss:>13.1f}")
+            segment_start = time.perf_counter()
+    elapsed = time.perf_counter() - start
+    report = store.report()
+    print(f"{num_links:,} links in {elapsed:.0f}s: {added:,} new, {report['duplicates']:,} duplicates, {popped:,} popped, "
+          f"Bloom positives {report['bloom_positives']:,}, SQLite file {os.path.getsize(store.path) / 2 ** 20:.0f} MiB")
+    store.close()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Benchmark the spillable frontier store.")
+    parser.add_argument("--links", type=int, default=10_000_000)
+    parser.add_argument("--hot", type=int, default=100_000)
+    args = parser.parse_args()
+    benchmark(args.links, hot_capacity=args.hot, report_every=max(1, args.links // 10))
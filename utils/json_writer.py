@@ -3,36 +3,65 @@ import json
 import logging
 
 
-logging.getLogger().handlers.clear()
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("search_log.log", mode='a', encoding='utf-8'), 
-    ]
-)
+logger = logging.getLogger(__name__)
 
 
 class JsonWriter:
     def __init__(self, output_folder="OUTPUT"):
+        """
+        :param output_folder: Folder of the overview files
+        """
         self.output_folder = output_folder
         os.makedirs(self.output_folder, exist_ok=True)
 
+    def _overview_path(self, filename_search_query):
+        return os.path.join(self.output_folder, f"overview_{filename_search_query}.json")
+
+    @staticmethod
+    def _entry(key, value):
+        entry = json.dumps(value, indent=4, ensure_ascii=False).replace("\n", "\n    ")
+        return f"    {json.dumps(key, ensure_ascii=False)}: {entry}"
+
     def save_overview_to_file(self, total_links, filename_search_query):
         """
         Saves the contents of the total_links dictionary to a JSON file.
 
-        :param total_links: A dictionary containing data about processed links.
+        :param total_links: A dictionary (or CrawlState) containing data about processed links.
         :param filename_search_query: The file name derived from the search query.
+        :note: Entries are written one by one, so the overview is never materialized as a whole in memory.
+               Called at the start and the end of a run; in between, records are added with append_to_overview.
         """
-        output_file = os.path.join(self.output_folder, f"overview_{filename_search_query}.json")
-
+        output_file = self._overview_path(filename_search_query)
         try:
             with open(output_file, "w", encoding="utf-8") as file:
-                json.dump(total_links, file, indent=4, ensure_ascii=False)
-            logging.info(f"Overview saved to: {output_file}")
+                file.write("{")
+                separator = "\n"
+                for key, value in total_links.items():
+                    file.write(separator + self._entry(key, value))
+                    separator = ",\n"
+                file.write("\n}" if separator != "\n" else "}")
+            logger.info("Overview saved to: %s", output_file)
         except Exception as e:
-            logging.error(f"Error saving overview to file: {e}")
-
+            logger.error("Error saving overview to file: %s", e)
 
+    def append_to_overview(self, filename_search_query, key, value):
+        """
+        Adds one entry to an overview written by save_overview_to_file. Only the new entry is written: it replaces
+        the closing brace, which is written again after it, so the file stays valid JSON during the run.
 
+        :param filename_search_query: The file name derived from the search query.
+        :param key: URL of the entry
+        :param value: Dictionary with the record of the URL
+        :note: A URL appended twice appears twice, and the later entry wins when the file is loaded.
+               The final save_overview_to_file rewrites the file with one entry per URL.
+        """
+        output_file = self._overview_path(filename_search_query)
+        try:
+            with open(output_file, "r+b") as file:
+                end = file.seek(0, os.SEEK_END)
+                # The file ends with "}" right after "{" when empty, otherwise with "\n}"
+                empty = end == 2
+                file.seek(end - (1 if empty else 2))
+                file.write((("\n" if empty else ",\n") + self._entry(key, value) + "\n}").encode("utf-8"))
+        except Exception as e:
+            logger.error("Error appending to overview file: %s", e)
@@ -0,0 +1,317 @@
+import os
+import time
+import random
+import shutil
+import tempfile
+import logging
+import argparse
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils.crawl_state import UrlTable
+from utils.logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Default cap of the URL table of a LinkGraph
+MAX_URLS = 2_000_000
+
+
+class LinkGraph:
+    """
+    Link graph of one run: integer URL IDs and CSR adjacency arrays.
+
+    Edges are appended to two int32 arrays while the crawl runs (8 bytes per edge). The CSR form (indptr, indices)
+    is built from them with NumPy on demand, with duplicate edges removed, and cached until new edges arrive.
+    Scores are computed on the CSR arrays without Python loops over edges.
+
+    Every link target is interned, and most targets are never crawled, so the URL table is capped at `max_urls`.
+    Once it is full, links to URLs not yet in the graph are counted in `dropped_links` instead of recorded.
+    """
+
+    def __init__(self, max_urls=MAX_URLS):
+        """
+        :param max_urls: Maximum number of URLs in the graph, about 150 bytes each with their IDs
+        """
+        self.max_urls = max_urls
+        self.urls = UrlTable()
+        self._sources = array("i")
+        self._targets = array("i")
+        self.relevant = set()
+        self.dropped_links = 0
+        self._lock = threading.Lock()
+        self._csr = None
+        # CSR arrays of a loaded graph (memory-mapped); turned into edge arrays when links are added
+        self._base = None
+        self._changed = False
+        self._last_scoring = 0.0
+        self._scorer = None
+        self._scoring = None
+
+    def __len__(self):
+        return len(self.urls)
+
+    def add_links(self, url, links):
+        """
+        Records the outgoing links of a page. Thread-safe.
+
+        :param url: URL of the page
+        :param links: URLs the page links to
+        """
+        with self._lock:
+            if self._base is not None:
+                self._expand_base()
+            source = self._intern(url)
+            if source is None:
+                self.dropped_links += len(links)
+                return
+            for link in links:
+                target = self._intern(link)
+                if target is None:
+                    self.dropped_links += 1
+                    continue
+                self._sources.append(source)
+                self._targets.append(target)
+            self._csr = None
+            self._changed = True
+
+    def _intern(self, url):
+        # Called with the lock held; None once the table is full and the URL is new
+        url_id = self.urls.get_id(url)
+        if url_id is None and len(self.urls) < self.max_urls:
+            url_id = self.urls.intern(url)
+        return url_id
+
+    def _expand_base(self):
+        # Called with the lock held: the edges of a loaded graph become the start of the edge arrays
+        indptr, indices = self._base
+        self._sources = array("i", np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr)).tobytes())
+        self._targets = array("i", np.asarray(indices, dtype=np.int32).tobytes())
+        self._base = None
+
+    def mark_relevant(self, url):
+        """Adds a page to the seeds of the personalized PageRank. Thread-safe."""
+        with self._lock:
+            url_id = self._intern(url)
+            if url_id is not None:
+                self.relevant.add(url_id)
+                self._changed = True
+
+    @property
+    def num_edges(self):
+        return len(self.csr()[1])
+
+    def csr(self):
+        """
+        :return: Tuple (indptr, indices) of the deduplicated adjacency; the links of node i are indices[indptr[i]:indptr[i + 1]]
+        """
+        with self._lock:
+            if self._csr is None and self._base is not None:
+                return self._base
+            if self._csr is None:
+                n = len(self.urls)
+                keys = np.frombuffer(self._sources, dtype=np.int32).astype(np.int64) * n + np.frombuffer(self._targets, dtype=np.int32)
+                # Sorting by source * n + target groups the edges by source and puts duplicates next to each other
+                keys.sort()
+                if len(keys):
+                    keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+                indices = (keys % n).astype(np.int32) if n else np.empty(0, dtype=np.int32)
+                indptr = np.zeros(n + 1, dtype=np.int64)
+                np.cumsum(np.bincount(keys // n, minlength=n) if n else [], out=indptr[1:])
+                self._csr = (indptr, indices)
+            return self._csr
+
+    def in_degree(self):
+        """
+        :return: int array with the number of distinct pages linking to each URL ID
+        """
+        indptr, indices = self.csr()
+        return np.bincount(indices, minlength=len(indptr) - 1)
+
+    def personalized_pagerank(self, seeds=None, alpha=0.85, max_iterations=50, tolerance=1e-6):
+        """
+        PageRank with teleports to the seed pages, computed by power iteration.
+
+        :param seeds: Iterable of URL IDs, defaults to the pages marked Relevant; plain PageRank if there are none
+        :param alpha: Probability of following a link instead of teleporting
+        :param max_iterations: Maximum number of iterations
+        :param tolerance: L1 change of the scores at which the iteration stops
+        :return: float array of scores summing to 1, indexed by URL ID
+        """
+        indptr, indices = self.csr()
+        n = len(indptr) - 1
+        if n == 0:
+            return np.zeros(0)
+        seeds = list(self.relevant if seeds is None else seeds)
+        teleport = np.zeros(n)
+        if seeds:
+            teleport[seeds] = 1.0 / len(seeds)
+        else:
+            teleport[:] = 1.0 / n
+
+        out_degree = np.diff(indptr)
+        sources = np.repeat(np.arange(n, dtype=np.int32), out_degree)
+        dangling = out_degree == 0
+        inverse_out_degree = np.zeros(n)
+        inverse_out_degree[~dangling] = 1.0 / out_degree[~dangling]
+
+        rank = teleport.copy()
+        for _ in range(max_iterations):
+            # Rank of pages without links is teleported, so the scores keep summing to 1
+            updated = alpha * np.bincount(indices, weights=(rank * inverse_out_degree)[sources], minlength=n)
+            updated += (alpha * rank[dangling].sum() + 1 - alpha) * teleport
+            change = np.abs(updated - rank).sum()
+            rank = updated
+            if change < tolerance:
+                break
+        return rank
+
+    def scores(self, urls, method="pagerank"):
+        """
+        :param urls: URLs to score
+        :param method: "pagerank" (personalized by Relevant pages) or "in_degree"
+        :return: Dictionary url -> score; URLs not in the graph score 0
+        """
+        values = self.personalized_pagerank() if method == "pagerank" else self.in_degree()
+        result = {}
+        for url in urls:
+            url_id = self.urls.get_id(url)
+            result[url] = float(values[url_id]) if url_id is not None and url_id < len(values) else 0.0
+        return result
+
+    def prioritize(self, scheduler, method="pagerank", min_interval=5.0):
+        """
+        Orders the frontier of a CrawlScheduler by link score. Meant as the on_progress callback of CrawlScheduler.run;
+        the scores are recomputed at most every `min_interval` seconds and only after the graph changed.
+        Scoring runs on a background thread and is applied with set_priorities when it is done, so the dispatch
+        thread never waits for it; a scoring is skipped while the previous one is still running.
+
+        :param scheduler: CrawlScheduler of the run
+        :param method: "pagerank" or "in_degree"
+        :param min_interval: Minimum number of seconds between two scorings
+        """
+        now = time.monotonic()
+        if now - self._last_scoring < min_interval or not self._changed:
+            return
+        if self._scoring is not None and not self._scoring.done():
+            return
+        self._last_scoring = now
+        self._changed = False
+        if self._scorer is None:
+            self._scorer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="link-scoring")
+        self._scoring = self._scorer.submit(self._prioritize, scheduler, method)
+
+    def _prioritize(self, scheduler, method):
+        start = time.perf_counter()
+        try:
+            scheduler.set_priorities(self.scores(scheduler.frontier_urls(), method))
+        except Exception as e:
+            logger.error("Ordering the frontier by %s failed: %s", method, e)
+            return
+        logger.info("Frontier ordered by %s of %s pages in %.3fs", method, len(self.urls), time.perf_counter() - start)
+
+    def close(self):
+        """Waits for a running scoring and stops the scoring thread."""
+        if self._scorer is not None:
+            self._scorer.shutdown(wait=True)
+            self._scorer = None
+
+    def save(self, path):
+        """
+        Saves the graph to a folder of .npy files: CSR arrays, Relevant seeds and the URLs as one UTF-8 buffer with offsets.
+        Plain .npy files can be memory-mapped by load(), unlike the members of an .npz archive.
+
+        :param path: Folder, created if needed
+        """
+        indptr, indices = self.csr()
+        with self._lock:
+            encoded = [url.encode("utf-8") for url in self.urls.urls]
+            relevant = np.fromiter(sorted(self.relevant), dtype=np.int32, count=len(self.relevant))
+        url_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(url) for url in encoded], out=url_offsets[1:])
+        os.makedirs(path, exist_ok=True)
+        arrays = {"indptr": indptr, "indices": indices, "relevant": relevant, "url_offsets": url_offsets,
+                  "url_bytes": np.frombuffer(b"".join(encoded), dtype=np.uint8)}
+        for name, values in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), values)
+        logger.info("Link graph saved to: %s (%s URLs, %s links)", path, len(encoded), len(indices))
+
+    @classmethod
+    def load(cls, path, max_urls=None):
+        """
+        :param path: Folder written by save()
+        :param max_urls: URL cap of the loaded graph, defaults to the saved URLs plus MAX_URLS
+        :return: LinkGraph with the saved URLs, links and Relevant seeds. The CSR arrays stay memory-mapped (read-only)
+                 until links are added.
+        """
+        data = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                for name in ("indptr", "indices", "relevant", "url_offsets", "url_bytes")}
+        url_offsets = data["url_offsets"]
+        graph = cls(max_urls=max_urls or len(url_offsets) - 1 + MAX_URLS)
+        url_bytes = data["url_bytes"].tobytes()
+        offsets = url_offsets.tolist()
+        for i in range(len(offsets) - 1):
+            graph.urls.intern(url_bytes[offsets[i]:offsets[i + 1]].decode("utf-8"))
+        graph._base = (data["indptr"], data["indices"])
+        graph.relevant = set(data["relevant"].tolist())
+        return graph
+
+
+def benchmark(num_pages=500_000, links_per_page=10, relevant_share=0.01, seed=7):
+    """
+    Measures building, scoring, saving and loading a synthetic link graph.
+
+    :param num_pages: Number of pages with outgoing links
+    :param links_per_page: Average number of links per page; targets follow a power law, as on the web
+    :param relevant_share: Share of pages marked Relevant
+    """
+    rng = np.random.default_rng(seed)
+    urls = [f"https://www.example-{i % 9973}.com/page/{i}" for i in range(num_pages)]
+    graph = LinkGraph()
+
+    start = time.perf_counter()
+    targets = (rng.pareto(1.2, size=num_pages * links_per_page) * 50).astype(np.int64) % num_pages
+    for i, url in enumerate(urls):
+        graph.add_links(url, [urls[target] for target in targets[i * links_per_page:(i + 1) * links_per_page]])
+    add_time = time.perf_counter() - start
+    for i in random.Random(seed).sample(range(num_pages), int(num_pages * relevant_share)):
+        graph.mark_relevant(urls[i])
+
+    start = time.perf_counter()
+    indptr, indices = graph.csr()
+    csr_time = time.perf_counter() - start
+    start = time.perf_counter()
+    graph.in_degree()
+    degree_time = time.perf_counter() - start
+    start = time.perf_counter()
+    graph.personalized_pagerank()
+    pagerank_time = time.perf_counter() - start
+
+    path = os.path.join(tempfile.mkdtemp(), "links")
+    start = time.perf_counter()
+    graph.save(path)
+    save_time = time.perf_counter() - start
+    start = time.perf_counter()
+    loaded = LinkGraph.load(path)
+    load_time = time.perf_counter() - start
+    assert np.array_equal(loaded.csr()[1], indices)
+    size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    shutil.rmtree(path)
+
+    print(f"{len(graph)} URLs, {len(indices):,} distinct links ({num_pages * links_per_page:,} recorded)")
+    print(f"Edge buffers {(len(graph._sources) + len(graph._targets)) * 4 / 2 ** 20:.1f} MiB, CSR {(indptr.nbytes + indices.nbytes) / 2 ** 20:.1f} MiB, "
+          f".npy files {size / 2 ** 20:.1f} MiB")
+    print(f"Recording links: {add_time:.2f}s, CSR build: {csr_time:.2f}s, in-degree: {degree_time * 1e3:.1f} ms, "
+          f"personalized PageRank: {pagerank_time:.2f}s, save: {save_time:.2f}s, load: {load_time:.2f}s")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Benchmark the CSR link graph.")
+    parser.add_argument("--pages", type=int, default=500_000)
+    parser.add_argument("--links", type=int, default=10)
+    args = parser.parse_args()
+    benchmark(args.pages, args.links)
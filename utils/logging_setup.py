@@ -0,0 +1,248 @@
+import os
+import copy
+import json
+import time
+import queue
+import atexit
+import logging
+import argparse
+import tempfile
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FILE = "search_log.log"
+
+# Fields passed with `extra=` that are written as top-level keys of the JSON record
+STRUCTURED_FIELDS = ("url", "level", "stage", "latency", "status_code", "backend", "worker_id")
+
+# Renders tracebacks in the calling thread, see DeferredQueueHandler
+_TRACEBACK_FORMATTER = logging.Formatter()
+
+_listener = None
+_listener_pid = None
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line.
+    The log level is written as "severity", so "level" stays free for the depth level of a URL.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "severity": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves the JSON formatting and the file write to the listener thread.
+
+    The arguments are merged into the message in the calling thread: they may be mutable objects (a dict of
+    results, a document) that change before the listener gets to the record. A traceback is rendered to text for
+    the same reason. The queue never leaves the process, so the record is not pickled.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _TRACEBACK_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(path=LOG_FILE, level=logging.INFO):
+    """
+    Configures the root logger to write JSON lines to `path` from a background thread.
+    Calling it again in the same process has no effect. A forked child process inherits the queue handler but not
+    the listener thread, so its records are lost unless it calls setup_logging itself (which starts a listener of
+    its own, appending to the same file) and stop_logging before it exits.
+
+    :param path: Log file
+    :param level: Minimum level of logged records
+    :return: The running QueueListener
+    """
+    global _listener, _listener_pid
+    with _lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            return _listener
+
+        file_handler = logging.FileHandler(path, mode='a', encoding='utf-8')
+        file_handler.setFormatter(JsonFormatter())
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, file_handler, respect_handler_level=False)
+
+        root = logging.getLogger()
+        root.handlers.clear()
+        root.addHandler(DeferredQueueHandler(log_queue))
+        root.setLevel(level)
+
+        listener.start()
+        _listener, _listener_pid = listener, os.getpid()
+        atexit.register(stop_logging)
+        return listener
+
+
+def stop_logging():
+    """Writes the queued records and stops the background thread."""
+    global _listener
+    with _lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        _listener = None
+
+
+def read_records(path=LOG_FILE, stage=None):
+    """
+    Reads structured records back for offline analysis. Lines in the old plain-text format are skipped.
+
+    :param path: Log file
+    :param stage: Only return records of this stage (e.g. "extraction", "classification")
+    :return: Generator of dictionaries
+    """
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and (stage is None or record.get("stage") == stage):
+                yield record
+
+
+def latency_summary(path=LOG_FILE):
+    """
+    :return: Dictionary stage -> {count, p50, p95, p99, max} of the logged latencies in seconds
+    """
+    latencies = {}
+    for record in read_records(path):
+        if record.get("stage") and record.get("latency") is not None:
+            latencies.setdefault(record["stage"], []).append(record["latency"])
+
+    def nearest_rank(ordered, p):
+        return ordered[max(0, -(-p * len(ordered) // 100) - 1)]
+
+    summary = {}
+    for stage, values in latencies.items():
+        values.sort()
+        summary[stage] = {
+            "count": len(values),
+            "p50": nearest_rank(values, 50),
+            "p95": nearest_rank(values, 95),
+            "p99": nearest_rank(values, 99),
+            "max": values[-1],
+        }
+    return summary
+
+
+class SlowFile:
+    """File wrapper that stalls on every write, like a busy disk or a network file system."""
+
+    def __init__(self, file, delay):
+        self.file = file
+        self.delay = delay
+
+    def write(self, text):
+        time.sleep(self.delay)
+        return self.file.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def benchmark(num_records=50_000, write_delay=0.0002):
+    """
+    Measures what a hot-path log call costs the calling thread:
+    the former synchronous FileHandler with f-strings against the queue setup with lazy %-formatting.
+    CPU time of the calling thread is measured with time.thread_time, so the listener thread is not counted.
+    A second round repeats both with a write stall of `write_delay` seconds and compares wall-clock time.
+
+    :param num_records: Number of log calls per variant
+    :param write_delay: Simulated stall per write in seconds
+    """
+    url = "https://www.example.com/articles/the-history-of-the-bow-and-arrow"
+    directory = tempfile.mkdtemp()
+    logger = logging.getLogger("benchmark")
+    root = logging.getLogger()
+
+    def synchronous(path, delay, count):
+        # Former setup: blocking write and eager formatting in the caller
+        handler = logging.FileHandler(path, mode='a', encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        if delay:
+            handler.stream = SlowFile(handler.stream, delay)
+        root.handlers[:] = [handler]
+        root.setLevel(logging.INFO)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        for i in range(count):
+            logger.info(f"[firecrawl] {url} took {i / 1000:.2f}s (status {200})")
+        result = (time.perf_counter() - wall) / count, (time.thread_time() - cpu) / count
+        root.handlers.clear()
+        handler.close()
+        return result
+
+    def queued(path, delay, count):
+        listener = setup_logging(path)
+        if delay:
+            listener.handlers[0].stream = SlowFile(listener.handlers[0].stream, delay)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        for i in range(count):
+            logger.info("[%s] %s took %.2fs (status %s)", "firecrawl", url, i / 1000, 200,
+                        extra={"url": url, "stage": "extraction", "latency": i / 1000, "status_code": 200})
+        result = (time.perf_counter() - wall) / count, (time.thread_time() - cpu) / count
+        stop_logging()
+        return result
+
+    sync_wall, sync_cpu = synchronous(os.path.join(directory, "sync.log"), 0, num_records)
+    queue_wall, queue_cpu = queued(os.path.join(directory, "queued.log"), 0, num_records)
+
+    # Records below the configured level are dropped before any formatting
+    root.setLevel(logging.INFO)
+    cpu = time.thread_time()
+    for i in range(num_records):
+        logger.debug("Chunk %s of %s", i, url)
+    disabled_cpu = (time.thread_time() - cpu) / num_records
+
+    # With a slow disk the synchronous caller waits for every write
+    stalled = max(1, min(num_records, int(1 / write_delay))) if write_delay else num_records
+    slow_sync_wall, _ = synchronous(os.path.join(directory, "sync_slow.log"), write_delay, stalled)
+    slow_queue_wall, _ = queued(os.path.join(directory, "queued_slow.log"), write_delay, stalled)
+
+    print(f"{num_records} log calls, caller thread CPU time per call:")
+    print(f"{'synchronous FileHandler, f-string':>40}: {sync_cpu * 1e6:7.2f} µs (wall {sync_wall * 1e6:7.2f} µs)")
+    print(f"{'QueueHandler, JSON on listener thread':>40}: {queue_cpu * 1e6:7.2f} µs (wall {queue_wall * 1e6:7.2f} µs)")
+    print(f"{'disabled level, lazy arguments':>40}: {disabled_cpu * 1e6:7.2f} µs")
+    print(f"{stalled} log calls with a {write_delay * 1e6:.0f} µs stall per write, caller wall time per call:")
+    print(f"{'synchronous FileHandler':>40}: {slow_sync_wall * 1e6:7.2f} µs")
+    print(f"{'QueueHandler':>40}: {slow_queue_wall * 1e6:7.2f} µs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark logging overhead or summarize logged latencies.")
+    parser.add_argument("command", choices=["benchmark", "latency"])
+    parser.add_argument("--records", type=int, default=50_000)
+    parser.add_argument("--log", default=LOG_FILE)
+    args = parser.parse_args()
+    if args.command == "benchmark":
+        benchmark(args.records)
+    else:
+        for stage, stats in latency_summary(args.log).items():
+            print(f"{stage:>15}: {stats['count']:6d} records, p50 {stats['p50']:.2f}s, p95 {stats['p95']:.2f}s, "
+                  f"p99 {stats['p99']:.2f}s, max {stats['max']:.2f}s")
@@ -1,15 +1,41 @@
 import re
+import os
+import glob
+import json
+import time
+import argparse
 from urllib.parse import urlparse, parse_qs
 import logging
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("search_log.log", mode='a', encoding='utf-8'), 
-    ]
+logger = logging.getLogger(__name__)
+
+# Patterns of normalize_markdown, compiled once
+# Link targets may contain one level of balanced parentheses, e.g. https://en.wikipedia.org/wiki/Bow_(weapon)
+LINK_TARGET = r"\([^()]*(?:\([^()]*\)[^()]*)*\)"
+IMAGE_PATTERN = re.compile(r"!\[([^\]]*)\]" + LINK_TARGET)
+LINK_PATTERN = re.compile(r"\[([^\]]*)\](?:" + LINK_TARGET + r"|\[[^\]]*\])")
+LINK_DEFINITION_PATTERN = re.compile(r"^\s*\[[^\]]+\]:\s*\S+")
+# A bare URL takes balanced parentheses along; trailing sentence punctuation is given back by url_host
+BARE_URL_PATTERN = re.compile(r"<?(https?://[^\s()<>\[\]]*(?:\([^\s()<>]*\)[^\s()<>\[\]]*)*)>?")
+URL_TRAILING_PUNCTUATION = ".,;:!?'\""
+TABLE_RULE_PATTERN = re.compile(r"^[\s|:\-]+$")
+WHITESPACE_PATTERN = re.compile(r"[ \t\u00a0]+")
+COOKIE_PATTERN = re.compile(r"\bcookies?\b.*\b(accept|consent|privacy|preferences)\b|\b(accept|consent|privacy|preferences)\b.*\bcookies?\b", re.IGNORECASE)
+# Button text or a consent link, checked on the raw lines of a block that mentions cookies; only blocks with one
+# of them count as cookie banners
+COOKIE_BANNER_PATTERN = re.compile(
+    r"\b(accept all|accept cookies|allow all|reject all|decline all|deny all|only necessary|necessary only|got it"
+    r"|manage (?:cookie )?(?:preferences|settings|options)|cookie settings|cookie preferences)\b"
+    r"|\]\([^)]*(?:cookie|consent|gdpr)[^)]*\)",
+    re.IGNORECASE,
 )
 
+# A block whose visible text is mostly anchor text of at least this many links is treated as navigation
+LINK_DENSE_MIN_LINKS = 3
+LINK_DENSE_RATIO = 0.6
+# Cookie banners are short; longer blocks mentioning cookies are kept
+COOKIE_BLOCK_MAX_CHARS = 600
+
 
 def filter_markdown_content(markdown):
     """
@@ -31,7 +57,7 @@ def filter_markdown_content(markdown):
         return markdown
 
     except Exception as e:
-        logging.error(f"Error during reference removal : {e}")
+        logger.error("Error during reference removal : %s", e)
         print(f"Error during reference removal: {e}")
         # ValueError(f"Error during reference removal: {e}")
         return None 
@@ -89,7 +115,197 @@ def filter_links(links):
         return cleaned_links
 
     except Exception as e:
-        logging.error(f"Error during links filtering: {e}")
+        logger.error("Error during links filtering: %s", e)
         print(f"Error during links filtering: {e}")
         #raise ValueError(f"Error during links filtering: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def normalize_markdown(markdown):
+    """
+    Produces compact classifier input from extracted markdown in a single pass over its lines.
+
+    :param markdown: Text in markdown format
+    :return: Normalized text
+    :note:
+    - Images are removed, links are replaced by their anchor text, bare URLs by their host and link definitions are dropped.
+    - Runs of whitespace are collapsed and table rules are dropped.
+    - Blocks (runs of non-empty lines) made up mostly of anchor text of three or more links are dropped.
+    - Short blocks about cookies are dropped only if they also hold banner button text or a consent link, so an article
+      paragraph about cookies and privacy is kept.
+    - A line that already appeared in the output is dropped.
+    - The result depends only on the input, so equal pages produce equal classifier input.
+    """
+    output = []
+    seen = set()
+    block, raw_block, block_links, block_link_chars, block_chars = [], [], 0, 0, 0
+
+    def flush():
+        # Decides about the finished block
+        if not block:
+            return
+        if block_links >= LINK_DENSE_MIN_LINKS and block_link_chars >= LINK_DENSE_RATIO * block_chars:
+            return
+        if block_chars <= COOKIE_BLOCK_MAX_CHARS and COOKIE_PATTERN.search(" ".join(block)) and COOKIE_BANNER_PATTERN.search("\n".join(raw_block)):
+            return
+        added = False
+        for line in block:
+            if line not in seen:
+                seen.add(line)
+                output.append(line)
+                added = True
+        if added:
+            output.append("")
+
+    for line in (markdown or "").split("\n"):
+        if LINK_DEFINITION_PATTERN.match(line) or ("-" in line and TABLE_RULE_PATTERN.match(line)):
+            continue
+        raw = line
+        line = IMAGE_PATTERN.sub("", line)
+        links = 0
+        link_chars = 0
+        if "[" in line:
+            anchors = LINK_PATTERN.findall(line)
+            links = len(anchors)
+            link_chars = sum(len(anchor.strip()) for anchor in anchors)
+            line = LINK_PATTERN.sub(r"\1", line)
+        if "http" in line:
+            line = BARE_URL_PATTERN.sub(url_host, line)
+        line = WHITESPACE_PATTERN.sub(" ", line).strip()
+        if line.strip("|*-# ") == "":
+            # Empty line, or a line left with markdown punctuation only
+            flush()
+            block, raw_block, block_links, block_link_chars, block_chars = [], [], 0, 0, 0
+            continue
+        block.append(line)
+        raw_block.append(raw)
+        block_links += links
+        block_link_chars += link_chars
+        block_chars += len(line.strip("|*-# "))
+    flush()
+    return "\n".join(output).strip()
+
+
+def url_host(match):
+    """
+    :param match: Match of BARE_URL_PATTERN
+    :return: Host of the URL without "www.", which keeps the sentence readable ("see example.com for details"),
+             followed by the sentence punctuation the URL ended with
+    """
+    url = match.group(1)
+    stripped = url.rstrip(URL_TRAILING_PUNCTUATION)
+    host = urlparse(stripped).hostname or ""
+    return (host[4:] if host.startswith("www.") else host) + url[len(stripped):]
+
+
+def count_tokens(text, encoding):
+    return len(encoding.encode(text)) if encoding else len(text) // 4 + 1
+
+
+def synthetic_page(i):
+    """
+    :return: Markdown resembling a scraped article with navigation, a cookie banner, images and repeated footer lines
+    """
+    navigation = "\n".join(f"* [Section {n}](https://www.example.com/section/{n}?ref=nav)" for n in range(25))
+    cookies = "We use cookies to improve your experience. By clicking Accept all you consent to our [privacy policy](https://www.example.com/privacy).\n[Accept all](#) [Preferences](#)"
+    body = "\n\n".join(
+        f"The history of archery in article {i}, part {p}, covers the [longbow](https://en.wikipedia.org/wiki/Longbow) "
+        f"and the [crossbow](https://en.wikipedia.org/wiki/Crossbow).   Hunting  practices changed over time.\n"
+        f"![Figure {p}](https://cdn.example.com/images/{i}/{p}.jpg)\n\nShare this article"
+        for p in range(40)
+    )
+    table = "| Era | Weapon |\n|---|---|\n" + "\n".join(f"| {1000 + e} | Bow type {e} |" for e in range(10))
+    return f"{navigation}\n\n{cookies}\n\n# Article {i}\n\n{body}\n\n{table}\n\n{navigation}"
+
+
+# (markdown, expected normalize_markdown output) for inputs that broke earlier versions of the patterns
+NORMALIZATION_CASES = [
+    ("[Bow](https://en.wikipedia.org/wiki/Bow_(weapon)) is a ranged weapon.", "Bow is a ranged weapon."),
+    ("![Longbow](https://upload.example.org/Longbow_(England).jpg) Drawn by hand.", "Drawn by hand."),
+    ('[History](https://example.com/a "Title (old)") of archery', "History of archery"),
+    ("Source: https://en.wikipedia.org/wiki/Bow_(weapon). Read on.", "Source: en.wikipedia.org. Read on."),
+    ("See <https://www.example.com/guide?page=2> and https://archery.org/rules, too.", "See example.com and archery.org, too."),
+    ("Browsers store cookies so that sites can remember privacy preferences; users must accept them first.",
+     "Browsers store cookies so that sites can remember privacy preferences; users must accept them first."),
+    ("We use cookies to improve your experience and for privacy settings.\n[Accept all](#) [Reject all](#)", ""),
+    ("This site uses cookies. Read our [cookie policy](https://example.com/cookie-policy) to accept or refuse them.", ""),
+    ("* [Home](/)\n* [Archery](/archery)\n* [Contact](/contact)\n\nBody text.", "Body text."),
+]
+
+
+def check_normalization():
+    """
+    Runs normalize_markdown over NORMALIZATION_CASES.
+
+    :return: List of (markdown, expected, actual) tuples that did not match
+    """
+    failures = []
+    for markdown, expected in NORMALIZATION_CASES:
+        actual = normalize_markdown(markdown)
+        if actual != expected:
+            failures.append((markdown, expected, actual))
+    return failures
+
+
+def benchmark(cache_dir=os.path.join("OUTPUT", "page_cache"), model="gpt-4o-mini"):
+    """
+    Reports the token reduction of normalize_markdown per page and its throughput.
+    Uses the recorded pages of the evaluation harness cache, or synthetic pages if the cache is empty.
+    Verdict agreement against unnormalized input is measured by the "normalized" configuration of the evaluation harness.
+
+    :param cache_dir: PageCache folder of the evaluation harness
+    :param model: Model whose tiktoken encoding counts the tokens
+    """
+    pages = []
+    for path in sorted(glob.glob(os.path.join(cache_dir, "*.json"))):
+        with open(path, encoding="utf-8") as file:
+            entry = json.load(file)
+        if entry.get("markdown"):
+            pages.append((entry.get("url", path), entry["markdown"]))
+    if not pages:
+        pages = [(f"synthetic page {i}", synthetic_page(i)) for i in range(50)]
+
+    try:
+        import tiktoken
+        encoding = tiktoken.encoding_for_model(model)
+    except Exception as e:
+        print(f"tiktoken encoding not available ({e.__class__.__name__}), counting 4 characters per token")
+        encoding = None
+
+    reductions = []
+    tokens_before = tokens_after = 0
+    seconds = 0.0
+    for _, markdown in pages:
+        filtered = filter_markdown_content(markdown)
+        start = time.perf_counter()
+        normalized = normalize_markdown(filtered)
+        seconds += time.perf_counter() - start
+        before, after = count_tokens(filtered, encoding), count_tokens(normalized, encoding)
+        tokens_before += before
+        tokens_after += after
+        reductions.append(1 - after / before if before else 0.0)
+
+    reductions.sort()
+    size = sum(len(markdown) for _, markdown in pages)
+    print(f"{len(pages)} pages, {tokens_before:,} tokens before and {tokens_after:,} after normalization "
+          f"({1 - tokens_after / tokens_before:.1%} fewer)")
+    print(f"Reduction per page: min {reductions[0]:.1%}, median {reductions[len(reductions) // 2]:.1%}, max {reductions[-1]:.1%}")
+    print(f"Normalization: {seconds / len(pages) * 1e3:.2f} ms per page, {size / 2 ** 20 / seconds:.1f} MiB/s")
+
+
+if __name__ == "__main__":
+    from utils.logging_setup import setup_logging
+
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Measure the token reduction of markdown normalization.")
+    parser.add_argument("--cache", default=os.path.join("OUTPUT", "page_cache"))
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--check", action="store_true", help="Only check normalize_markdown on the known edge cases")
+    args = parser.parse_args()
+    if args.check:
+        failures = check_normalization()
+        for markdown, expected, actual in failures:
+            print(f"FAILED {markdown!r}\n  expected {expected!r}\n  got      {actual!r}")
+        print(f"{len(NORMALIZATION_CASES) - len(failures)} of {len(NORMALIZATION_CASES)} normalization cases passed")
+    else:
+        benchmark(args.cache, args.model)
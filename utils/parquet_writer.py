@@ -0,0 +1,190 @@
+import os
+import glob
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from utils.logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# One row per processed URL; the schema is the same for every run, so many runs can be scanned as one dataset
+RESULTS_SCHEMA = pa.schema([
+    ("run", pa.string()),
+    ("url", pa.string()),
+    ("level", pa.int16()),
+    ("classification", pa.string()),
+    ("explanation", pa.string()),
+    ("summary", pa.string()),
+    ("extraction_time", pa.float64()),
+    ("classification_time", pa.float64()),
+    ("verdict_time", pa.float64()),
+    ("status_code", pa.int16()),
+    ("content_hash", pa.string()),
+])
+
+
+class ParquetWriter:
+    """
+    Streams the per-URL records of one run to OUTPUT/results_<filename_search_query>.parquet.
+
+    Records are buffered column by column and written as a row group every `row_group_size` records, so memory stays
+    bounded during long runs. The file is written under a temporary name and renamed on close, because a Parquet file
+    is only readable once its footer is written.
+    """
+
+    def __init__(self, filename_search_query, output_folder="OUTPUT", row_group_size=10_000):
+        """
+        :param filename_search_query: The file name derived from the search query; also stored in the "run" column
+        :param output_folder: Folder of the Parquet files
+        :param row_group_size: Number of records per row group
+        """
+        os.makedirs(output_folder, exist_ok=True)
+        self.run = filename_search_query
+        self.path = os.path.join(output_folder, f"results_{filename_search_query}.parquet")
+        self.row_group_size = row_group_size
+        self.records = 0
+        self._lock = threading.Lock()
+        self._columns = {field.name: [] for field in RESULTS_SCHEMA}
+        self._writer = pq.ParquetWriter(self.path + ".partial", RESULTS_SCHEMA, compression="zstd")
+
+    def add_record(self, record):
+        """
+        Adds the record of one URL. Thread-safe; fields missing from the record are written as null.
+
+        :param record: Dictionary with (a subset of) the RESULTS_SCHEMA fields
+        """
+        with self._lock:
+            for name, values in self._columns.items():
+                values.append(self.run if name == "run" else record.get(name))
+            self.records += 1
+            if len(self._columns["url"]) >= self.row_group_size:
+                self._flush()
+
+    def _flush(self):
+        # Called with the lock held
+        if not self._columns["url"]:
+            return
+        self._writer.write_batch(pa.record_batch(list(self._columns.values()), schema=RESULTS_SCHEMA))
+        for values in self._columns.values():
+            values.clear()
+
+    def close(self):
+        """Writes the remaining records and moves the finished file into place."""
+        with self._lock:
+            if self._writer is None:
+                return
+            try:
+                self._flush()
+                self._writer.close()
+                os.replace(self.path + ".partial", self.path)
+                logger.info("Results saved to: %s (%s records)", self.path, self.records)
+            except Exception as e:
+                logger.error("Error saving results to Parquet: %s", e)
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def scan_runs(output_folder="OUTPUT", runs=None, columns=None, filter=None):
+    """
+    Loads the records of many runs at once as a single Arrow table.
+
+        table = scan_runs(columns=["run", "url", "classification"], filter=ds.field("classification") == "Relevant")
+        data_frame = table.to_pandas()
+
+    :param output_folder: Folder of the Parquet files
+    :param runs: List of filename_search_query values to load, or None for all runs in the folder
+    :param columns: List of columns to read, or None for all; unread columns are never decoded
+    :param filter: Optional pyarrow.dataset expression, pushed down to skip row groups
+    :return: pyarrow.Table with the RESULTS_SCHEMA columns
+    """
+    if runs is None:
+        paths = sorted(glob.glob(os.path.join(output_folder, "results_*.parquet")))
+    else:
+        paths = [os.path.join(output_folder, f"results_{run}.parquet") for run in runs]
+    if not paths:
+        return RESULTS_SCHEMA.empty_table().select(columns or RESULTS_SCHEMA.names)
+    dataset = ds.dataset(paths, schema=RESULTS_SCHEMA, format="parquet")
+    return dataset.to_table(columns=columns, filter=filter)
+
+
+def synthetic_record(rng, i):
+    classification = rng.choice(("Relevant", "Irrelevant", "Irrelevant", "ERROR"))
+    return {
+        "url": f"https://www.example-{i % 997}.com/articles/{i}",
+        "level": rng.randint(0, 3),
+        "classification": classification,
+        "explanation": f"The document {i} discusses the topic of the query only in passing and focuses on other subjects.",
+        "summary": f"Article {i} about renewable energy, storage costs and grid integration in several European countries.",
+        "extraction_time": rng.uniform(0.5, 8),
+        "classification_time": rng.uniform(0.5, 4),
+        "verdict_time": rng.uniform(0.2, 2),
+        "status_code": 200,
+        "content_hash": f"{rng.getrandbits(256):064x}",
+    }
+
+
+def benchmark(num_records=1_000_000, num_runs=100, seed=7):
+    """
+    Compares loading the records of many runs from Parquet with loading the same records from the overview json files.
+
+    :param num_records: Total number of records
+    :param num_runs: Number of runs the records are spread over
+    """
+    rng = random.Random(seed)
+    directory = tempfile.mkdtemp()
+    per_run = num_records // num_runs
+    overview_fields = ("level", "classification", "explanation", "summary")
+
+    for run in range(num_runs):
+        records = [synthetic_record(rng, run * per_run + i) for i in range(per_run)]
+        with ParquetWriter(f"run_{run}", output_folder=directory) as writer:
+            for record in records:
+                writer.add_record(record)
+        with open(os.path.join(directory, f"overview_run_{run}.json"), "w", encoding="utf-8") as file:
+            json.dump({record["url"]: {field: record[field] for field in overview_fields} for record in records}, file, indent=4)
+
+    parquet_size = sum(os.path.getsize(path) for path in glob.glob(os.path.join(directory, "*.parquet")))
+    json_size = sum(os.path.getsize(path) for path in glob.glob(os.path.join(directory, "*.json")))
+
+    start = time.perf_counter()
+    table = scan_runs(directory)
+    parquet_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    relevant = scan_runs(directory, columns=["run", "url"], filter=ds.field("classification") == "Relevant")
+    projected_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rows = []
+    for path in sorted(glob.glob(os.path.join(directory, "overview_*.json"))):
+        with open(path, encoding="utf-8") as file:
+            rows.extend(json.load(file).items())
+    json_time = time.perf_counter() - start
+
+    print(f"{table.num_rows} records in {num_runs} runs")
+    print(f"{'overview json':>28}: {json_time:6.2f}s, {json_size / 2 ** 20:7.1f} MiB on disk")
+    print(f"{'parquet, all columns':>28}: {parquet_time:6.2f}s, {parquet_size / 2 ** 20:7.1f} MiB on disk")
+    print(f"{'parquet, Relevant run/url':>28}: {projected_time:6.2f}s ({relevant.num_rows} rows)")
+
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Benchmark loading crawl results from Parquet against the overview json files.")
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--runs", type=int, default=100)
+    args = parser.parse_args()
+    benchmark(args.records, args.runs)
@@ -0,0 +1,308 @@
+import os
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import argparse
+import threading
+import tracemalloc
+import contextlib
+from collections import Counter
+
+from utils.logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.path.join("OUTPUT", "profile")
+# Pipeline stages, in the order of the summary
+STAGES = ("search", "extract", "filter", "chunk", "cpu_wait", "classify", "db_write", "excel_write", "json_write")
+
+_active = None
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+def stage(name):
+    """
+    Context manager around one pipeline stage. Without an enabled StageProfiler it returns a shared nullcontext,
+    so an instrumented stage costs one global lookup and an empty with-block.
+
+    :param name: Stage name, one of STAGES
+    """
+    return _NULL_CONTEXT if _active is None else _active.stage(name)
+
+
+def record(name, seconds):
+    """
+    Adds a stage duration measured outside the profiled threads, e.g. in a CpuStage worker process, to the active
+    StageProfiler. Only calls and seconds are counted; such a stage has no cProfile or stack samples of its own.
+
+    :param name: Stage name, one of STAGES
+    :param seconds: Duration of the stage
+    """
+    if _active is not None:
+        _active.record(name, seconds)
+
+
+def enable(profiler):
+    """
+    Makes a StageProfiler collect all instrumented stages of the process.
+    """
+    global _active
+    _active = profiler
+    profiler.start()
+
+
+def disable():
+    """
+    Stops the active StageProfiler and writes its reports.
+
+    :return: Dictionary stage -> summary (see StageProfiler.save), or None if no profiler was enabled
+    """
+    global _active
+    profiler, _active = _active, None
+    if profiler is None:
+        return None
+    profiler.stop()
+    return profiler.save()
+
+
+class StageProfiler:
+    """
+    Per-stage cProfile, tracemalloc and stack sampling of a run.
+
+    - cProfile: one Profile per stage and thread; the Profile of an enclosing stage is paused while a nested stage
+      (e.g. filter inside extract) runs, so every function call is counted in the innermost stage only.
+    - tracemalloc (optional): snapshot difference around the first `memory_calls` calls of every stage, aggregated
+      by source line. tracemalloc is process-wide, so allocations of other threads running at the same time are
+      included; run with concurrency 1 for exact attribution.
+    - Stack sampling: a thread samples the stacks of all threads inside a stage every `interval` seconds and counts
+      them in collapsed form (`stage;module:function;...`), the input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, output_dir=PROFILE_DIR, memory=False, memory_calls=20, memory_frames=8, interval=0.005, top=30):
+        """
+        :param output_dir: Folder of the reports
+        :param memory: If True, allocations are traced with tracemalloc (slows Python allocations down noticeably)
+        :param memory_calls: Number of calls per stage whose allocations are recorded
+        :param memory_frames: Number of frames stored per allocation
+        :param interval: Seconds between two stack samples
+        :param top: Number of functions and allocation sites listed per stage
+        """
+        self.output_dir = output_dir
+        self.memory = memory
+        self.memory_calls = memory_calls
+        self.memory_frames = memory_frames
+        self.interval = interval
+        self.top = top
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiles = {}
+        self._stacks = {}
+        self._samples = Counter()
+        self._allocations = {}
+        self._memory_counts = Counter()
+        self.calls = Counter()
+        self.seconds = Counter()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(self.memory_frames)
+        self._sampler = threading.Thread(target=self._sample, name="stage-sampler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+            with self._lock:
+                self._stacks[threading.get_ident()] = stack
+        outer = stack[-1] if stack else None
+        if outer is not None:
+            outer.disable()
+        profile = self._profile(name)
+        snapshot = self._memory_snapshot(name)
+        stack.append(profile)
+        start = time.perf_counter()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active in this thread (e.g. the run itself is under cProfile)
+            pass
+        try:
+            yield
+        finally:
+            profile.disable()
+            seconds = time.perf_counter() - start
+            stack.pop()
+            if snapshot is not None:
+                self._record_allocations(name, snapshot)
+            with self._lock:
+                self.calls[name] += 1
+                self.seconds[name] += seconds
+            if outer is not None:
+                outer.enable()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.calls[name] += 1
+            self.seconds[name] += seconds
+
+    def _profile(self, name):
+        # One Profile per stage and thread, merged in save()
+        key = (name, threading.get_ident())
+        with self._lock:
+            profile = self._profiles.get(key)
+            if profile is None:
+                profile = self._profiles[key] = cProfile.Profile()
+                # The sampler finds the stage of a thread through its Profile
+                profile.stage_name = name
+            return profile
+
+    def _memory_snapshot(self, name):
+        if not self.memory or not tracemalloc.is_tracing():
+            return None
+        with self._lock:
+            if self._memory_counts[name] >= self.memory_calls:
+                return None
+            self._memory_counts[name] += 1
+        return tracemalloc.take_snapshot()
+
+    def _record_allocations(self, name, before):
+        after = tracemalloc.take_snapshot()
+        with self._lock:
+            sizes = self._allocations.setdefault(name, Counter())
+            for difference in after.compare_to(before, "lineno"):
+                if difference.size_diff > 0:
+                    frame = difference.traceback[0]
+                    sizes[f"{frame.filename}:{frame.lineno}"] += difference.size_diff
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                stacks = {thread_id: [profile.stage_name for profile in stack] for thread_id, stack in self._stacks.items() if stack}
+            if not stacks:
+                continue
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or thread_id not in stacks:
+                    continue
+                functions = []
+                while frame is not None:
+                    code = frame.f_code
+                    functions.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                functions.reverse()
+                self._samples[";".join([stacks[thread_id][-1], *functions])] += 1
+
+    def save(self):
+        """
+        Writes, per stage that ran: <stage>.pstats (load with pstats or snakeviz), <stage>.txt (top functions by
+        cumulative time) and, with memory tracing, <stage>_allocations.txt. All stages share stacks.collapsed.
+
+        :return: Dictionary stage -> dictionary with calls, seconds and the written files
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        summary = {}
+        with self._lock:
+            profiles = dict(self._profiles)
+            samples = Counter(self._samples)
+            allocations = {name: Counter(sizes) for name, sizes in self._allocations.items()}
+        for name in sorted(self.calls, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES)):
+            files = []
+            stats = None
+            for (profile_stage, _), profile in profiles.items():
+                if profile_stage != name:
+                    continue
+                try:
+                    if stats is None:
+                        stats = pstats.Stats(profile)
+                    else:
+                        stats.add(profile)
+                except TypeError:
+                    # Profile without any recorded call
+                    continue
+            if stats is not None:
+                path = os.path.join(self.output_dir, f"{name}.pstats")
+                stats.dump_stats(path)
+                files.append(path)
+                path = os.path.join(self.output_dir, f"{name}.txt")
+                with open(path, "w", encoding="utf-8") as file:
+                    pstats.Stats(os.path.join(self.output_dir, f"{name}.pstats"), stream=file).sort_stats("cumulative").print_stats(self.top)
+                files.append(path)
+            if name in allocations:
+                path = os.path.join(self.output_dir, f"{name}_allocations.txt")
+                with open(path, "w", encoding="utf-8") as file:
+                    file.write(f"Allocations during the first {self._memory_counts[name]} calls of {name}, by source line\n")
+                    for location, size in allocations[name].most_common(self.top):
+                        file.write(f"{size / 1024:>12.1f} KiB  {location}\n")
+                files.append(path)
+            summary[name] = {"calls": self.calls[name], "seconds": self.seconds[name], "files": files}
+
+        path = os.path.join(self.output_dir, "stacks.collapsed")
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in samples.most_common():
+                file.write(f"{stack} {count}\n")
+        logger.info("Profile written to %s (%s stages, %s stack samples)", self.output_dir, len(summary), sum(samples.values()))
+        return summary
+
+
+def overhead(iterations=1_000_000):
+    """
+    Measures the cost of an instrumented stage while profiling is off.
+
+    :param iterations: Number of timed stage entries
+    :return: Nanoseconds per stage entry
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with stage("filter"):
+            pass
+    instrumented = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(iterations):
+        pass
+    empty = time.perf_counter() - start
+    return (instrumented - empty) / iterations * 1e9
+
+
+def demo(output_dir, memory=True):
+    """
+    Profiles a small synthetic pipeline with nested stages and writes the reports to `output_dir`.
+    """
+    import json
+    from utils.output_filter import filter_markdown_content, filter_links
+
+    enable(StageProfiler(output_dir, memory=memory))
+    markdown = "\n".join(f"Paragraph {i} with a [link](https://example.com/{i}) and some text." for i in range(2000))
+    links = [f"https://example.com/{i}" for i in range(500)]
+    for _ in range(20):
+        with stage("extract"):
+            time.sleep(0.01)
+            with stage("filter"):
+                filter_markdown_content(markdown)
+                filter_links(links)
+        with stage("json_write"):
+            json.dumps({"markdown": markdown, "links": links})
+    return disable()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Check the stage profiler: overhead when off and reports of a synthetic run.")
+    parser.add_argument("--output-dir", default=os.path.join(PROFILE_DIR, "demo"))
+    parser.add_argument("--no-memory", action="store_true")
+    args = parser.parse_args()
+    print(f"Instrumented stage with profiling off: {overhead():.0f} ns per call")
+    for name, report in demo(args.output_dir, memory=not args.no_memory).items():
+        print(f"{name:<12} {report['calls']:>4} calls {report['seconds']:>8.3f}s  {', '.join(report['files'])}")